@@ -4,8 +4,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from app.utils.db_routing import RoutingSession, pool_options
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 
@@ -34,10 +35,108 @@ def create_app():
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Connection pools are per worker process, so size them from the gunicorn
+    # worker and thread counts the app is started with
+    pool_settings = {
+        'workers': int(os.environ.get('GUNICORN_WORKERS', os.environ.get('WEB_CONCURRENCY', 2))),
+        'threads': int(os.environ.get('GUNICORN_THREADS', 2)),
+        'max_connections': int(os.environ.get('DB_MAX_CONNECTIONS', 0)) or None,
+        'recycle': int(os.environ.get('DB_POOL_RECYCLE', 280)),
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+    engine_options = pool_options(app.config['SQLALCHEMY_DATABASE_URI'], **pool_settings)
+    if engine_options and os.environ.get('DB_POOL_SIZE'):
+        engine_options['pool_size'] = int(os.environ['DB_POOL_SIZE'])
+    if engine_options and os.environ.get('DB_MAX_OVERFLOW'):
+        engine_options['max_overflow'] = int(os.environ['DB_MAX_OVERFLOW'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    
+    # Optional read replica for redirect lookups and analytics
+    app.config['DB_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    if app.config['DB_REPLICA_URL']:
+        app.config['DB_REPLICA_ENGINE_OPTIONS'] = pool_options(app.config['DB_REPLICA_URL'], **pool_settings)
+    app.config['DB_REPLICA_CHECK_INTERVAL'] = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5.0))
+    app.config['DB_REPLICA_RETRY_INTERVAL'] = float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', 30.0))
+    
+    # ASGI server (asgi.py) threads for redirect lookups and for the Flask app;
+    # with the visit flusher they fit in the pool sized for gunicorn's threads
+    app.config['ASGI_DB_THREADS'] = int(os.environ.get('ASGI_DB_THREADS', pool_settings['threads']))
+    app.config['ASGI_WSGI_THREADS'] = int(os.environ.get('ASGI_WSGI_THREADS', pool_settings['threads']))
+    
+    # Redirect lookup cache configuration
+    app.config['LINK_CACHE_SIZE'] = int(os.environ.get('LINK_CACHE_SIZE', 10000))
+    app.config['LINK_CACHE_TTL'] = int(os.environ.get('LINK_CACHE_TTL', 60))
+    # Optional cache shared by all workers: redis://..., shm:///dev/shm/getshort-links or memory://
+    app.config['LINK_CACHE_SHARED_URL'] = os.environ.get('LINK_CACHE_SHARED_URL')
+    app.config['LINK_CACHE_SHARED_TTL'] = int(os.environ.get('LINK_CACHE_SHARED_TTL', 300))
+    app.config['LINK_CACHE_SYNC_INTERVAL'] = float(os.environ.get('LINK_CACHE_SYNC_INTERVAL', 1.0))
+    
+    # Logged-in user cache configuration
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+    
+    # Write-behind visit buffer configuration
+    app.config['VISIT_BUFFER_ENABLED'] = os.environ.get('VISIT_BUFFER_ENABLED', 'true').lower() == 'true'
+    app.config['VISIT_BUFFER_SIZE'] = int(os.environ.get('VISIT_BUFFER_SIZE', 10000))
+    app.config['VISIT_BUFFER_BATCH_SIZE'] = int(os.environ.get('VISIT_BUFFER_BATCH_SIZE', 500))
+    app.config['VISIT_BUFFER_FLUSH_INTERVAL'] = float(os.environ.get('VISIT_BUFFER_FLUSH_INTERVAL', 1.0))
+    
+    # Visitor tracking configuration
+    app.config['GEOIP_DB_PATH'] = os.environ.get('GEOIP_DB_PATH', 'GeoLite2-City.mmdb')
+    app.config['GEOIP_CACHE_SIZE'] = int(os.environ.get('GEOIP_CACHE_SIZE', 10000))
+    app.config['GEOIP_CACHE_IPV4_PREFIX'] = int(os.environ.get('GEOIP_CACHE_IPV4_PREFIX', 24))
+    app.config['GEOIP_CACHE_IPV6_PREFIX'] = int(os.environ.get('GEOIP_CACHE_IPV6_PREFIX', 48))
+    app.config['USER_AGENT_CACHE_SIZE'] = int(os.environ.get('USER_AGENT_CACHE_SIZE', 5000))
+    
+    # Heavy-hitters sketch of redirected short codes
+    app.config['TOP_CODES_CAPACITY'] = int(os.environ.get('TOP_CODES_CAPACITY', 1000))
+    app.config['TOP_CODES_EXPORTED'] = int(os.environ.get('TOP_CODES_EXPORTED', 20))
+    
+    # Short code allocation
+    app.config['SHORT_CODE_LENGTH'] = int(os.environ.get('SHORT_CODE_LENGTH', 6))
+    app.config['SHORT_CODE_BLOCK_SIZE'] = int(os.environ.get('SHORT_CODE_BLOCK_SIZE', 100))
+    # Keys the scrambling of sequence numbers into codes; defaults to SECRET_KEY
+    app.config['SHORT_CODE_SECRET'] = os.environ.get('SHORT_CODE_SECRET') or app.config['SECRET_KEY']
+    
+    # Bulk link creation limits
+    app.config['BULK_CREATE_MAX_ITEMS'] = int(os.environ.get('BULK_CREATE_MAX_ITEMS', 50000))
+    app.config['BULK_CREATE_CHUNK_SIZE'] = int(os.environ.get('BULK_CREATE_CHUNK_SIZE', 1000))
+    app.config['TRANSFER_BATCH_SIZE'] = int(os.environ.get('TRANSFER_BATCH_SIZE', 1000))
+    
+    # Link listing page sizes
+    app.config['LINKS_PAGE_SIZE'] = int(os.environ.get('LINKS_PAGE_SIZE', 50))
+    app.config['LINKS_MAX_PAGE_SIZE'] = int(os.environ.get('LINKS_MAX_PAGE_SIZE', 500))
+    app.config['VISITS_PAGE_SIZE'] = int(os.environ.get('VISITS_PAGE_SIZE', 100))
+    app.config['VISITS_MAX_PAGE_SIZE'] = int(os.environ.get('VISITS_MAX_PAGE_SIZE', 1000))
+    app.config['TIMESERIES_MAX_POINTS'] = int(os.environ.get('TIMESERIES_MAX_POINTS', 5000))
+    app.config['UNIQUE_VISITORS_DAYS'] = int(os.environ.get('UNIQUE_VISITORS_DAYS', 30))
+    
+    # Compiled domain modifier index
+    app.config['MODIFIER_INDEX_SIZE'] = int(os.environ.get('MODIFIER_INDEX_SIZE', 10000))
+    app.config['MODIFIER_INDEX_CHECK_INTERVAL'] = float(os.environ.get('MODIFIER_INDEX_CHECK_INTERVAL', 5.0))
+    
+    # Cold storage for old visits
+    app.config['VISIT_RETENTION_DAYS'] = int(os.environ.get('VISIT_RETENTION_DAYS', 365))
+    app.config['VISIT_ARCHIVE_DIR'] = os.environ.get('VISIT_ARCHIVE_DIR', os.path.join(app.instance_path, 'visit-archive'))
+    
+    # Negative-lookup filter for unknown short codes
+    app.config['SHORT_CODE_FILTER_ENABLED'] = os.environ.get('SHORT_CODE_FILTER_ENABLED', 'true').lower() == 'true'
+    app.config['SHORT_CODE_FILTER_CAPACITY'] = int(os.environ.get('SHORT_CODE_FILTER_CAPACITY', 1000000))
+    app.config['SHORT_CODE_FILTER_ERROR_RATE'] = float(os.environ.get('SHORT_CODE_FILTER_ERROR_RATE', 0.01))
+    app.config['SHORT_CODE_FILTER_SYNC_INTERVAL'] = float(os.environ.get('SHORT_CODE_FILTER_SYNC_INTERVAL', 1.0))
+    app.config['SHORT_CODE_FILTER_REBUILD_INTERVAL'] = float(os.environ.get('SHORT_CODE_FILTER_REBUILD_INTERVAL', 600))
+    
+    # Serve redirects from WSGI middleware in front of Flask's request handling
+    app.config['REDIRECT_FAST_PATH'] = os.environ.get('REDIRECT_FAST_PATH', 'true').lower() == 'true'
+    
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     
+    from app.utils.db_routing import replica_router
+    replica_router.init_app(app, db)
+    
     # Initialize login manager
     login_manager.init_app(app)
     login_manager.login_view = 'auth.github_login'  # We use GitHub OAuth for login
@@ -57,13 +156,50 @@ def create_app():
     from app.utils.monitoring import init_health_check
     init_health_check(app, db)
     
+    # Initialize the short code allocator
+    from app.utils.code_allocator import code_allocator
+    code_allocator.init_app(app)
+    
+    # Initialize the redirect lookup cache
+    from app.utils.link_cache import init_link_cache
+    init_link_cache(app)
+    
+    # Initialize the logged-in user cache
+    from app.utils.user_cache import init_user_cache
+    init_user_cache(app)
+    
+    # Initialize the per-owner compiled domain modifier index
+    from app.utils.modifier_index import modifier_index
+    modifier_index.init_app(app)
+    
+    # Initialize the write-behind visit buffer
+    from app.utils.visit_buffer import visit_buffer
+    visit_buffer.init_app(app)
+    
+    # Initialize visitor tracking caches
+    from app.utils.visitor_tracking import init_visitor_tracking
+    init_visitor_tracking(app)
+    
     # Create database tables if they don't exist
     with app.app_context():
         db.create_all()
     
+    # Build the short code filter once the tables exist
+    from app.utils.short_code_filter import short_code_filter
+    short_code_filter.init_app(app)
+    
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Add custom Jinja filters
     @app.template_filter('fromjson')
     def fromjson_filter(value):
         return json.loads(value)
     
+    # Answer redirects before sessions, the user loader and request hooks run
+    if app.config['REDIRECT_FAST_PATH']:
+        from app.utils.fast_redirect import RedirectFastPath
+        app.wsgi_app = RedirectFastPath(app, app.wsgi_app)
+    
     return app
\ No newline at end of file
@@ -0,0 +1,271 @@
+import json
+from datetime import datetime, timedelta, UTC
+import click
+from sqlalchemy import func
+from app import db
+from app.models import ShortURL, Visit, VisitRollup, ClickBucket, VisitorSketch, DomainModifier
+from app.models.visit_rollup import ROLLUP_DIMENSIONS
+from app.utils.link_cache import invalidate_links
+from app.utils.visit_aggregates import apply_visit_rollups, rollups_match, rebuild_rollups
+from app.utils.crosstab import (
+    CROSSTAB_DIMENSIONS, CrossTab, iter_database_chunks, iter_archive_chunks, write_crosstab_csv, write_crosstab_json
+)
+from app.utils.visit_archive import (
+    ARCHIVE_COLUMNS, archive_path, write_archive, iter_archived_visits, month_start, next_month
+)
+
+def register_commands(app):
+    """Register maintenance commands with the Flask CLI"""
+    
+    @app.cli.command('refresh-redirect-urls')
+    @click.option('--batch-size', default=10000, help='Links to refresh per transaction')
+    def refresh_redirect_urls(batch_size):
+        """Recompute the materialized redirect URL of every link"""
+        last_id = 0
+        total = 0
+        changed = 0
+        while True:
+            links = db.session.execute(
+                db.select(
+                    ShortURL.id, ShortURL.short_code, ShortURL.user_id, ShortURL.target_url,
+                    ShortURL.target_host, ShortURL.apply_modifiers, ShortURL.redirect_url
+                )
+                .where(ShortURL.id > last_id)
+                .order_by(ShortURL.id)
+                .limit(batch_size)
+            ).all()
+            if not links:
+                break
+            
+            last_id = links[-1].id
+            total += len(links)
+            # Compile each owner's modifiers once per batch
+            matchers = {}
+            updates = []
+            changed_codes = []
+            for link in links:
+                target_host = ShortURL.host_of(link.target_url)
+                redirect_url = link.target_url
+                if link.apply_modifiers:
+                    if link.user_id not in matchers:
+                        matchers[link.user_id] = DomainModifier.get_matcher(link.user_id)
+                    redirect_url = DomainModifier.apply_modifiers(link.target_url, modifiers=matchers[link.user_id])
+                if (target_host, redirect_url) != (link.target_host, link.redirect_url):
+                    updates.append({'id': link.id, 'target_host': target_host, 'redirect_url': redirect_url})
+                    changed_codes.append(link.short_code)
+            
+            if updates:
+                db.session.execute(db.update(ShortURL), updates)
+            db.session.commit()
+            invalidate_links(changed_codes)
+            changed += len(updates)
+        
+        click.echo(f'Refreshed redirect URLs for {total} links, {changed} changed')
+    
+    @app.cli.command('reconcile-visit-counts')
+    @click.option('--batch-size', default=10000, help='Links to check per query')
+    def reconcile_visit_counts(batch_size):
+        """Repair drift between stored visit counters and the visit table plus archived visits"""
+        last_id = 0
+        checked = 0
+        repaired = 0
+        while True:
+            rows = db.session.execute(
+                db.select(ShortURL.id, ShortURL.visit_count, ShortURL.archived_visit_count)
+                .where(ShortURL.id > last_id)
+                .order_by(ShortURL.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            # Count only this batch's visits rather than grouping the whole table
+            first_id, last_id = rows[0][0], rows[-1][0]
+            visit_counts = dict(db.session.execute(
+                db.select(Visit.short_url_id, func.count())
+                .where(Visit.short_url_id.between(first_id, last_id))
+                .group_by(Visit.short_url_id)
+            ).all())
+            checked += len(rows)
+            drifted = [
+                url_id for url_id, stored, archived in rows
+                if stored != visit_counts.get(url_id, 0) + archived
+            ]
+            if drifted:
+                # Recount in the UPDATE itself so visits ingested meanwhile aren't lost
+                recount = (
+                    db.select(func.count())
+                    .select_from(Visit)
+                    .where(Visit.short_url_id == ShortURL.id)
+                    .scalar_subquery()
+                )
+                db.session.execute(
+                    db.update(ShortURL)
+                    .where(ShortURL.id.in_(drifted))
+                    .values(visit_count=recount + ShortURL.archived_visit_count)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                repaired += len(drifted)
+        
+        click.echo(f'Checked {checked} links, repaired {repaired} visit counters')
+    
+    @app.cli.command('backfill-visit-rollups')
+    @click.option('--batch-size', default=10000, help='Visits to roll up per transaction')
+    def backfill_visit_rollups(batch_size):
+        """Rebuild the analytics rollups, click time buckets and visitor sketches from the visit table and archives"""
+        # Visits ingested after the watermark are rolled up live, so only the
+        # visits up to it are recounted. Run while ingestion is quiet for exact
+        # counts on databases that allow concurrent writers.
+        db.session.execute(db.delete(VisitRollup))
+        db.session.execute(db.delete(ClickBucket))
+        db.session.execute(db.delete(VisitorSketch))
+        watermark = db.session.scalar(db.select(func.max(Visit.id))) or 0
+        db.session.commit()
+        
+        columns = [Visit.id, Visit.short_url_id, Visit.timestamp, Visit.ip_address, Visit.user_agent]
+        columns += [getattr(Visit, column) for column in ROLLUP_DIMENSIONS.values()]
+        
+        last_id = 0
+        total = 0
+        while last_id < watermark:
+            rows = db.session.execute(
+                db.select(*columns)
+                .where(Visit.id > last_id, Visit.id <= watermark)
+                .order_by(Visit.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            last_id = rows[-1].id
+            apply_visit_rollups([row._asdict() for row in rows if row.timestamp is not None])
+            db.session.commit()
+            total += len(rows)
+        
+        # Visits moved to cold storage still count towards the aggregates
+        batch = []
+        for row in iter_archived_visits(app.config['VISIT_ARCHIVE_DIR']):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                apply_visit_rollups(batch)
+                db.session.commit()
+                total += len(batch)
+                batch = []
+        if batch:
+            apply_visit_rollups(batch)
+            db.session.commit()
+            total += len(batch)
+        
+        click.echo(f'Rolled up {total} visits')
+    
+    @app.cli.command('archive-visits')
+    @click.option('--older-than-days', type=int, default=None, help='Archive visits older than this (default: VISIT_RETENTION_DAYS)')
+    @click.option('--archive-dir', default=None, help='Directory to write archives to (default: VISIT_ARCHIVE_DIR)')
+    def archive_visits(older_than_days, archive_dir):
+        """Move old visits into compressed monthly archive files per link"""
+        if older_than_days is None:
+            older_than_days = app.config['VISIT_RETENTION_DAYS']
+        archive_dir = archive_dir or app.config['VISIT_ARCHIVE_DIR']
+        
+        # Only whole months are archived, so each archive file is complete
+        cutoff = month_start(datetime.now(UTC).replace(tzinfo=None) - timedelta(days=older_than_days))
+        columns = [getattr(Visit, column) for column in ARCHIVE_COLUMNS]
+        link_ids = db.session.execute(
+            db.select(Visit.short_url_id).distinct().where(Visit.timestamp < cutoff)
+        ).scalars().all()
+        
+        archived = 0
+        files = 0
+        repaired = 0
+        for link_id in link_ids:
+            oldest = db.session.scalar(
+                db.select(func.min(Visit.timestamp)).filter_by(short_url_id=link_id)
+            )
+            month = month_start(oldest)
+            while month < cutoff:
+                end = next_month(month)
+                rows = [row._asdict() for row in db.session.execute(
+                    db.select(*columns)
+                    .filter_by(short_url_id=link_id)
+                    .where(Visit.timestamp >= month, Visit.timestamp < end)
+                    .order_by(Visit.id)
+                )]
+                if rows:
+                    # Once the raw rows are gone the aggregates can't be rebuilt
+                    # from the database, so make sure they are complete first
+                    if not rollups_match(link_id, month, end, len(rows)):
+                        rebuild_rollups(link_id, month, end, rows)
+                        repaired += 1
+                    
+                    write_archive(archive_path(archive_dir, link_id, month), rows)
+                    ids = [row['id'] for row in rows]
+                    for i in range(0, len(ids), 1000):
+                        db.session.execute(db.delete(Visit).where(Visit.id.in_(ids[i:i + 1000])))
+                    db.session.execute(
+                        db.update(ShortURL)
+                        .where(ShortURL.id == link_id)
+                        .values(archived_visit_count=ShortURL.archived_visit_count + len(rows))
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.session.commit()
+                    archived += len(rows)
+                    files += 1
+                month = end
+        
+        click.echo(f'Archived {archived} visits into {files} files, rebuilt aggregates for {repaired} link-months')
+    
+    @app.cli.command('read-visit-archive')
+    @click.option('--link-id', type=int, default=None, help='Only replay visits to this link')
+    @click.option('--since', type=click.DateTime(), default=None, help='Only replay visits at or after this UTC time')
+    @click.option('--until', type=click.DateTime(), default=None, help='Only replay visits before this UTC time')
+    @click.option('--archive-dir', default=None, help='Directory to read archives from (default: VISIT_ARCHIVE_DIR)')
+    def read_visit_archive(link_id, since, until, archive_dir):
+        """Replay archived visits as NDJSON for ad-hoc queries"""
+        rows = iter_archived_visits(
+            archive_dir or app.config['VISIT_ARCHIVE_DIR'], short_url_id=link_id, start=since, end=until
+        )
+        for row in rows:
+            click.echo(json.dumps(row, default=lambda value: value.isoformat()))
+    
+    @app.cli.command('crosstab')
+    @click.option('--by', 'dimensions', multiple=True, required=True,
+                  type=click.Choice(list(CROSSTAB_DIMENSIONS)), help='Dimension to group by; repeat for a cross-tab')
+    @click.option('--source', type=click.Choice(['db', 'archive', 'all']), default='db', help='Where to read visits from')
+    @click.option('--user-id', type=int, default=None, help="Only count visits to this user's links")
+    @click.option('--link-id', type=int, default=None, help='Only count visits to this link')
+    @click.option('--since', type=click.DateTime(), default=None, help='Only count visits at or after this UTC time')
+    @click.option('--until', type=click.DateTime(), default=None, help='Only count visits before this UTC time')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), default='csv', help='Output format')
+    @click.option('--output', type=click.File('w'), default='-', help='File to write to (default: stdout)')
+    @click.option('--chunk-size', default=100000, help='Visits to process per vectorized chunk')
+    def crosstab(dimensions, source, user_id, link_id, since, until, fmt, output, chunk_size):
+        """Count visits grouped by several dimensions, e.g. --by country --by device --by day"""
+        try:
+            table = CrossTab(dimensions)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        
+        if source in ('db', 'all'):
+            for chunk in iter_database_chunks(
+                table.columns, chunk_size, user_id=user_id, short_url_id=link_id, start=since, end=until
+            ):
+                table.add_chunk(chunk)
+        
+        if source in ('archive', 'all'):
+            link_ids = None
+            if link_id is not None:
+                link_ids = [link_id]
+            elif user_id is not None:
+                link_ids = db.session.execute(
+                    db.select(ShortURL.id).filter_by(user_id=user_id).order_by(ShortURL.id)
+                ).scalars().all()
+            for chunk in iter_archive_chunks(
+                app.config['VISIT_ARCHIVE_DIR'], table.columns, chunk_size, link_ids=link_ids, start=since, end=until
+            ):
+                table.add_chunk(chunk)
+        
+        if fmt == 'json':
+            write_crosstab_json(table, output)
+        else:
+            write_crosstab_csv(table, output)
@@ -1,4 +1,8 @@
 from app.models.user import User
 from app.models.short_url import ShortURL, generate_short_code
 from app.models.visit import Visit
-from app.models.domain_modifier import DomainModifier
\ No newline at end of file
+from app.models.visit_rollup import VisitRollup
+from app.models.click_bucket import ClickBucket
+from app.models.visitor_sketch import VisitorSketch
+from app.models.domain_modifier import DomainModifier
+from app.models.code_sequence import CodeSequence
@@ -0,0 +1,57 @@
+from datetime import timedelta, UTC
+from app import db
+
+# Bucket resolution -> bucket width
+BUCKET_RESOLUTIONS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1)
+}
+
+def bucket_start(timestamp, resolution):
+    """Truncate a timestamp to the naive UTC start of its bucket"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    timestamp = timestamp.replace(second=0, microsecond=0)
+    if resolution in ('hour', 'day'):
+        timestamp = timestamp.replace(minute=0)
+    if resolution == 'day':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+class ClickBucket(db.Model):
+    """Number of visits to a link within one minute, hour or day"""
+    short_url_id = db.Column(db.Integer, db.ForeignKey('short_url.id'), primary_key=True)
+    resolution = db.Column(db.String(10), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ClickBucket {self.short_url_id} {self.resolution} {self.bucket}: {self.count}>'
+    
+    @classmethod
+    def series(cls, resolution, start, end, short_url_id=None, user_id=None):
+        """
+        Return (bucket, count) pairs for every bucket from start up to end,
+        including empty ones, for one link or all of a user's links
+        """
+        from app.models.short_url import ShortURL
+        
+        start = bucket_start(start, resolution)
+        end = bucket_start(end, resolution)
+        total = db.func.sum(cls.count)
+        query = db.select(cls.bucket, total).filter(
+            cls.resolution == resolution, cls.bucket >= start, cls.bucket <= end
+        )
+        if short_url_id is not None:
+            query = query.filter(cls.short_url_id == short_url_id)
+        if user_id is not None:
+            query = query.join(ShortURL, ShortURL.id == cls.short_url_id).filter(ShortURL.user_id == user_id)
+        counts = {bucket: int(count) for bucket, count in db.session.execute(query.group_by(cls.bucket)).all()}
+        
+        step = BUCKET_RESOLUTIONS[resolution]
+        points = []
+        while start <= end:
+            points.append((start, counts.get(start, 0)))
+            start += step
+        return points
@@ -0,0 +1,9 @@
+from app import db
+
+class CodeSequence(db.Model):
+    """Named counter that short code allocators reserve blocks of numbers from"""
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CodeSequence {self.name}={self.next_value}>'
@@ -1,5 +1,4 @@
 from datetime import datetime, UTC
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 from app import db
 
 class DomainModifier(db.Model):
@@ -17,64 +16,46 @@ class DomainModifier(db.Model):
         return f'<DomainModifier {self.domain}>'
     
     @staticmethod
-    def apply_modifiers(url):
-        """Apply all active domain modifiers to a URL if it matches the domain criteria"""
-        if not url:
-            return url
-            
-        # Parse the URL
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.lower()
+    def get_active_modifiers(user_id):
+        """Get all of a user's active domain modifiers"""
+        return db.session.execute(
+            db.select(DomainModifier)
+            .filter_by(active=True, user_id=user_id)
+            .order_by(DomainModifier.id)
+        ).scalars().all()
+    
+    @staticmethod
+    def get_matcher(user_id):
+        """Compile a user's active domain modifiers as currently seen by this session"""
+        from app.utils.modifier_index import ModifierMatcher
+        return ModifierMatcher(DomainModifier.get_active_modifiers(user_id))
+    
+    @staticmethod
+    def apply_modifiers(url, user_id=None, modifiers=None):
+        """
+        Apply all active domain modifiers to a URL if it matches the domain criteria.
         
-        if not domain:
-            return url  # No domain to match
+        Modifiers are those owned by user_id, or by the logged-in user if no owner
+        is given, matched through the process-wide compiled index. A pre-loaded
+        list of modifiers or a ModifierMatcher can be passed instead.
+        """
+        # We can't import these at the top level due to circular imports
+        from app.utils.modifier_index import ModifierMatcher, modifier_index
         
-        # Find matching domain modifiers
-        # We need the current user, but we can't import it at the top level due to circular imports
-        from flask_login import current_user
-        if current_user and current_user.is_authenticated:
-            modifiers = db.session.execute(
-                db.select(DomainModifier).filter_by(active=True, user_id=current_user.id)
-            ).scalars().all()
-        else:
-            # If there's no logged-in user (e.g., in public redirect), don't apply modifiers
+        if not url:
             return url
-            
-        applicable_modifiers = []
         
-        for modifier in modifiers:
-            modifier_domain = modifier.domain.lower()
-            
-            # Check if domain matches
-            if modifier.include_subdomains:
-                # Check if domain is or is a subdomain of the modifier domain
-                if domain == modifier_domain or domain.endswith('.' + modifier_domain):
-                    applicable_modifiers.append(modifier)
-            else:
-                # Direct domain match only
-                if domain == modifier_domain:
-                    applicable_modifiers.append(modifier)
-        
-        if not applicable_modifiers:
-            return url  # No modifiers to apply
-            
-        # Apply modifiers
-        for modifier in applicable_modifiers:
-            # Parse the existing query string
-            query_dict = parse_qs(parsed_url.query)
-            
-            # Parse and add the modifier's query parameters
-            import json
-            new_params = json.loads(modifier.query_params)
-            
-            for key, value in new_params.items():
-                query_dict[key] = [value]  # query_dict values are lists
-            
-            # Rebuild the query string
-            new_query = urlencode(query_dict, doseq=True)
-            
-            # Update the parsed URL with the new query string
-            parsed_url = parsed_url._replace(query=new_query)
+        if modifiers is None:
+            if user_id is None:
+                from flask_login import current_user
+                if not (current_user and current_user.is_authenticated):
+                    # Without an owner there are no modifiers to apply
+                    return url
+                user_id = current_user.id
+            matcher = modifier_index.get(user_id)
+        elif isinstance(modifiers, ModifierMatcher):
+            matcher = modifiers
+        else:
+            matcher = ModifierMatcher(modifiers)
         
-        # Reconstruct the URL with the applied modifiers
-        return urlunparse(parsed_url)
\ No newline at end of file
+        return matcher.apply(url)
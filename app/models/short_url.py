@@ -1,7 +1,13 @@
 import random
 import string
 from datetime import datetime, UTC
+from urllib.parse import urlparse
+from sqlalchemy.exc import IntegrityError
 from app import db
+from app.models.domain_modifier import DomainModifier
+
+# Generated codes that collide with existing ones are skipped this many times
+MAX_ALLOCATION_ATTEMPTS = 10
 
 def generate_short_code(length=6):
     """Generate a random short code of specified length using A-Z and 0-9"""
@@ -15,20 +21,94 @@ class ShortURL(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     apply_modifiers = db.Column(db.Boolean, default=True)
+    target_host = db.Column(db.String(255), index=True)
+    redirect_url = db.Column(db.Text)  # target_url with the owner's domain modifiers applied
+    visit_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_visit_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # visits moved to cold storage
     
     # Relationships
     visits = db.relationship('Visit', backref='short_url', lazy=True, cascade='all, delete-orphan')
+    rollups = db.relationship('VisitRollup', lazy=True, cascade='all, delete-orphan')
+    click_buckets = db.relationship('ClickBucket', lazy=True, cascade='all, delete-orphan')
+    visitor_sketches = db.relationship('VisitorSketch', lazy=True, cascade='all, delete-orphan')
+    
+    # Supports keyset pagination of a user's links, newest first
+    __table_args__ = (
+        db.Index('ix_short_url_user_created', 'user_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<ShortURL {self.short_code}>'
     
     def get_redirect_url(self):
         """Get the URL to redirect to, applying domain modifiers if enabled"""
+        if self.redirect_url:
+            return self.redirect_url
+        # Links saved before redirect URLs were materialized
         if self.apply_modifiers:
-            from app.models.domain_modifier import DomainModifier
-            return DomainModifier.apply_modifiers(self.target_url)
+            return DomainModifier.apply_modifiers(self.target_url, user_id=self.user_id)
         return self.target_url
     
+    @staticmethod
+    def host_of(url):
+        """Get the host a URL's domain modifiers are matched against"""
+        return urlparse(url).netloc.lower()
+    
+    def refresh_redirect_url(self, modifiers=None):
+        """Recompute the materialized redirect URL from the target URL and the owner's modifiers"""
+        self.target_host = self.host_of(self.target_url)
+        if self.apply_modifiers:
+            # The stored URL outlives any cache, so compile the owner's current
+            # modifiers rather than trusting this worker's index
+            if modifiers is None:
+                modifiers = DomainModifier.get_matcher(self.user_id)
+            self.redirect_url = DomainModifier.apply_modifiers(self.target_url, modifiers=modifiers)
+        else:
+            self.redirect_url = self.target_url
+    
+    @classmethod
+    def refresh_redirect_urls(cls, user_id, domains):
+        """
+        Recompute the materialized redirect URLs of a user's links whose host is,
+        or is a subdomain of, any of the given domains. Returns the short codes
+        whose redirect URL changed.
+        """
+        conditions = []
+        for domain in {domain.lower() for domain in domains if domain}:
+            conditions.append(cls.target_host == domain)
+            conditions.append(cls.target_host.like('%.' + domain.replace('_', '\\_'), escape='\\'))
+        
+        if not conditions:
+            return []
+        
+        links = db.session.execute(
+            db.select(cls.id, cls.short_code, cls.target_url, cls.apply_modifiers, cls.redirect_url)
+            .filter_by(user_id=user_id)
+            .where(db.or_(*conditions))
+        ).all()
+        
+        if not links:
+            return []
+        
+        # Compile the owner's modifiers once for the whole pass
+        modifiers = DomainModifier.get_matcher(user_id)
+        
+        updates = []
+        changed_codes = []
+        for link in links:
+            if link.apply_modifiers:
+                redirect_url = DomainModifier.apply_modifiers(link.target_url, modifiers=modifiers)
+            else:
+                redirect_url = link.target_url
+            if redirect_url != link.redirect_url:
+                updates.append({'id': link.id, 'redirect_url': redirect_url})
+                changed_codes.append(link.short_code)
+        
+        if updates:
+            db.session.execute(db.update(cls), updates)
+        
+        return changed_codes
+    
     @classmethod
     def create_with_unique_code(cls, target_url, user_id, custom_code=None, apply_modifiers=True):
         """Create a new short URL with either a custom code or a unique generated one"""
@@ -38,22 +118,139 @@ class ShortURL(db.Model):
             if existing:
                 return None, "This short code is already in use"
             
-            short_code = custom_code
-        else:
-            # Generate a unique short code
-            while True:
-                short_code = generate_short_code()
-                if not db.session.execute(db.select(cls).filter_by(short_code=short_code)).first():
+            short_url = cls(
+                short_code=custom_code, 
+                target_url=target_url, 
+                user_id=user_id,
+                apply_modifiers=apply_modifiers
+            )
+            short_url.refresh_redirect_url()
+            db.session.add(short_url)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Someone else claimed the code since we checked
+                db.session.rollback()
+                return None, "This short code is already in use"
+            
+            return short_url, None
+        
+        # Generated codes come from the allocator and are unique among themselves,
+        # so they only collide with custom or legacy random codes. Rather than
+        # probing first, insert and move on to the next code if that happens.
+        from app.utils.code_allocator import code_allocator
+        modifiers = DomainModifier.get_matcher(user_id) if apply_modifiers else None
+        for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+            short_url = cls(
+                short_code=code_allocator.next_code(), 
+                target_url=target_url, 
+                user_id=user_id,
+                apply_modifiers=apply_modifiers
+            )
+            short_url.refresh_redirect_url(modifiers)
+            db.session.add(short_url)
+            try:
+                db.session.commit()
+                return short_url, None
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+                    raise
+    
+    @classmethod
+    def create_many(cls, user_id, entries, chunk_size=1000):
+        """
+        Create short URLs in bulk for one user.
+        
+        Each entry is a dict with a target_url and optional custom_code,
+        apply_modifiers and created_at. Links are inserted in chunked transactions with
+        generated codes allocated a chunk at a time. Returns a list of
+        (link, error) tuples in the same order as entries, where link is a
+        dict of the created link's columns.
+        """
+        from app.utils.code_allocator import code_allocator
+        from app.utils.short_code_filter import short_code_filter
+        
+        results = [None] * len(entries)
+        modifiers = DomainModifier.get_matcher(user_id)
+        seen_custom_codes = set()
+        
+        for chunk_start in range(0, len(entries), chunk_size):
+            chunk = range(chunk_start, min(chunk_start + chunk_size, len(entries)))
+            
+            # Custom codes are used as given, the rest come from the allocator
+            codes = {}
+            for index in chunk:
+                custom_code = entries[index].get('custom_code')
+                if not custom_code:
+                    continue
+                if custom_code in seen_custom_codes:
+                    results[index] = (None, 'This short code is already in use')
+                    continue
+                seen_custom_codes.add(custom_code)
+                codes[index] = custom_code
+            
+            generated = [index for index in chunk if results[index] is None and index not in codes]
+            codes.update(zip(generated, code_allocator.allocate(len(generated))))
+            
+            # One query per chunk finds codes already taken by existing links
+            while codes:
+                taken = set(db.session.execute(
+                    db.select(cls.short_code).where(cls.short_code.in_(list(codes.values())))
+                ).scalars())
+                regenerate = []
+                for index, code in list(codes.items()):
+                    if code not in taken:
+                        continue
+                    if entries[index].get('custom_code'):
+                        results[index] = (None, 'This short code is already in use')
+                        del codes[index]
+                    else:
+                        regenerate.append(index)
+                if not regenerate:
                     break
+                codes.update(zip(regenerate, code_allocator.allocate(len(regenerate))))
+            
+            if not codes:
+                continue
+            
+            created_at = datetime.now(UTC)
+            rows = []
+            for index, code in codes.items():
+                entry = entries[index]
+                target_url = entry['target_url']
+                apply_modifiers = entry.get('apply_modifiers', True)
+                rows.append({
+                    'short_code': code,
+                    'target_url': target_url,
+                    'target_host': cls.host_of(target_url),
+                    'redirect_url': (
+                        DomainModifier.apply_modifiers(target_url, modifiers=modifiers)
+                        if apply_modifiers else target_url
+                    ),
+                    'apply_modifiers': apply_modifiers,
+                    'user_id': user_id,
+                    'created_at': entry.get('created_at') or created_at
+                })
+            
+            try:
+                db.session.execute(db.insert(cls), rows)
+                db.session.commit()
+            except IntegrityError:
+                # A code was claimed concurrently after the check above
+                db.session.rollback()
+                for index in codes:
+                    results[index] = (None, 'Short code conflict while saving; please retry')
+                continue
+            
+            # Bulk inserts skip ORM events, so register the new codes directly
+            for code in codes.values():
+                short_code_filter.add(code)
+            
+            ids = dict(db.session.execute(
+                db.select(cls.short_code, cls.id).where(cls.short_code.in_(list(codes.values())))
+            ).all())
+            for index, row in zip(codes, rows):
+                results[index] = (dict(row, id=ids[row['short_code']]), None)
         
-        # Create new short URL
-        short_url = cls(
-            short_code=short_code, 
-            target_url=target_url, 
-            user_id=user_id,
-            apply_modifiers=apply_modifiers
-        )
-        db.session.add(short_url)
-        db.session.commit()
-        
-        return short_url, None
\ No newline at end of file
+        return results
@@ -19,4 +19,5 @@ class User(UserMixin, db.Model):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
\ No newline at end of file
+    from app.utils.user_cache import load_cached_user
+    return load_cached_user(int(user_id))
\ No newline at end of file
@@ -16,5 +16,10 @@ class Visit(db.Model):
     referrer = db.Column(db.String(2048))
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
     
+    # Supports keyset pagination and time-range scans of a link's visits
+    __table_args__ = (
+        db.Index('ix_visit_short_url_timestamp', 'short_url_id', 'timestamp', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Visit {self.id} for ShortURL {self.short_url_id}>'
\ No newline at end of file
@@ -0,0 +1,41 @@
+from datetime import UTC
+from app import db
+
+# Rollup dimension name -> Visit column it counts
+ROLLUP_DIMENSIONS = {
+    'browser': 'browser',
+    'device': 'device_type',
+    'country': 'country_name'
+}
+
+def rollup_hour(timestamp):
+    """Truncate a visit timestamp to the naive UTC hour it is rolled up under"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class VisitRollup(db.Model):
+    """Hourly visit count for one value of one dimension of a link"""
+    short_url_id = db.Column(db.Integer, db.ForeignKey('short_url.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)
+    # Missing values are stored as '' since NULLs can't be part of the key
+    value = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<VisitRollup {self.short_url_id} {self.hour} {self.dimension}={self.value!r}: {self.count}>'
+    
+    @classmethod
+    def breakdown(cls, dimension, short_url_id=None, user_id=None):
+        """Return (value, count) totals for a dimension of one link or all of a user's links"""
+        from app.models.short_url import ShortURL
+        
+        total = db.func.sum(cls.count)
+        query = db.select(cls.value, total).filter(cls.dimension == dimension)
+        if short_url_id is not None:
+            query = query.filter(cls.short_url_id == short_url_id)
+        if user_id is not None:
+            query = query.join(ShortURL, ShortURL.id == cls.short_url_id).filter(ShortURL.user_id == user_id)
+        rows = db.session.execute(query.group_by(cls.value).order_by(total.desc(), cls.value)).all()
+        return [(value or None, int(count)) for value, count in rows]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, UTC
+from app import db
+from app.utils.hyperloglog import HyperLogLog
+
+# Registers per sketch as a power of two; 2**12 gives about 1.6% standard error
+SKETCH_PRECISION = 12
+
+def visitor_key(ip_address, user_agent):
+    """Identify a visitor by IP address and user agent"""
+    return f'{ip_address or ""}|{user_agent or ""}'
+
+class VisitorSketch(db.Model):
+    """HyperLogLog sketch of the distinct visitors to a link on one UTC day"""
+    short_url_id = db.Column(db.Integer, db.ForeignKey('short_url.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f'<VisitorSketch {self.short_url_id} {self.day}>'
+    
+    @property
+    def sketch(self):
+        return HyperLogLog.from_bytes(self.registers, SKETCH_PRECISION)
+    
+    @classmethod
+    def unique_visitors(cls, short_url_id=None, user_id=None, start=None, end=None):
+        """Estimate distinct visitors to one link or all of a user's links, optionally between two days"""
+        from app.models.short_url import ShortURL
+        
+        query = db.select(cls.registers)
+        if short_url_id is not None:
+            query = query.filter(cls.short_url_id == short_url_id)
+        if user_id is not None:
+            query = query.join(ShortURL, ShortURL.id == cls.short_url_id).filter(ShortURL.user_id == user_id)
+        if start is not None:
+            query = query.filter(cls.day >= start)
+        if end is not None:
+            query = query.filter(cls.day <= end)
+        
+        merged = HyperLogLog(SKETCH_PRECISION)
+        for registers in db.session.execute(query.execution_options(yield_per=500)).scalars():
+            merged.merge(HyperLogLog.from_bytes(registers, SKETCH_PRECISION))
+        return merged.count()
+    
+    @classmethod
+    def recent_unique_visitors(cls, days, short_url_id=None, user_id=None):
+        """Estimate distinct visitors over the last days UTC days, today included"""
+        end = datetime.now(UTC).date()
+        return cls.unique_visitors(short_url_id, user_id, start=end - timedelta(days=days - 1), end=end)
@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from flask import Blueprint, render_template, stream_template, redirect, url_for, request, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from sqlalchemy import func
 from app import db
-from app.models import ShortURL, Visit, DomainModifier
+from app.models import ShortURL, Visit, VisitRollup, VisitorSketch, DomainModifier
+from app.utils.link_cache import invalidate_link, invalidate_links
+from app.utils.modifier_index import modifier_index
+from app.utils.db_routing import use_replica
+from app.utils.pagination import keyset_paginate, page_size
 import validators
 import json
 
@@ -12,25 +15,33 @@ admin_bp = Blueprint('admin', __name__)
 @login_required
 def dashboard():
     """Admin dashboard showing user's shortened URLs"""
-    # Get user's short URLs
-    short_urls = db.session.execute(
-        db.select(ShortURL)
-        .filter_by(user_id=current_user.id)
-        .order_by(ShortURL.created_at.desc())
-    ).scalars().all()
+    # Get a page of the user's short URLs
+    try:
+        short_urls, next_cursor = keyset_paginate(
+            db.select(ShortURL).filter_by(user_id=current_user.id),
+            ShortURL.created_at, ShortURL.id,
+            cursor=request.args.get('cursor'),
+            limit=page_size(
+                request.args.get('limit', type=int),
+                current_app.config['LINKS_PAGE_SIZE'],
+                current_app.config['LINKS_MAX_PAGE_SIZE']
+            )
+        )
+    except ValueError:
+        return redirect(url_for('admin.dashboard'))
     
-    # For each URL, count the number of visits
+    # Visit counts are maintained on each link as visits are ingested
     urls_with_stats = []
     for url in short_urls:
-        visit_count = db.session.scalar(
-            db.select(func.count()).select_from(Visit).filter_by(short_url_id=url.id)
-        )
         urls_with_stats.append({
             'url': url,
-            'visit_count': visit_count
+            'visit_count': url.visit_count
         })
     
-    return render_template('admin/dashboard.html', urls=urls_with_stats)
+    return render_template('admin/dashboard.html',
+                           urls=urls_with_stats,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'))
 
 @admin_bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -85,7 +96,9 @@ def edit_url(url_id):
         
         short_url.target_url = target_url
         short_url.apply_modifiers = apply_modifiers
+        short_url.refresh_redirect_url()
         db.session.commit()
+        invalidate_link(short_url.short_code)
         
         flash('URL updated successfully', 'success')
         return redirect(url_for('admin.dashboard'))
@@ -105,12 +118,14 @@ def delete_url(url_id):
     
     db.session.delete(short_url)
     db.session.commit()
+    invalidate_link(short_url.short_code)
     
     flash('URL deleted successfully', 'success')
     return redirect(url_for('admin.dashboard'))
 
 @admin_bp.route('/analytics/<int:url_id>')
 @login_required
+@use_replica
 def url_analytics(url_id):
     """View analytics for a specific URL"""
     short_url = db.get_or_404(ShortURL, url_id)
@@ -120,78 +135,88 @@ def url_analytics(url_id):
         flash('You do not have permission to view analytics for this URL', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    # Get all visits for this URL
-    visits = db.session.execute(
-        db.select(Visit)
-        .filter_by(short_url_id=url_id)
-        .order_by(Visit.timestamp.desc())
-    ).scalars().all()
+    # Get a page of this URL's visits, newest first
+    try:
+        visits, next_cursor = keyset_paginate(
+            db.select(
+                Visit.id, Visit.timestamp, Visit.browser, Visit.browser_version, Visit.device_type,
+                Visit.operating_system, Visit.country_name, Visit.city, Visit.referrer
+            ).filter_by(short_url_id=url_id),
+            Visit.timestamp, Visit.id,
+            cursor=request.args.get('cursor'),
+            limit=page_size(
+                request.args.get('limit', type=int),
+                current_app.config['VISITS_PAGE_SIZE'],
+                current_app.config['VISITS_MAX_PAGE_SIZE']
+            ),
+            scalars=False
+        )
+    except ValueError:
+        return redirect(url_for('admin.url_analytics', url_id=url_id))
     
     # Get visit statistics
-    browser_stats = db.session.query(
-        Visit.browser, func.count(Visit.id)
-    ).filter_by(short_url_id=url_id).group_by(Visit.browser).all()
-    
-    device_stats = db.session.query(
-        Visit.device_type, func.count(Visit.id)
-    ).filter_by(short_url_id=url_id).group_by(Visit.device_type).all()
+    browser_stats = VisitRollup.breakdown('browser', short_url_id=url_id)
+    device_stats = VisitRollup.breakdown('device', short_url_id=url_id)
+    country_stats = VisitRollup.breakdown('country', short_url_id=url_id)
     
-    country_stats = db.session.query(
-        Visit.country_name, func.count(Visit.id)
-    ).filter_by(short_url_id=url_id).group_by(Visit.country_name).all()
-    
-    return render_template('admin/url_analytics.html', 
+    # Stream the page so the response starts before the visit table is rendered
+    return current_app.response_class(stream_template('admin/url_analytics.html', 
                            url=short_url, 
                            visits=visits,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'),
+                           unique_visitors=VisitorSketch.recent_unique_visitors(
+                               current_app.config['UNIQUE_VISITORS_DAYS'], short_url_id=url_id
+                           ),
+                           unique_visitors_days=current_app.config['UNIQUE_VISITORS_DAYS'],
                            browser_stats=browser_stats,
                            device_stats=device_stats,
-                           country_stats=country_stats)
+                           country_stats=country_stats))
 
 @admin_bp.route('/analytics')
 @login_required
+@use_replica
 def user_analytics():
     """View analytics for all user's URLs"""
-    # Get all user's URLs
-    short_urls = db.session.execute(
-        db.select(ShortURL)
+    # Count the user's URLs and visits without loading every row
+    url_count, total_visits = db.session.execute(
+        db.select(db.func.count(ShortURL.id), db.func.coalesce(db.func.sum(ShortURL.visit_count), 0))
         .filter_by(user_id=current_user.id)
-    ).scalars().all()
-    url_ids = [url.id for url in short_urls]
+    ).one()
     
-    if not url_ids:
+    if not url_count:
         flash('You don\'t have any URLs yet', 'info')
         return redirect(url_for('admin.dashboard'))
     
     # Get aggregated stats for all user's URLs
-    browser_stats = db.session.query(
-        Visit.browser, func.count(Visit.id)
-    ).filter(Visit.short_url_id.in_(url_ids)).group_by(Visit.browser).all()
-    
-    device_stats = db.session.query(
-        Visit.device_type, func.count(Visit.id)
-    ).filter(Visit.short_url_id.in_(url_ids)).group_by(Visit.device_type).all()
-    
-    country_stats = db.session.query(
-        Visit.country_name, func.count(Visit.id)
-    ).filter(Visit.short_url_id.in_(url_ids)).group_by(Visit.country_name).all()
+    browser_stats = VisitRollup.breakdown('browser', user_id=current_user.id)
+    device_stats = VisitRollup.breakdown('device', user_id=current_user.id)
+    country_stats = VisitRollup.breakdown('country', user_id=current_user.id)
     
     # Get top 10 most visited URLs
-    top_urls = db.session.query(
-        ShortURL, func.count(Visit.id).label('visit_count')
-    ).join(Visit).filter(ShortURL.id.in_(url_ids)).group_by(ShortURL.id).order_by(
-        func.count(Visit.id).desc()
-    ).limit(10).all()
+    top_urls = db.session.execute(
+        db.select(ShortURL)
+        .filter_by(user_id=current_user.id)
+        .filter(ShortURL.visit_count > 0)
+        .order_by(ShortURL.visit_count.desc())
+        .limit(10)
+    ).scalars().all()
     
     # Process the top_urls to include rank without using enumerate in template
     processed_top_urls = []
-    for i, (url, visit_count) in enumerate(top_urls):
+    for i, url in enumerate(top_urls):
         processed_top_urls.append({
             'rank': i + 1,
             'url': url,
-            'visit_count': visit_count
+            'visit_count': url.visit_count
         })
     
     return render_template('admin/user_analytics.html',
+                           total_visits=total_visits,
+                           unique_visitors=VisitorSketch.recent_unique_visitors(
+                               current_app.config['UNIQUE_VISITORS_DAYS'], user_id=current_user.id
+                           ),
+                           unique_visitors_days=current_app.config['UNIQUE_VISITORS_DAYS'],
                            browser_stats=browser_stats,
                            device_stats=device_stats,
                            country_stats=country_stats,
@@ -262,7 +287,10 @@ def create_domain_modifier():
         )
         
         db.session.add(modifier)
+        changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [domain])
         db.session.commit()
+        invalidate_links(changed_codes)
+        modifier_index.invalidate(current_user.id)
         
         flash('Domain modifier created successfully', 'success')
         return redirect(url_for('admin.domain_modifiers'))
@@ -305,12 +333,16 @@ def edit_domain_modifier(modifier_id):
             return redirect(url_for('admin.edit_domain_modifier', modifier_id=modifier_id))
         
         # Update domain modifier
+        previous_domain = modifier.domain
         modifier.domain = domain
         modifier.include_subdomains = include_subdomains
         modifier.query_params = json.dumps(query_params)
         modifier.active = active
         
+        changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [previous_domain, domain])
         db.session.commit()
+        invalidate_links(changed_codes)
+        modifier_index.invalidate(current_user.id)
         
         flash('Domain modifier updated successfully', 'success')
         return redirect(url_for('admin.domain_modifiers'))
@@ -334,7 +366,10 @@ def delete_domain_modifier(modifier_id):
         return redirect(url_for('admin.domain_modifiers'))
     
     db.session.delete(modifier)
+    changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [modifier.domain])
     db.session.commit()
+    invalidate_links(changed_codes)
+    modifier_index.invalidate(current_user.id)
     
     flash('Domain modifier deleted successfully', 'success')
     return redirect(url_for('admin.domain_modifiers'))
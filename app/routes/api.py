@@ -1,42 +1,65 @@
-from flask import Blueprint, jsonify, request, url_for
+import time
+from datetime import datetime, timedelta, UTC
+from flask import Blueprint, jsonify, request, url_for, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from sqlalchemy import func
 from app import db
-from app.models import ShortURL, Visit, DomainModifier
+from app.models import ShortURL, VisitRollup, ClickBucket, VisitorSketch, DomainModifier
+from app.models.click_bucket import BUCKET_RESOLUTIONS
 import validators
 import json
-from app.utils.monitoring import url_operation_counter
+from app.utils.monitoring import url_operation_counter, redirect_top_codes
+from app.utils.link_cache import invalidate_link, invalidate_links
+from app.utils.modifier_index import modifier_index
+from app.utils.db_routing import use_replica
+from app.utils.pagination import keyset_paginate, page_size
+from app.utils.link_transfer import iter_export_rows, export_ndjson, export_csv, iter_import_records, LinkImporter
+from app.utils.modifier_dry_run import (
+    parse_proposed_modifiers, build_dry_run_matcher, iter_link_diffs, iter_url_diffs, dry_run_ndjson
+)
 
 api_bp = Blueprint('api', __name__)
 
+# Range covered by a time series request that doesn't give a start
+DEFAULT_TIMESERIES_SPANS = {
+    'minute': timedelta(hours=1),
+    'hour': timedelta(days=7),
+    'day': timedelta(days=90)
+}
+
 @api_bp.route('/urls', methods=['GET'])
 @login_required
 def get_urls():
-    """API endpoint to get all URLs for the current user"""
+    """API endpoint to get a page of URLs for the current user, newest first"""
     try:
-        urls = db.session.execute(
-            db.select(ShortURL)
-            .filter_by(user_id=current_user.id)
-            .order_by(ShortURL.created_at.desc())
-        ).scalars().all()
+        try:
+            urls, next_cursor = keyset_paginate(
+                db.select(ShortURL).filter_by(user_id=current_user.id),
+                ShortURL.created_at, ShortURL.id,
+                cursor=request.args.get('cursor'),
+                limit=page_size(
+                    request.args.get('limit', type=int),
+                    current_app.config['LINKS_PAGE_SIZE'],
+                    current_app.config['LINKS_MAX_PAGE_SIZE']
+                )
+            )
+        except ValueError:
+            url_operation_counter.labels(operation='list', status='bad_request').inc()
+            return jsonify(error='Invalid cursor'), 400
         
         result = []
         for url in urls:
-            visit_count = db.session.scalar(
-                db.select(func.count()).select_from(Visit).filter_by(short_url_id=url.id)
-            )
             result.append({
                 'id': url.id,
                 'short_code': url.short_code,
                 'target_url': url.target_url,
                 'created_at': url.created_at.isoformat(),
-                'visit_count': visit_count,
+                'visit_count': url.visit_count,
                 'apply_modifiers': url.apply_modifiers,
                 'short_url': url_for('main.redirect_to_url', short_code=url.short_code, _external=True)
             })
         
         url_operation_counter.labels(operation='list', status='success').inc()
-        return jsonify(urls=result)
+        return jsonify(urls=result, next_cursor=next_cursor)
     except Exception as e:
         url_operation_counter.labels(operation='list', status='error').inc()
         return jsonify(error=str(e)), 500
@@ -86,6 +109,127 @@ def create_url():
         url_operation_counter.labels(operation='create', status='error').inc()
         return jsonify(error=str(e)), 500
 
+@api_bp.route('/urls/batch', methods=['POST'])
+@login_required
+def create_urls_batch():
+    """API endpoint to create many shortened URLs from a JSON array or NDJSON body"""
+    start = time.time()
+    
+    # Accept either a JSON array (optionally wrapped in {"urls": [...]}) or NDJSON lines
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            items = request.get_json()
+            if isinstance(items, dict):
+                items = items.get('urls')
+    except ValueError:
+        url_operation_counter.labels(operation='create_batch', status='bad_request').inc()
+        return jsonify(error='Request body must be a JSON array or NDJSON'), 400
+    
+    if not isinstance(items, list) or not items:
+        url_operation_counter.labels(operation='create_batch', status='bad_request').inc()
+        return jsonify(error='Request body must contain a non-empty list of URLs'), 400
+    
+    max_items = current_app.config['BULK_CREATE_MAX_ITEMS']
+    if len(items) > max_items:
+        url_operation_counter.labels(operation='create_batch', status='bad_request').inc()
+        return jsonify(error=f'A batch can contain at most {max_items} URLs'), 400
+    
+    # Validate every entry before creating anything
+    results = [None] * len(items)
+    entries = []
+    positions = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not validators.url(item.get('target_url') or ''):
+            results[index] = {'index': index, 'status': 'error', 'error': 'Invalid URL. Please enter a valid URL including http:// or https://'}
+            continue
+        custom_code = item.get('custom_code')
+        if custom_code is not None and not isinstance(custom_code, str):
+            results[index] = {'index': index, 'status': 'error', 'error': 'custom_code must be a string'}
+            continue
+        entries.append({
+            'target_url': item['target_url'],
+            'custom_code': custom_code,
+            'apply_modifiers': bool(item.get('apply_modifiers', True))
+        })
+        positions.append(index)
+    
+    try:
+        created = ShortURL.create_many(
+            current_user.id, entries, chunk_size=current_app.config['BULK_CREATE_CHUNK_SIZE']
+        )
+    except Exception as e:
+        url_operation_counter.labels(operation='create_batch', status='error').inc()
+        return jsonify(error=str(e)), 500
+    
+    for index, (link, error) in zip(positions, created):
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+        else:
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': link['id'],
+                'short_code': link['short_code'],
+                'target_url': link['target_url'],
+                'created_at': link['created_at'].isoformat(),
+                'apply_modifiers': link['apply_modifiers'],
+                'short_url': url_for('main.redirect_to_url', short_code=link['short_code'], _external=True)
+            }
+    
+    created_count = sum(1 for result in results if result['status'] == 'created')
+    elapsed = time.time() - start
+    url_operation_counter.labels(operation='create_batch', status='success').inc()
+    return jsonify({
+        'results': results,
+        'created': created_count,
+        'failed': len(results) - created_count,
+        'elapsed_seconds': round(elapsed, 3),
+        'links_per_second': round(created_count / elapsed, 1) if elapsed else None
+    }), 201 if created_count else 400
+
+@api_bp.route('/urls/export', methods=['GET'])
+@login_required
+def export_urls():
+    """API endpoint to stream all of the current user's URLs as NDJSON or CSV"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        url_operation_counter.labels(operation='export', status='bad_request').inc()
+        return jsonify(error='format must be ndjson or csv'), 400
+    
+    rows = iter_export_rows(current_user.id, batch_size=current_app.config['TRANSFER_BATCH_SIZE'])
+    if fmt == 'csv':
+        body, mimetype = export_csv(rows), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(rows), 'application/x-ndjson'
+    
+    url_operation_counter.labels(operation='export', status='success').inc()
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=getshort-links.{fmt}'}
+    )
+
+@api_bp.route('/urls/import', methods=['POST'])
+@login_required
+def import_urls():
+    """API endpoint to upsert URLs from a streamed NDJSON or CSV body"""
+    fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    importer = LinkImporter(current_user.id, batch_size=current_app.config['TRANSFER_BATCH_SIZE'])
+    
+    try:
+        for record in iter_import_records(request.stream, fmt):
+            importer.add(record)
+        importer.flush()
+    except Exception as e:
+        db.session.rollback()
+        url_operation_counter.labels(operation='import', status='error').inc()
+        return jsonify(error=str(e), **importer.summary()), 500
+    
+    url_operation_counter.labels(operation='import', status='success').inc()
+    return jsonify(importer.summary())
+
 @api_bp.route('/urls/<int:url_id>', methods=['PATCH'])
 @login_required
 def update_url(url_id):
@@ -102,7 +246,9 @@ def update_url(url_id):
         if 'apply_modifiers' in data:
             short_url.apply_modifiers = bool(data['apply_modifiers'])
         
+        short_url.refresh_redirect_url()
         db.session.commit()
+        invalidate_link(short_url.short_code)
         
         url_operation_counter.labels(operation='update', status='success').inc()
         return jsonify({
@@ -131,6 +277,7 @@ def delete_url(url_id):
         
         db.session.delete(short_url)
         db.session.commit()
+        invalidate_link(short_url.short_code)
         
         url_operation_counter.labels(operation='delete', status='success').inc()
         return jsonify(message='URL deleted successfully'), 200
@@ -140,6 +287,7 @@ def delete_url(url_id):
 
 @api_bp.route('/urls/<int:url_id>/analytics', methods=['GET'])
 @login_required
+@use_replica
 def url_analytics(url_id):
     """API endpoint to get analytics for a specific URL"""
     try:
@@ -150,23 +298,10 @@ def url_analytics(url_id):
             url_operation_counter.labels(operation='analytics', status='unauthorized').inc()
             return jsonify(error='You do not have permission to view analytics for this URL'), 403
         
-        # Get visit count
-        visit_count = db.session.scalar(
-            db.select(func.count()).select_from(Visit).filter_by(short_url_id=url_id)
-        )
-        
         # Get visit statistics
-        browser_stats = db.session.query(
-            Visit.browser, func.count(Visit.id).label('count')
-        ).filter_by(short_url_id=url_id).group_by(Visit.browser).all()
-        
-        device_stats = db.session.query(
-            Visit.device_type, func.count(Visit.id).label('count')
-        ).filter_by(short_url_id=url_id).group_by(Visit.device_type).all()
-        
-        country_stats = db.session.query(
-            Visit.country_name, func.count(Visit.id).label('count')
-        ).filter_by(short_url_id=url_id).group_by(Visit.country_name).all()
+        browser_stats = VisitRollup.breakdown('browser', short_url_id=url_id)
+        device_stats = VisitRollup.breakdown('device', short_url_id=url_id)
+        country_stats = VisitRollup.breakdown('country', short_url_id=url_id)
         
         url_operation_counter.labels(operation='analytics', status='success').inc()
         return jsonify({
@@ -174,7 +309,11 @@ def url_analytics(url_id):
             'short_code': short_url.short_code,
             'target_url': short_url.target_url,
             'apply_modifiers': short_url.apply_modifiers,
-            'total_visits': visit_count,
+            'total_visits': short_url.visit_count,
+            'unique_visitors': VisitorSketch.recent_unique_visitors(
+                current_app.config['UNIQUE_VISITORS_DAYS'], short_url_id=url_id
+            ),
+            'unique_visitors_days': current_app.config['UNIQUE_VISITORS_DAYS'],
             'browser_stats': [{'browser': b, 'count': c} for b, c in browser_stats],
             'device_stats': [{'device': d, 'count': c} for d, c in device_stats],
             'country_stats': [{'country': c, 'count': count} for c, count in country_stats if c]
@@ -183,6 +322,122 @@ def url_analytics(url_id):
         url_operation_counter.labels(operation='analytics', status='error').inc()
         return jsonify(error=str(e)), 500
 
+def _timeseries_range():
+    """Read and validate the interval, start and end of a time series request"""
+    interval = request.args.get('interval', 'hour')
+    if interval not in BUCKET_RESOLUTIONS:
+        raise ValueError(f'Interval must be one of: {", ".join(BUCKET_RESOLUTIONS)}')
+    
+    try:
+        end = _naive_utc(request.args['end']) if request.args.get('end') else datetime.now(UTC).replace(tzinfo=None)
+        start = _naive_utc(request.args['start']) if request.args.get('start') else None
+    except ValueError:
+        raise ValueError('Start and end must be ISO 8601 timestamps')
+    if start is None:
+        start = end - DEFAULT_TIMESERIES_SPANS[interval]
+    if start > end:
+        raise ValueError('Start must not be after end')
+    
+    if (end - start) / BUCKET_RESOLUTIONS[interval] >= current_app.config['TIMESERIES_MAX_POINTS']:
+        raise ValueError('Range has too many points for this interval; use a coarser interval')
+    return interval, start, end
+
+def _naive_utc(value):
+    """Parse an ISO 8601 timestamp to naive UTC, taking one without an offset as UTC already"""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    return timestamp
+
+def _timeseries_response(points, interval, **fields):
+    return jsonify({
+        **fields,
+        'interval': interval,
+        'start': points[0][0].isoformat(),
+        'end': points[-1][0].isoformat(),
+        'total': sum(count for _, count in points),
+        'points': [{'timestamp': bucket.isoformat(), 'count': count} for bucket, count in points]
+    })
+
+@api_bp.route('/urls/<int:url_id>/timeseries', methods=['GET'])
+@login_required
+@use_replica
+def url_timeseries(url_id):
+    """API endpoint to get click counts for a URL bucketed by minute, hour or day"""
+    try:
+        short_url = db.get_or_404(ShortURL, url_id)
+        
+        # Make sure the URL belongs to the current user
+        if short_url.user_id != current_user.id:
+            url_operation_counter.labels(operation='timeseries', status='unauthorized').inc()
+            return jsonify(error='You do not have permission to view analytics for this URL'), 403
+        
+        try:
+            interval, start, end = _timeseries_range()
+        except ValueError as e:
+            url_operation_counter.labels(operation='timeseries', status='invalid').inc()
+            return jsonify(error=str(e)), 400
+        
+        points = ClickBucket.series(interval, start, end, short_url_id=url_id)
+        url_operation_counter.labels(operation='timeseries', status='success').inc()
+        return _timeseries_response(points, interval, url_id=url_id, short_code=short_url.short_code)
+    except Exception as e:
+        url_operation_counter.labels(operation='timeseries', status='error').inc()
+        return jsonify(error=str(e)), 500
+
+@api_bp.route('/timeseries', methods=['GET'])
+@login_required
+@use_replica
+def user_timeseries():
+    """API endpoint to get click counts across all of the user's URLs bucketed by minute, hour or day"""
+    try:
+        try:
+            interval, start, end = _timeseries_range()
+        except ValueError as e:
+            url_operation_counter.labels(operation='timeseries', status='invalid').inc()
+            return jsonify(error=str(e)), 400
+        
+        points = ClickBucket.series(interval, start, end, user_id=current_user.id)
+        url_operation_counter.labels(operation='timeseries', status='success').inc()
+        return _timeseries_response(points, interval)
+    except Exception as e:
+        url_operation_counter.labels(operation='timeseries', status='error').inc()
+        return jsonify(error=str(e)), 500
+
+@api_bp.route('/top-links', methods=['GET'])
+@login_required
+@use_replica
+def top_links():
+    """API endpoint to get the current user's most redirected links seen by this worker"""
+    try:
+        limit = min(request.args.get('limit', 20, type=int), redirect_top_codes.capacity)
+        top = redirect_top_codes.top()
+        
+        # Only report codes owned by the current user
+        owned = dict(db.session.execute(
+            db.select(ShortURL.short_code, ShortURL.id)
+            .filter_by(user_id=current_user.id)
+            .where(ShortURL.short_code.in_([code for code, _, _ in top]))
+        ).all()) if top else {}
+        
+        result = []
+        for short_code, count, error in top:
+            if short_code in owned:
+                result.append({
+                    'id': owned[short_code],
+                    'short_code': short_code,
+                    'estimated_visits': count,
+                    'max_overestimate': error
+                })
+                if len(result) >= limit:
+                    break
+        
+        url_operation_counter.labels(operation='top_links', status='success').inc()
+        return jsonify(links=result, tracked_redirects=redirect_top_codes.total)
+    except Exception as e:
+        url_operation_counter.labels(operation='top_links', status='error').inc()
+        return jsonify(error=str(e)), 500
+
 # Domain Modifier API Endpoints
 @api_bp.route('/domain-modifiers', methods=['GET'])
 @login_required
@@ -249,7 +504,10 @@ def create_domain_modifier():
         )
         
         db.session.add(modifier)
+        changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [domain])
         db.session.commit()
+        invalidate_links(changed_codes)
+        modifier_index.invalidate(current_user.id)
         
         url_operation_counter.labels(operation='create_modifier', status='success').inc()
         return jsonify({
@@ -278,6 +536,7 @@ def update_domain_modifier(modifier_id):
             return jsonify(error='You do not have permission to update this domain modifier'), 403
         
         data = request.json
+        previous_domain = modifier.domain
         
         if 'domain' in data:
             domain = data['domain'].lower()
@@ -299,7 +558,10 @@ def update_domain_modifier(modifier_id):
         if 'active' in data:
             modifier.active = bool(data['active'])
         
+        changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [previous_domain, modifier.domain])
         db.session.commit()
+        invalidate_links(changed_codes)
+        modifier_index.invalidate(current_user.id)
         
         url_operation_counter.labels(operation='update_modifier', status='success').inc()
         return jsonify({
@@ -328,7 +590,10 @@ def delete_domain_modifier(modifier_id):
             return jsonify(error='You do not have permission to delete this domain modifier'), 403
         
         db.session.delete(modifier)
+        changed_codes = ShortURL.refresh_redirect_urls(current_user.id, [modifier.domain])
         db.session.commit()
+        invalidate_links(changed_codes)
+        modifier_index.invalidate(current_user.id)
         
         url_operation_counter.labels(operation='delete_modifier', status='success').inc()
         return jsonify(message='Domain modifier deleted successfully'), 200
@@ -370,4 +635,37 @@ def test_domain_modifier():
         'original_url': url,
         'modified_url': modified_url,
         'query_params_added': query_params
-    })
\ No newline at end of file
+    })
+
+@api_bp.route('/domain-modifiers/dry-run', methods=['POST'])
+@login_required
+def dry_run_domain_modifiers():
+    """API endpoint to stream how a modifier set would rewrite the user's links or a list of URLs"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            proposed = parse_proposed_modifiers(data['modifiers']) if 'modifiers' in data else None
+        except ValueError as e:
+            url_operation_counter.labels(operation='dry_run_modifiers', status='validation_error').inc()
+            return jsonify(error=str(e)), 400
+        
+        urls = data.get('urls')
+        if urls is not None and not isinstance(urls, list):
+            url_operation_counter.labels(operation='dry_run_modifiers', status='bad_request').inc()
+            return jsonify(error='urls must be a list'), 400
+        
+        matcher = build_dry_run_matcher(current_user.id, proposed, include_existing=data.get('include_existing', True))
+        if urls is None:
+            diffs = iter_link_diffs(current_user.id, matcher, batch_size=current_app.config['TRANSFER_BATCH_SIZE'])
+        else:
+            diffs = iter_url_diffs(urls, matcher)
+        
+        url_operation_counter.labels(operation='dry_run_modifiers', status='success').inc()
+        return Response(
+            stream_with_context(dry_run_ndjson(diffs, include_unchanged=bool(data.get('include_unchanged')))),
+            mimetype='application/x-ndjson'
+        )
+    except Exception as e:
+        url_operation_counter.labels(operation='dry_run_modifiers', status='error').inc()
+        return jsonify(error=str(e)), 500
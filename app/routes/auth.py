@@ -4,6 +4,7 @@ from flask_login import login_user, logout_user, current_user
 import requests
 from app import db
 from app.models import User
+from app.utils.user_cache import invalidate_user
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -101,6 +102,9 @@ def github_callback():
         )
         db.session.add(user)
         db.session.commit()
+    else:
+        # A fresh login reloads the user rather than trusting a cached copy
+        invalidate_user(user.id)
     
     # Log the user in
     login_user(user)
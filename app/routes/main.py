@@ -1,8 +1,8 @@
-from flask import Blueprint, render_template, redirect, abort, current_app
-from app import db
-from app.models import ShortURL
+from flask import Blueprint, render_template, redirect, abort, current_app, request
+from app.utils.fast_redirect import MISSING_SHORT_CODE_KEY
+from app.utils.link_cache import get_link
 from app.utils.visitor_tracking import track_visit
-from app.utils.monitoring import redirect_counter
+from app.utils.monitoring import record_redirect
 
 main_bp = Blueprint('main', __name__)
 
@@ -14,13 +14,15 @@ def index():
 @main_bp.route('/<short_code>')
 def redirect_to_url(short_code):
     """Redirect a user to the target URL based on the short code"""
-    short_url = db.session.execute(
-        db.select(ShortURL).filter_by(short_code=short_code)
-    ).scalar_one_or_none()
+    # The redirect middleware may already have looked the code up
+    if request.environ.get(MISSING_SHORT_CODE_KEY) == short_code:
+        short_url = None
+    else:
+        short_url = get_link(short_code)
     
     if not short_url:
         # Log unsuccessful redirect attempt
-        redirect_counter.labels(status='not_found', short_code=short_code).inc()
+        record_redirect('not_found')
         return abort(404)
     
     try:
@@ -31,11 +33,11 @@ def redirect_to_url(short_code):
         target_url = short_url.get_redirect_url()
         
         # Log successful redirect
-        redirect_counter.labels(status='success', short_code=short_code).inc()
+        record_redirect('success', short_code)
         
         # Redirect to the target URL
         return redirect(target_url)
     except Exception as e:
         current_app.logger.error(f"Error redirecting {short_code}: {str(e)}")
-        redirect_counter.labels(status='error', short_code=short_code).inc()
+        record_redirect('error')
         return abort(500)
\ No newline at end of file
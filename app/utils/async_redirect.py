@@ -0,0 +1,326 @@
+import asyncio
+import io
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+from app import db
+from app.utils.fast_redirect import (
+    RedirectFastPath, MISSING_SHORT_CODE_KEY, reserved_segments, redirect_short_code, redirect_response
+)
+from app.utils.link_cache import link_cache, load_link, shared_link_cache
+from app.utils.monitoring import record_redirect, health_status, readiness_status, LIVENESS_STATUS
+from app.utils.visit_buffer import visit_buffer, RawVisit
+
+logger = logging.getLogger(__name__)
+
+# Chunks a streaming Flask response may buffer ahead of a slow client
+WSGI_QUEUE_SIZE = 16
+
+class AsyncRedirectServer:
+    """
+    ASGI app that serves redirects and health checks on an asyncio event loop.
+
+    Cached links with a materialized redirect URL are answered on the loop
+    without touching a thread, so thousands of redirects can be in flight per
+    process. Cache misses and health checks run the usual synchronous lookups
+    in a small thread pool sized like the database pool, and visits go to the
+    write-behind buffer as raw request values, whose user agent and location
+    its flusher thread parses. Every other request is
+    handed to the Flask app, which runs in its own thread pool. With a shared
+    link cache, its invalidations are polled by a background task rather than
+    on the redirect path.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        wsgi_app = flask_app.wsgi_app
+        # The redirect work is done here, so skip the WSGI fast path for delegated requests
+        if isinstance(wsgi_app, RedirectFastPath):
+            wsgi_app = wsgi_app.wsgi_app
+        self.wsgi_app = wsgi_app
+        self.reserved = reserved_segments(flask_app)
+        self._db_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASGI_DB_THREADS'], thread_name_prefix='asgi-db'
+        )
+        self._wsgi_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASGI_WSGI_THREADS'], thread_name_prefix='asgi-wsgi'
+        )
+        self._sync_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._ensure_sync_task()
+
+        method = scope['method']
+        path = scope['path']
+        if method in ('GET', 'HEAD') and path in ('/health/', '/health/ready', '/health/live'):
+            await self._health(path, method, send)
+            return
+
+        short_code = redirect_short_code(method, path, self.reserved)
+        missing = None
+        if short_code is not None:
+            if await self._redirect(short_code, scope, send):
+                return
+            missing = short_code
+        await self._call_wsgi(scope, receive, send, missing)
+
+    def close(self):
+        """Stop the thread pools once in-flight work is done"""
+        self._db_executor.shutdown()
+        self._wsgi_executor.shutdown()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._sync_task is not None:
+                    self._sync_task.cancel()
+                await asyncio.get_running_loop().run_in_executor(None, self.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _ensure_sync_task(self):
+        """Poll the shared link cache's invalidations in the background instead of on the loop"""
+        if not shared_link_cache.enabled:
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_invalidations())
+
+    async def _sync_invalidations(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(self._db_executor, shared_link_cache.sync)
+            await asyncio.sleep(shared_link_cache.sync_interval)
+
+    async def _run_db(self, func, *args):
+        """Run a synchronous database function in the lookup thread pool"""
+        def run():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, run)
+
+    async def _redirect(self, short_code, scope, send):
+        """Answer a redirect, returning False if the code is unknown and Flask should handle it"""
+        try:
+            link = link_cache.get(short_code)
+            if link is not None and link.redirect_url:
+                target_url = link.redirect_url
+            else:
+                link, target_url = await self._run_db(_resolve, short_code, link)
+                if link is None:
+                    # Let Flask record the miss and render its 404 page
+                    return False
+
+            self._record_visit(link, scope)
+            location, body = redirect_response(target_url)
+        except Exception as e:
+            self.flask_app.logger.error(f"Error redirecting {short_code}: {str(e)}")
+            record_redirect('error')
+            await _send_response(send, 500, 'text/plain; charset=utf-8', b'Internal Server Error')
+            return True
+
+        record_redirect('success', short_code)
+        await _send_response(
+            send, 302, 'text/html; charset=utf-8', body,
+            [(b'location', location.encode('latin-1'))], head=scope['method'] == 'HEAD'
+        )
+        return True
+
+    def _record_visit(self, link, scope):
+        headers = _header_values(scope, (b'user-agent', b'referer'))
+        client = scope.get('client')
+        visit = RawVisit(
+            link, client[0] if client else None,
+            headers.get(b'user-agent', ''), headers.get(b'referer'), datetime.now(UTC)
+        )
+        if visit_buffer.enabled:
+            # A bounded queue: when it is full the visit is dropped and counted
+            visit_buffer.enqueue(visit)
+        else:
+            # Without the buffer, enqueue parses and writes the visit inline
+            self._db_executor.submit(visit_buffer.enqueue, visit)
+
+    async def _health(self, path, method, send):
+        if path == '/health/live':
+            body, status_code = LIVENESS_STATUS, 200
+        elif path == '/health/ready':
+            body, status_code = await self._run_db(readiness_status, db)
+        else:
+            body, status_code = await self._run_db(health_status, db)
+        await _send_response(
+            send, status_code, 'application/json', (json.dumps(body) + '\n').encode('utf-8'), head=method == 'HEAD'
+        )
+
+    async def _call_wsgi(self, scope, receive, send, missing=None):
+        """Serve a request with the Flask app in a worker thread, streaming the body in and the response back"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=WSGI_QUEUE_SIZE)
+        abandoned = False
+
+        def put(item):
+            if abandoned:
+                raise OSError('Client disconnected')
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put(('start', status, headers))
+            return lambda data: put(('body', data))
+
+        def run():
+            try:
+                environ = _wsgi_environ(scope, _RequestBody(receive, loop))
+                if missing is not None:
+                    # Already looked up and not found
+                    environ[MISSING_SHORT_CODE_KEY] = missing
+                iterable = self.wsgi_app(environ, start_response)
+                try:
+                    for chunk in iterable:
+                        if chunk:
+                            put(('body', chunk))
+                finally:
+                    if hasattr(iterable, 'close'):
+                        iterable.close()
+            except Exception as e:
+                if not abandoned:
+                    put(('error', e))
+                return
+            put(('end',))
+
+        future = loop.run_in_executor(self._wsgi_executor, run)
+        start = None
+        started = False
+        try:
+            while True:
+                item = await chunks.get()
+                if item[0] == 'start':
+                    start = item
+                    continue
+                if item[0] == 'error':
+                    logger.error('Error serving %s', scope['path'], exc_info=item[1])
+                    if not started:
+                        await _send_response(send, 500, 'text/plain; charset=utf-8', b'Internal Server Error')
+                    else:
+                        await send({'type': 'http.response.body', 'body': b''})
+                    break
+                if not started:
+                    # Headers go out with the first body chunk, as in WSGI
+                    _, status, headers = start
+                    await send({
+                        'type': 'http.response.start',
+                        'status': int(status.split(' ', 1)[0]),
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+                    })
+                    started = True
+                if item[0] == 'end':
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': bytes(item[1]), 'more_body': True})
+        finally:
+            if not future.done():
+                # Unblock the worker thread if the client went away mid-response
+                abandoned = True
+                while not future.done():
+                    try:
+                        chunks.get_nowait()
+                    except asyncio.QueueEmpty:
+                        await asyncio.sleep(0.01)
+
+class _RequestBody(io.RawIOBase):
+    """
+    Request body for a WSGI app running in a worker thread, pulled from the
+    ASGI receive channel one message at a time as the app reads it, so large
+    uploads never sit in memory whole.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._pending = memoryview(b'')
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._finished:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise OSError('Client disconnected')
+            self._pending = memoryview(message.get('body', b''))
+            self._finished = not message.get('more_body', False)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def _resolve(short_code, link):
+    """Load a link that missed the cache and resolve its redirect URL"""
+    if link is None:
+        link = load_link(short_code)
+        if link is None:
+            return None, None
+    return link, link.get_redirect_url()
+
+def _header_values(scope, names):
+    """First value of each of the named request headers"""
+    values = {}
+    for name, value in scope['headers']:
+        if name in names and name not in values:
+            values[name] = value.decode('latin-1')
+    return values
+
+async def _send_response(send, status_code, content_type, body, headers=(), head=False):
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+def _wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP request whose body is read from a _RequestBody"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI carries paths as UTF-8 bytes decoded as latin-1
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        # BufferedReader serializes reads and adds readline on top of the raw stream
+        'wsgi.input': io.BufferedReader(body),
+        # The stream ends with the body, so chunked uploads can be read without a length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from app.utils.monitoring import cache_request_counter, cache_eviction_counter
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with an optional per-entry TTL.
+
+    Lookups and evictions are reported to Prometheus under the cache's name.
+    """
+
+    def __init__(self, name, maxsize=10000, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        """Change the size and TTL limits, dropping all cached entries"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    cache_request_counter.labels(cache=self.name, result='hit').inc()
+                    return value
+                # Expired entries are dropped on read
+                del self._data[key]
+                cache_eviction_counter.labels(cache=self.name, reason='expired').inc()
+        cache_request_counter.labels(cache=self.name, result='miss').inc()
+        return default
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries if full"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                cache_eviction_counter.labels(cache=self.name, reason='size').inc()
+
+    def delete(self, key):
+        """Remove key from the cache if present"""
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                cache_eviction_counter.labels(cache=self.name, reason='invalidated').inc()
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
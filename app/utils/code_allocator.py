@@ -0,0 +1,141 @@
+import hashlib
+import os
+import string
+import threading
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.code_sequence import CodeSequence
+
+ALPHABET = string.ascii_uppercase + string.digits
+BASE = len(ALPHABET)
+
+SCRAMBLE_ROUND_COUNT = 3
+
+def scramble_rounds(secret):
+    """
+    Derive the scramble rounds from a secret, so codes can't be mapped back
+    to sequence numbers without it.
+    
+    Each round is an affine map followed by a rotation of the base-36 digits.
+    Both are bijections on [0, 36**length) as long as the multipliers share no
+    factor with 36, so the composition is too.
+    """
+    rounds = []
+    for i in range(SCRAMBLE_ROUND_COUNT):
+        digest = hashlib.blake2b(secret.encode('utf-8'), digest_size=24, person=f'scramble{i}'.encode()).digest()
+        multiplier = int.from_bytes(digest[:8], 'little') | 1
+        if multiplier % 3 == 0:
+            multiplier += 2
+        increment = int.from_bytes(digest[8:16], 'little')
+        rotation = int.from_bytes(digest[16:], 'little') % 7 + 1
+        rounds.append((multiplier, increment, rotation))
+    return tuple(rounds)
+
+def _scramble(value, length, rounds):
+    space = BASE ** length
+    for multiplier, increment, rotation in rounds:
+        value = (value * multiplier + increment) % space
+        rotation %= length
+        if rotation:
+            low = BASE ** rotation
+            value = (value % low) * (BASE ** (length - rotation)) + value // low
+    return value
+
+def encode_sequence_number(number, rounds, min_length=6):
+    """
+    Map a sequence number to a short code.
+    
+    Numbers fill every code of min_length first and then move on to longer
+    codes, and within each length they are scrambled with rounds from
+    scramble_rounds so consecutive numbers don't produce similar-looking
+    codes. Distinct numbers always give distinct codes.
+    """
+    length = min_length
+    while number >= BASE ** length:
+        number -= BASE ** length
+        length += 1
+    
+    value = _scramble(number, length, rounds)
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+class CodeAllocator:
+    """
+    Hands out generated short codes without checking the database for each one.
+    
+    Each process reserves a block of sequence numbers with a single atomic
+    UPDATE of the shared counter, then encodes numbers from its block locally.
+    """
+    
+    sequence_name = 'short_code'
+    
+    def __init__(self):
+        self.block_size = 100
+        self.min_length = 6
+        self.rounds = scramble_rounds('')
+        self._next = 0
+        self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure the allocator and discard any reserved block"""
+        with self._lock:
+            self.block_size = app.config['SHORT_CODE_BLOCK_SIZE']
+            self.min_length = app.config['SHORT_CODE_LENGTH']
+            self.rounds = scramble_rounds(app.config['SHORT_CODE_SECRET'])
+            self._next = self._end = 0
+    
+    def next_code(self):
+        """Allocate a single short code"""
+        return self.allocate(1)[0]
+    
+    def allocate(self, count):
+        """Allocate count short codes"""
+        numbers = []
+        with self._lock:
+            # A forked worker must not reuse its parent's block
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(numbers)))
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        
+        return [encode_sequence_number(number, self.rounds, self.min_length) for number in numbers]
+    
+    def _reserve(self, size):
+        """Reserve a block of size sequence numbers, returning its (start, end)"""
+        table = CodeSequence.__table__
+        
+        # Use a separate connection so the reservation commits independently
+        # of whatever the caller's session is doing
+        while True:
+            with db.engine.begin() as conn:
+                updated = conn.execute(
+                    table.update()
+                    .where(table.c.name == self.sequence_name)
+                    .values(next_value=table.c.next_value + size)
+                )
+                if updated.rowcount:
+                    end = conn.execute(
+                        db.select(table.c.next_value).where(table.c.name == self.sequence_name)
+                    ).scalar_one()
+                    return end - size, end
+            
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert().values(name=self.sequence_name, next_value=size))
+                return 0, size
+            except IntegrityError:
+                # Another process created the counter first; reserve from it
+                continue
+
+code_allocator = CodeAllocator()
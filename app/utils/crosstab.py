@@ -0,0 +1,168 @@
+import csv
+import json
+from urllib.parse import urlparse
+from app import db
+from app.models import ShortURL, Visit
+from app.utils.visit_archive import iter_archived_visits
+
+# Cross-tab dimension -> visit column it is derived from
+CROSSTAB_DIMENSIONS = {
+    'link': 'short_url_id',
+    'country': 'country_name',
+    'city': 'city',
+    'device': 'device_type',
+    'browser': 'browser',
+    'os': 'operating_system',
+    'referrer_host': 'referrer',
+    'month': 'timestamp',
+    'day': 'timestamp',
+    'hour': 'timestamp'
+}
+
+# NumPy datetime unit each time dimension is truncated to
+_TIME_UNITS = {'month': 'M', 'day': 'D', 'hour': 'h'}
+
+def _numpy():
+    """Import NumPy on first use so the web app doesn't depend on it"""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError('Cross-tab reports require NumPy; install it with "pip install numpy"')
+    return numpy
+
+def _referrer_host(referrer):
+    if not referrer:
+        return ''
+    return urlparse(referrer).hostname or ''
+
+class CrossTab:
+    """
+    Visit counts grouped by any combination of dimensions.
+
+    Visits are fed in as column chunks. Each dimension is dictionary-encoded
+    into integer codes, and the chunk is grouped with a single vectorized
+    unique over the stacked codes. Memory is bounded by the chunk size plus
+    the number of distinct dimension values and combinations, however many
+    visits are processed.
+    """
+
+    def __init__(self, dimensions):
+        unknown = [name for name in dimensions if name not in CROSSTAB_DIMENSIONS]
+        if unknown or not dimensions:
+            raise ValueError(f'Dimensions must be among: {", ".join(CROSSTAB_DIMENSIONS)}')
+        self.np = _numpy()
+        self.dimensions = list(dimensions)
+        self.total = 0
+        self._values = {name: [] for name in self.dimensions}
+        self._codes = {name: {} for name in self.dimensions}
+        self._counts = {}
+
+    @property
+    def columns(self):
+        """Visit columns needed to compute the dimensions"""
+        return sorted({CROSSTAB_DIMENSIONS[name] for name in self.dimensions})
+
+    def add_chunk(self, columns):
+        """Add a chunk of visits given as a dict of equal-length column lists"""
+        np = self.np
+        size = len(next(iter(columns.values())))
+        if not size:
+            return
+        codes = np.empty((size, len(self.dimensions)), dtype=np.int64)
+        for i, name in enumerate(self.dimensions):
+            codes[:, i] = self._encode(name, columns[CROSSTAB_DIMENSIONS[name]])
+
+        combinations, counts = np.unique(codes, axis=0, return_counts=True)
+        for key, count in zip(map(tuple, combinations.tolist()), counts.tolist()):
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.total += size
+
+    def _encode(self, name, values):
+        """Map a column of raw values to this dimension's integer codes"""
+        np = self.np
+        if name in _TIME_UNITS:
+            # Unparseable or missing timestamps become NaT and sort into their own group
+            array = np.array(values, dtype='datetime64[us]').astype(f'datetime64[{_TIME_UNITS[name]}]')
+            uniques, inverse = np.unique(array, return_inverse=True)
+            labels = [str(value) if not np.isnat(value) else '' for value in uniques]
+        else:
+            array = np.array(['' if value is None else str(value) for value in values], dtype=object)
+            uniques, inverse = np.unique(array, return_inverse=True)
+            labels = uniques.tolist()
+            if name == 'referrer_host':
+                labels = [_referrer_host(label) for label in labels]
+
+        # Only the distinct values of the chunk go through Python
+        lookup = self._codes[name]
+        known = self._values[name]
+        mapping = np.empty(len(labels), dtype=np.int64)
+        for i, label in enumerate(labels):
+            code = lookup.get(label)
+            if code is None:
+                code = lookup[label] = len(known)
+                known.append(label)
+            mapping[i] = code
+        return mapping[inverse.reshape(-1)]
+
+    def results(self):
+        """Return (values, count) pairs, most visits first"""
+        rows = [
+            (tuple(self._values[name][code] for name, code in zip(self.dimensions, key)), count)
+            for key, count in self._counts.items()
+        ]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+def iter_database_chunks(columns, chunk_size=100000, user_id=None, short_url_id=None, start=None, end=None):
+    """Read visit columns from the database in id order, one chunk of column lists at a time"""
+    query = db.select(Visit.id, *(getattr(Visit, column) for column in columns))
+    if user_id is not None:
+        query = query.join(ShortURL, ShortURL.id == Visit.short_url_id).filter(ShortURL.user_id == user_id)
+    if short_url_id is not None:
+        query = query.filter(Visit.short_url_id == short_url_id)
+    if start is not None:
+        query = query.filter(Visit.timestamp >= start)
+    if end is not None:
+        query = query.filter(Visit.timestamp < end)
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            query.where(Visit.id > last_id).order_by(Visit.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield {column: [row[i + 1] for row in rows] for i, column in enumerate(columns)}
+
+def iter_archive_chunks(archive_dir, columns, chunk_size=100000, link_ids=None, start=None, end=None):
+    """Read visit columns from archive files, one chunk of column lists at a time"""
+    chunk = {column: [] for column in columns}
+    size = 0
+    for short_url_id in (link_ids if link_ids is not None else [None]):
+        for row in iter_archived_visits(archive_dir, short_url_id=short_url_id, start=start, end=end):
+            for column in columns:
+                chunk[column].append(row[column])
+            size += 1
+            if size >= chunk_size:
+                yield chunk
+                chunk = {column: [] for column in columns}
+                size = 0
+    if size:
+        yield chunk
+
+def write_crosstab_csv(crosstab, f):
+    """Write cross-tab results as CSV with one column per dimension plus visits"""
+    writer = csv.writer(f)
+    writer.writerow(crosstab.dimensions + ['visits'])
+    for values, count in crosstab.results():
+        writer.writerow(list(values) + [count])
+
+def write_crosstab_json(crosstab, f):
+    """Write cross-tab results as a JSON document"""
+    json.dump({
+        'dimensions': crosstab.dimensions,
+        'total_visits': crosstab.total,
+        'rows': [dict(zip(crosstab.dimensions, values), visits=count) for values, count in crosstab.results()]
+    }, f, indent=2)
+    f.write('\n')
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from app.utils.monitoring import db_replica_fallback_counter, db_pool_engines, db_query_counter
+
+logger = logging.getLogger(__name__)
+
+# Statement types counted separately by the query metrics; the rest count as "other"
+COUNTED_STATEMENTS = {'select', 'insert', 'update', 'delete'}
+
+def pool_options(uri, workers=1, threads=1, max_connections=None, recycle=280, timeout=30, pre_ping=True):
+    """
+    Engine options for a database URI, sized for one gunicorn worker process.
+
+    Each worker has its own pool, so it needs a connection per request thread
+    plus one for background threads such as the visit buffer flusher, with
+    some overflow for bursts. When max_connections (the database's budget for
+    this app) is given, the per-worker pools are shrunk to fit it.
+    """
+    if uri.startswith('sqlite'):
+        # SQLite needs no pooling limits, and in-memory databases use a static pool
+        return {}
+
+    pool_size = threads + 1
+    max_overflow = threads
+    if max_connections:
+        per_worker = max(1, max_connections // max(workers, 1))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        # Recycle before MariaDB's wait_timeout and check connections on checkout
+        'pool_recycle': recycle,
+        'pool_timeout': timeout,
+        'pool_pre_ping': pre_ping
+    }
+
+class ReplicaRouter:
+    """
+    Decides whether reads can go to the read replica.
+
+    The replica engine is kept outside Flask-SQLAlchemy's binds, so schema
+    management never touches it. The replica is probed at most once per
+    check interval; while it is unreachable, or after it drops a connection,
+    reads fall back to the primary for the retry interval.
+    """
+
+    def __init__(self):
+        self._engine = None
+        self._last_check = 0.0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.check_interval = 5.0
+        self.retry_interval = 30.0
+
+    @property
+    def enabled(self):
+        return self._engine is not None
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def init_app(self, app, db):
+        """Create the replica engine, if configured, and export every engine's pool and query counts"""
+        self.check_interval = app.config['DB_REPLICA_CHECK_INTERVAL']
+        self.retry_interval = app.config['DB_REPLICA_RETRY_INTERVAL']
+        self._last_check = self._down_until = 0.0
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+        if app.config['DB_REPLICA_URL']:
+            self._engine = create_engine(app.config['DB_REPLICA_URL'], **app.config['DB_REPLICA_ENGINE_OPTIONS'])
+            event.listen(self._engine, 'handle_error', self._on_error)
+
+        db_pool_engines.clear()
+        with app.app_context():
+            db_pool_engines['primary'] = db.engine
+        if self._engine is not None:
+            db_pool_engines['replica'] = self._engine
+        for engine in db_pool_engines.values():
+            if not event.contains(engine, 'before_cursor_execute', self._count_query):
+                event.listen(engine, 'before_cursor_execute', self._count_query)
+
+    def read_engine(self):
+        """Return the replica engine if it is usable, otherwise None"""
+        engine = self._engine
+        if engine is None:
+            return None
+
+        now = time.monotonic()
+        if now < self._down_until:
+            db_replica_fallback_counter.labels(reason='unavailable').inc()
+            return None
+        if now - self._last_check >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                with engine.connect() as connection:
+                    connection.exec_driver_sql('SELECT 1')
+                self._last_check = now
+            except Exception:
+                logger.warning('Read replica is unreachable, reading from the primary', exc_info=True)
+                self._down_until = now + self.retry_interval
+                db_replica_fallback_counter.labels(reason='unavailable').inc()
+                return None
+            finally:
+                self._lock.release()
+        return engine
+
+    def _count_query(self, conn, cursor, statement, parameters, context, executemany):
+        keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        db_query_counter.labels(
+            bind='replica' if conn.engine is self._engine else 'primary',
+            statement=keyword if keyword in COUNTED_STATEMENTS else 'other'
+        ).inc()
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self._down_until = time.monotonic() + self.retry_interval
+
+replica_router = ReplicaRouter()
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the read replica while replica reads are enabled"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get('use_replica')
+            and not self._flushing
+            and getattr(clause, 'is_select', False)
+        ):
+            engine = replica_router.read_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@contextmanager
+def replica_reads(session, enabled=True):
+    """Route the session's SELECTs to the read replica within the block"""
+    previous = session.info.get('use_replica', False)
+    session.info['use_replica'] = enabled
+    try:
+        yield
+    finally:
+        session.info['use_replica'] = previous
+
+def use_replica(view):
+    """Serve a read-only view's queries from the read replica when one is configured"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        from app import db
+        with replica_reads(db.session):
+            return view(*args, **kwargs)
+    return wrapped
@@ -0,0 +1,99 @@
+from html import escape
+from werkzeug.urls import iri_to_uri
+from app.utils.link_cache import get_link
+from app.utils.visitor_tracking import build_visit
+from app.utils.visit_buffer import visit_buffer
+from app.utils.monitoring import record_redirect
+
+# Environ key naming a short code already looked up and not found, so the
+# Flask view can render its 404 without a second lookup
+MISSING_SHORT_CODE_KEY = 'getshort.missing_short_code'
+
+def reserved_segments(flask_app):
+    """First path segments that belong to other routes and must reach Flask"""
+    reserved = set()
+    for rule in flask_app.url_map.iter_rules():
+        segment = rule.rule.lstrip('/').split('/', 1)[0]
+        if '<' not in segment:
+            reserved.add(segment)
+    return reserved
+
+def redirect_short_code(method, path, reserved):
+    """Return the short code a request asks to be redirected from, or None if it isn't a redirect"""
+    if method not in ('GET', 'HEAD') or not path.isascii():
+        return None
+    short_code = path[1:]
+    if not short_code or '/' in short_code or short_code in reserved:
+        return None
+    return short_code
+
+def redirect_response(target_url):
+    """Location header and HTML body of a redirect, as Flask's redirect() builds them"""
+    location = iri_to_uri(target_url)
+    body = (
+        f'<!doctype html>\n<title>Redirecting...</title>\n<a href="{escape(location)}">{escape(location)}</a>\n'
+    ).encode('utf-8')
+    return location, body
+
+class RedirectFastPath:
+    """
+    WSGI middleware that answers short code redirects before Flask builds a
+    request context.
+
+    A GET or HEAD for /<short_code> only needs the code lookup, the visit
+    enqueue and a 302, so it skips opening and saving the session cookie,
+    Flask-Login's remember-cookie handling and the before/after request
+    hooks. Everything else is passed to the wrapped Flask WSGI app unchanged,
+    including unknown codes, so 404 pages still come from Flask. Per-request
+    Flask metrics don't see fast-path redirects; the redirect counters still do.
+    """
+
+    def __init__(self, flask_app, wsgi_app):
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+        self._reserved = None
+
+    def reserved_segments(self):
+        if self._reserved is None:
+            self._reserved = reserved_segments(self.flask_app)
+        return self._reserved
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD')
+        short_code = redirect_short_code(method, environ.get('PATH_INFO', ''), self.reserved_segments())
+        if short_code is None:
+            return self.wsgi_app(environ, start_response)
+
+        with self.flask_app.app_context():
+            link = get_link(short_code)
+            if link is None:
+                # Let Flask record the miss and render its 404 page
+                environ[MISSING_SHORT_CODE_KEY] = short_code
+                return self.wsgi_app(environ, start_response)
+
+            try:
+                visit_buffer.enqueue(build_visit(
+                    link,
+                    environ.get('REMOTE_ADDR'),
+                    environ.get('HTTP_USER_AGENT', ''),
+                    environ.get('HTTP_REFERER')
+                ))
+                location, body = redirect_response(link.get_redirect_url())
+            except Exception as e:
+                self.flask_app.logger.error(f"Error redirecting {short_code}: {str(e)}")
+                record_redirect('error')
+                body = b'Internal Server Error'
+                start_response('500 INTERNAL SERVER ERROR', [
+                    ('Content-Type', 'text/plain; charset=utf-8'),
+                    ('Content-Length', str(len(body)))
+                ])
+                return [body]
+
+            record_redirect('success', short_code)
+
+        start_response('302 FOUND', [
+            ('Content-Type', 'text/html; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+            ('Location', location)
+        ])
+        return [] if method == 'HEAD' else [body]
@@ -0,0 +1,69 @@
+import heapq
+import threading
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters sketch.
+
+    Tracks at most `capacity` keys. When a new key arrives and the sketch is
+    full, the key with the smallest count is replaced and the newcomer
+    inherits that count as its error bound, so memory stays fixed however
+    many distinct keys are seen. Any key whose true count exceeds
+    total / capacity is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # Min-heap with one (count, key) entry per tracked key; entries go
+        # stale as counts grow and are refreshed lazily when they reach the top
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def add(self, key, count=1):
+        """Record count occurrences of key"""
+        with self._lock:
+            self.total += count
+            if key in self._counts:
+                self._counts[key] += count
+                return
+
+            if len(self._counts) < self.capacity:
+                self._counts[key] = count
+                self._errors[key] = 0
+                heapq.heappush(self._heap, (count, key))
+                return
+
+            # Find the current minimum, refreshing stale heap entries on the way
+            while True:
+                min_count, min_key = self._heap[0]
+                current = self._counts[min_key]
+                if current == min_count:
+                    break
+                heapq.heapreplace(self._heap, (current, min_key))
+
+            heapq.heappop(self._heap)
+            del self._counts[min_key]
+            del self._errors[min_key]
+            self._counts[key] = min_count + count
+            self._errors[key] = min_count
+            heapq.heappush(self._heap, (min_count + count, key))
+
+    def top(self, n=None):
+        """Return up to n (key, estimated_count, error) tuples, highest count first"""
+        with self._lock:
+            items = [(key, count, self._errors[key]) for key, count in self._counts.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items if n is None else items[:n]
+
+    def reset(self, capacity=None):
+        """Forget all tracked keys"""
+        with self._lock:
+            if capacity is not None:
+                self.capacity = capacity
+            self.total = 0
+            self._counts = {}
+            self._errors = {}
+            self._heap = []
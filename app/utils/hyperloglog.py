@@ -0,0 +1,63 @@
+import hashlib
+import math
+import zlib
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch.
+
+    Keeps 2**precision one-byte registers holding the longest run of leading
+    zero bits seen among the hashes routed to each register. Sketches with the
+    same precision merge by taking the register-wise maximum, so per-day or
+    per-link sketches can be combined into estimates for any union of them.
+    The standard error is about 1.04 / sqrt(2**precision).
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.num_registers)
+
+    @staticmethod
+    def hash(key):
+        """64-bit hash of a string key"""
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add(self, key):
+        """Add a string key to the sketch"""
+        value = self.hash(key)
+        index = value >> (64 - self.precision)
+        remainder_bits = 64 - self.precision
+        remainder = value & ((1 << remainder_bits) - 1)
+        rank = remainder_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimate the number of distinct keys added"""
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """Serialize the registers; sketches of small sets compress to a few bytes"""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        registers = zlib.decompress(data)
+        if len(registers) != 1 << precision:
+            raise ValueError('Serialized sketch does not match the precision')
+        return cls(precision, registers)
@@ -0,0 +1,200 @@
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from app import db
+from app.models import ShortURL
+from app.utils.caching import LRUCache
+from app.utils.db_routing import replica_reads, replica_router
+from app.utils.monitoring import db_replica_fallback_counter, cache_request_counter, shared_cache_error_counter
+from app.utils.shared_cache import create_backend
+from app.utils.short_code_filter import short_code_filter
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of short_code -> CachedLink for the redirect hot path
+link_cache = LRUCache('link')
+
+_LINK_FIELDS = ['id', 'short_code', 'target_url', 'apply_modifiers', 'user_id', 'redirect_url']
+
+class CachedLink(namedtuple('CachedLink', _LINK_FIELDS)):
+    """Session-independent snapshot of the ShortURL columns needed to serve a redirect"""
+    __slots__ = ()
+
+    # Same resolution rules as the model, including links saved before
+    # redirect URLs were materialized
+    get_redirect_url = ShortURL.get_redirect_url
+
+class SharedLinkCache:
+    """
+    Second link cache tier shared by every worker, and the invalidation
+    broadcast that keeps each worker's link_cache in step with it.
+
+    A link loaded by one worker is found here by the others instead of in the
+    database. Edits and deletes are recorded in the backend's invalidation
+    log, which each worker polls at most once per sync interval to drop its
+    own copies. Backend errors are logged and treated as misses, so an
+    unreachable cache server only costs database lookups.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = None
+        self.sync_interval = 1.0
+        self._seen = 0
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def configure(self, backend, ttl=None, sync_interval=1.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._synced_at = 0.0
+        self._seen = self._call('generation', default=0) if backend is not None else 0
+
+    def get(self, short_code):
+        """Return the shared CachedLink for a short code, or None"""
+        if self.backend is None:
+            return None
+        link = self._call('get', short_code, decode=_decode_link)
+        cache_request_counter.labels(cache='link_shared', result='miss' if link is None else 'hit').inc()
+        return link
+
+    def generation(self):
+        """Generation to pass to set() for a link about to be loaded"""
+        if self.backend is None:
+            return 0
+        return self._call('generation')
+
+    def set(self, short_code, link, generation):
+        """Share a loaded link, returning False if it was invalidated while it was loading"""
+        if self.backend is None or generation is None:
+            # Nothing to check against; the local TTL bounds staleness as before
+            return True
+        return self._call('set', short_code, json.dumps(link), generation, self.ttl, default=True)
+
+    def invalidate(self, short_codes):
+        """Drop short codes from the shared tier and tell the other workers to drop theirs"""
+        if self.backend is not None and short_codes:
+            self._call('invalidate', short_codes)
+
+    def sync(self, force=False):
+        """Drop this worker's copies of links invalidated elsewhere since the last sync"""
+        if self.backend is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        # One thread syncs at a time; the others carry on with the cache as it is
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced_at = now
+            result = self._call('invalidations_since', self._seen)
+            if result is None:
+                return
+            generation, short_codes = result
+            if short_codes is None:
+                # Too far behind to know what changed
+                link_cache.clear()
+            else:
+                for short_code in short_codes:
+                    link_cache.delete(short_code)
+            self._seen = generation
+        finally:
+            self._sync_lock.release()
+
+    def _call(self, operation, *args, default=None, decode=None):
+        try:
+            result = getattr(self.backend, operation)(*args)
+            if decode is not None and result is not None:
+                # A value that can't be decoded is a miss like any other backend error
+                result = decode(result)
+            return result
+        except Exception:
+            logger.warning('Shared link cache %s failed', operation, exc_info=True)
+            shared_cache_error_counter.labels(operation=operation).inc()
+            return default
+
+def _decode_link(value):
+    return CachedLink(*json.loads(value))
+
+shared_link_cache = SharedLinkCache()
+
+def init_link_cache(app):
+    """Configure the link cache and the optional shared tier from the app config"""
+    # Without a shared tier, entries in other workers can't be invalidated
+    # from here, so the TTL bounds how long they may serve a stale target
+    link_cache.configure(
+        maxsize=app.config['LINK_CACHE_SIZE'],
+        ttl=app.config['LINK_CACHE_TTL'] or None
+    )
+    url = app.config['LINK_CACHE_SHARED_URL']
+    shared_link_cache.configure(
+        create_backend(url) if url else None,
+        ttl=app.config['LINK_CACHE_SHARED_TTL'] or None,
+        sync_interval=app.config['LINK_CACHE_SYNC_INTERVAL']
+    )
+
+def get_link(short_code):
+    """Resolve a short code to a CachedLink, consulting the caches before the database"""
+    shared_link_cache.sync()
+    link = link_cache.get(short_code)
+    if link is not None:
+        return link
+    return load_link(short_code)
+
+def load_link(short_code):
+    """Look up a short code that missed the local cache, caching the CachedLink if it exists"""
+    # Most unknown codes are rejected here without a database round trip
+    if not short_code_filter.might_exist(short_code):
+        return None
+
+    link = shared_link_cache.get(short_code)
+    if link is not None:
+        link_cache.set(short_code, link)
+        return link
+
+    generation = shared_link_cache.generation()
+    query = (
+        db.select(*(getattr(ShortURL, field) for field in CachedLink._fields))
+        .filter_by(short_code=short_code)
+    )
+    with replica_reads(db.session):
+        row = db.session.execute(query).first()
+    from_replica = row is not None and replica_router.enabled
+    if row is None and replica_router.enabled:
+        # The link may be too new to have reached the replica
+        row = db.session.execute(query).first()
+        if row is not None:
+            db_replica_fallback_counter.labels(reason='missing_row').inc()
+
+    if row is None:
+        short_code_filter.record_false_positive()
+        return None
+
+    link = CachedLink(*row)
+    if from_replica:
+        # A lagging replica can return a row edited since its invalidation,
+        # so only this worker caches it, for at most the local TTL
+        link_cache.set(short_code, link)
+    elif shared_link_cache.set(short_code, link, generation):
+        # A link invalidated while it was loading is served but not cached
+        link_cache.set(short_code, link)
+    return link
+
+def invalidate_link(short_code):
+    """Drop a short code from the caches after its link has been edited or deleted"""
+    invalidate_links([short_code])
+
+def invalidate_links(short_codes):
+    """Drop several short codes from the caches"""
+    short_codes = list(short_codes)
+    for short_code in short_codes:
+        link_cache.delete(short_code)
+    shared_link_cache.invalidate(short_codes)
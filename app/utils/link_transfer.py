@@ -0,0 +1,186 @@
+import csv
+import io
+import json
+from datetime import datetime
+import validators
+from app import db
+from app.models import ShortURL, DomainModifier
+from app.utils.link_cache import invalidate_links
+
+EXPORT_FIELDS = ['short_code', 'target_url', 'apply_modifiers', 'created_at', 'visit_count']
+
+def iter_export_rows(user_id, batch_size=1000):
+    """Yield a dict per link owned by the user, streaming rows from a server-side cursor"""
+    rows = db.session.execute(
+        db.select(
+            ShortURL.short_code,
+            ShortURL.target_url,
+            ShortURL.apply_modifiers,
+            ShortURL.created_at,
+            ShortURL.visit_count
+        )
+        .filter(ShortURL.user_id == user_id)
+        .order_by(ShortURL.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for short_code, target_url, apply_modifiers, created_at, visit_count in rows:
+        yield {
+            'short_code': short_code,
+            'target_url': target_url,
+            'apply_modifiers': apply_modifiers,
+            'created_at': created_at.isoformat() if created_at else None,
+            'visit_count': visit_count
+        }
+
+def export_ndjson(rows):
+    """Encode export rows as NDJSON lines"""
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+def export_csv(rows):
+    """Encode export rows as CSV lines, starting with a header"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Flush the header when there are no rows
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+def iter_import_records(stream, fmt):
+    """Read link records one at a time from a binary NDJSON or CSV stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+def _parse_bool(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+class LinkImporter:
+    """
+    Upserts imported link records in batches.
+
+    Records with a short_code already owned by the user update that link;
+    other records create new links, keeping their short_code if given.
+    """
+
+    def __init__(self, user_id, batch_size=1000, max_errors=100):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self._batch = []
+        self._record = 0
+
+    def add(self, record):
+        """Queue a record, writing the batch once it is full"""
+        self._record += 1
+        if not isinstance(record, dict):
+            self._error(self._record, 'Invalid record')
+            return
+        if not validators.url(record.get('target_url') or ''):
+            self._error(self._record, 'Invalid URL. Please enter a valid URL including http:// or https://')
+            return
+        self._batch.append((self._record, {
+            'target_url': record['target_url'],
+            'custom_code': record.get('short_code') or None,
+            'apply_modifiers': _parse_bool(record.get('apply_modifiers')),
+            'created_at': _parse_datetime(record.get('created_at'))
+        }))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the queued records"""
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        codes = [entry['custom_code'] for _, entry in batch if entry['custom_code']]
+        existing = {}
+        if codes:
+            existing = {
+                row.short_code: row for row in db.session.execute(
+                    db.select(ShortURL.id, ShortURL.short_code, ShortURL.user_id)
+                    .where(ShortURL.short_code.in_(codes))
+                ).all()
+            }
+
+        # Links the user already owns are updated in one bulk UPDATE
+        modifiers = None
+        updates = {}
+        new_entries = []
+        for record, entry in batch:
+            link = existing.get(entry['custom_code'])
+            if link is None:
+                new_entries.append((record, entry))
+            elif link.user_id != self.user_id:
+                self._error(record, 'This short code is already in use')
+            else:
+                if modifiers is None:
+                    modifiers = DomainModifier.get_matcher(self.user_id)
+                updates[link.id] = {
+                    'id': link.id,
+                    'target_url': entry['target_url'],
+                    'apply_modifiers': entry['apply_modifiers'],
+                    'target_host': ShortURL.host_of(entry['target_url']),
+                    'redirect_url': (
+                        DomainModifier.apply_modifiers(entry['target_url'], modifiers=modifiers)
+                        if entry['apply_modifiers'] else entry['target_url']
+                    )
+                }
+
+        if updates:
+            db.session.execute(db.update(ShortURL), list(updates.values()))
+            db.session.commit()
+            invalidate_links(link.short_code for link in existing.values() if link.id in updates)
+            self.updated += len(updates)
+
+        if new_entries:
+            results = ShortURL.create_many(
+                self.user_id, [entry for _, entry in new_entries], chunk_size=self.batch_size
+            )
+            for (record, _), (link, error) in zip(new_entries, results):
+                if error:
+                    self._error(record, error)
+                else:
+                    self.created += 1
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors
+        }
+
+    def _error(self, record, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'record': record, 'error': message})
@@ -0,0 +1,90 @@
+import json
+from collections import Counter
+from app import db
+from app.models import ShortURL, DomainModifier
+from app.utils.modifier_index import CompiledModifier, ModifierMatcher
+
+def parse_proposed_modifiers(specs):
+    """Validate proposed modifier dicts from a request, raising ValueError on the first bad one"""
+    if not isinstance(specs, list):
+        raise ValueError('modifiers must be a list')
+    proposed = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or 'domain' not in spec or 'query_params' not in spec:
+            raise ValueError(f'Modifier {index}: missing required fields domain and query_params')
+        domain = str(spec['domain'] or '').lower()
+        if not domain or '.' not in domain:
+            raise ValueError(f'Modifier {index}: invalid domain name')
+        if not isinstance(spec['query_params'], dict):
+            raise ValueError(f'Modifier {index}: query_params must be an object with key-value pairs')
+        proposed.append((domain, bool(spec.get('include_subdomains', False)), spec['query_params']))
+    return proposed
+
+def build_dry_run_matcher(user_id, proposed=None, include_existing=True):
+    """
+    Compile the modifier set to test: the user's active modifiers, the proposed
+    ones, or both. Proposed modifiers apply after existing ones, as they would
+    once created.
+    """
+    existing = []
+    if proposed is None or include_existing:
+        existing = DomainModifier.get_active_modifiers(user_id)
+    matcher = ModifierMatcher(existing)
+    next_id = max((modifier.id for modifier in existing), default=0)
+    for offset, (domain, include_subdomains, query_params) in enumerate(proposed or [], 1):
+        matcher.add(CompiledModifier(next_id + offset, domain, include_subdomains, tuple(query_params.items())))
+    return matcher
+
+def iter_link_diffs(user_id, matcher, batch_size=1000):
+    """Yield a diff per link of the user, comparing its current redirect URL with the matcher's"""
+    rows = db.session.execute(
+        db.select(ShortURL.short_code, ShortURL.target_url, ShortURL.apply_modifiers, ShortURL.redirect_url)
+        .filter_by(user_id=user_id)
+        .order_by(ShortURL.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for short_code, target_url, apply_modifiers, redirect_url in rows:
+        # Resolve the current URL as ShortURL.get_redirect_url does, including
+        # links saved before redirect URLs were materialized
+        current = redirect_url
+        if not current:
+            current = DomainModifier.apply_modifiers(target_url, user_id=user_id) if apply_modifiers else target_url
+        yield {
+            'short_code': short_code,
+            'url': target_url,
+            'current': current,
+            'proposed': matcher.apply(target_url) if apply_modifiers else target_url
+        }
+
+def iter_url_diffs(urls, matcher):
+    """Yield a diff per uploaded URL, comparing it with its rewritten form"""
+    for url in urls:
+        if not isinstance(url, str) or not url:
+            yield {'url': url, 'error': 'Invalid URL'}
+            continue
+        yield {'url': url, 'current': url, 'proposed': matcher.apply(url)}
+
+def dry_run_ndjson(diffs, include_unchanged=False):
+    """Encode diffs as NDJSON lines, ending with a summary line"""
+    checked = changed = invalid = 0
+    changed_hosts = Counter()
+    for diff in diffs:
+        if 'error' in diff:
+            invalid += 1
+            yield json.dumps(diff) + '\n'
+            continue
+        checked += 1
+        diff['changed'] = diff['current'] != diff['proposed']
+        if diff['changed']:
+            changed += 1
+            changed_hosts[ShortURL.host_of(diff['url'])] += 1
+        if diff['changed'] or include_unchanged:
+            yield json.dumps(diff) + '\n'
+
+    yield json.dumps({'summary': {
+        'checked': checked,
+        'changed': changed,
+        'unchanged': checked - changed,
+        'invalid': invalid,
+        'changed_by_host': dict(changed_hosts.most_common())
+    }}) + '\n'
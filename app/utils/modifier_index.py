@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from app import db
+from app.utils.caching import LRUCache
+
+CompiledModifier = namedtuple('CompiledModifier', ['id', 'domain', 'include_subdomains', 'params'])
+
+class ModifierMatcher:
+    """
+    Domain modifiers compiled into a suffix trie over reversed host labels.
+
+    "www.amazon.co.uk" is looked up as uk -> co -> amazon -> www, collecting
+    subdomain modifiers on the way and exact-domain modifiers at the end, so a
+    match costs one step per label of the host however many modifiers there
+    are. Query params are parsed from JSON once, when the matcher is built.
+    """
+
+    def __init__(self, modifiers=()):
+        self._root = {}
+        self.size = 0
+        for modifier in modifiers:
+            self.add(modifier)
+
+    @staticmethod
+    def compile(modifier):
+        """Snapshot a DomainModifier with its query params parsed"""
+        return CompiledModifier(
+            modifier.id,
+            modifier.domain.lower(),
+            bool(modifier.include_subdomains),
+            tuple(json.loads(modifier.query_params).items())
+        )
+
+    def add(self, modifier):
+        """Add a DomainModifier or CompiledModifier to the trie"""
+        if not isinstance(modifier, CompiledModifier):
+            modifier = self.compile(modifier)
+        node = self._root
+        for label in reversed(modifier.domain.split('.')):
+            node = node.setdefault(label, {})
+        node.setdefault(None, []).append(modifier)
+        self.size += 1
+
+    def match(self, host):
+        """Return the modifiers that apply to a lowercased host, in the order they were created"""
+        labels = host.split('.')
+        node = self._root
+        matched = []
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.get(label)
+            if node is None:
+                break
+            for modifier in node.get(None, ()):
+                # A modifier on a strict suffix of the host only applies to subdomains
+                if depth == len(labels) or modifier.include_subdomains:
+                    matched.append(modifier)
+        if len(matched) > 1:
+            matched.sort(key=lambda modifier: modifier.id)
+        return matched
+
+    def apply(self, url):
+        """Apply the matching modifiers' query params to a URL"""
+        if not url:
+            return url
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc.lower()
+        if not domain:
+            return url
+
+        matched = self.match(domain)
+        if not matched:
+            return url
+
+        for modifier in matched:
+            query_dict = parse_qs(parsed_url.query)
+            for key, value in modifier.params:
+                query_dict[key] = [value]
+            parsed_url = parsed_url._replace(query=urlencode(query_dict, doseq=True))
+        return urlunparse(parsed_url)
+
+class ModifierIndex:
+    """
+    Process-wide cache of each owner's compiled ModifierMatcher.
+
+    Changes made in this process invalidate the owner's matcher directly.
+    Changes made by other workers are noticed by comparing a cheap version
+    (count and latest update time of the owner's active modifiers) at most
+    once per check interval, so redirects skip the full modifier query.
+    """
+
+    def __init__(self):
+        self._matchers = LRUCache('modifier_index')
+        self._build_lock = threading.Lock()
+        self.check_interval = 5.0
+
+    def init_app(self, app):
+        """Configure the index from the app config"""
+        self._matchers.configure(maxsize=app.config['MODIFIER_INDEX_SIZE'])
+        self.check_interval = app.config['MODIFIER_INDEX_CHECK_INTERVAL']
+
+    def get(self, user_id):
+        """Return the current ModifierMatcher for an owner's active modifiers"""
+        entry = self._matchers.get(user_id)
+        now = time.monotonic()
+        if entry is not None:
+            matcher, version, checked_at = entry
+            if now - checked_at < self.check_interval:
+                return matcher
+            if self._version(user_id) == version:
+                self._matchers.set(user_id, (matcher, version, now))
+                return matcher
+
+        with self._build_lock:
+            version = self._version(user_id)
+            from app.models.domain_modifier import DomainModifier
+            matcher = ModifierMatcher(DomainModifier.get_active_modifiers(user_id))
+            self._matchers.set(user_id, (matcher, version, time.monotonic()))
+        return matcher
+
+    def invalidate(self, user_id):
+        """Drop an owner's matcher after their modifiers change"""
+        self._matchers.delete(user_id)
+
+    def clear(self):
+        self._matchers.clear()
+
+    def _version(self, user_id):
+        from app.models.domain_modifier import DomainModifier
+        return tuple(db.session.execute(
+            db.select(db.func.count(DomainModifier.id), db.func.max(DomainModifier.updated_at))
+            .filter_by(active=True, user_id=user_id)
+        ).one())
+
+modifier_index = ModifierIndex()
@@ -1,8 +1,11 @@
 import time
 # from healthcheck import HealthCheck  # Commenting out due to compatibility issues
-from prometheus_flask_exporter import PrometheusMetrics, Counter, Histogram
+from prometheus_flask_exporter import PrometheusMetrics, Counter, Gauge, Histogram
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 from flask import Blueprint, current_app, jsonify, g, request
 from sqlalchemy import text
+from app.utils.heavy_hitters import SpaceSaving
 
 # Initialize Prometheus metrics
 metrics = PrometheusMetrics.for_app_factory()
@@ -11,9 +14,35 @@ metrics = PrometheusMetrics.for_app_factory()
 redirect_counter = Counter(
     'getshort_redirect_total', 
     'Number of URL redirects', 
-    ['status', 'short_code']
+    ['status']
 )
 
+# Per-code redirect counts are kept in a fixed-size sketch instead of a
+# label, so attacker-supplied codes can't create unbounded series
+redirect_top_codes = SpaceSaving(capacity=1000)
+redirect_top_codes_exported = 20
+
+class TopCodesCollector:
+    """Exports the most redirected short codes from the heavy-hitters sketch"""
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            'getshort_redirect_top_codes',
+            'Estimated redirects for the most visited short codes in this process',
+            labels=['short_code']
+        )
+        for short_code, count, _ in redirect_top_codes.top(redirect_top_codes_exported):
+            gauge.add_metric([short_code], count)
+        yield gauge
+
+REGISTRY.register(TopCodesCollector())
+
+def record_redirect(status, short_code=None):
+    """Count a redirect attempt, tracking the short code of successful ones"""
+    redirect_counter.labels(status=status).inc()
+    if status == 'success':
+        redirect_top_codes.add(short_code)
+
 url_operation_counter = Counter(
     'getshort_url_operations_total',
     'Number of URL operations',
@@ -26,6 +55,140 @@ request_latency = Histogram(
     ['endpoint']
 )
 
+cache_request_counter = Counter(
+    'getshort_cache_requests_total',
+    'Number of in-process cache lookups',
+    ['cache', 'result']
+)
+
+cache_eviction_counter = Counter(
+    'getshort_cache_evictions_total',
+    'Number of entries removed from in-process caches',
+    ['cache', 'reason']
+)
+
+visit_buffer_counter = Counter(
+    'getshort_visit_buffer_visits_total',
+    'Number of visits handled by the write-behind buffer',
+    ['outcome']
+)
+
+visit_buffer_depth = Gauge(
+    'getshort_visit_buffer_depth',
+    'Number of visits waiting in the write-behind buffer'
+)
+
+visit_buffer_flush_latency = Histogram(
+    'getshort_visit_buffer_flush_seconds',
+    'Time taken to write a batch of buffered visits'
+)
+
+short_code_filter_counter = Counter(
+    'getshort_short_code_filter_checks_total',
+    'Number of short code lookups checked against the negative-lookup filter',
+    ['result']
+)
+
+short_code_filter_fpr = Gauge(
+    'getshort_short_code_filter_false_positive_rate',
+    'Estimated false positive rate of the short code filter'
+)
+
+short_code_filter_bytes = Gauge(
+    'getshort_short_code_filter_bytes',
+    'Memory used by the short code filter bit array'
+)
+
+short_code_filter_items = Gauge(
+    'getshort_short_code_filter_items',
+    'Number of short codes added to the short code filter'
+)
+
+shared_cache_error_counter = Counter(
+    'getshort_shared_cache_errors_total',
+    'Failed operations on the shared link cache backend',
+    ['operation']
+)
+
+geoip_lookup_latency = Histogram(
+    'getshort_geoip_lookup_seconds',
+    'Time taken by GeoIP database lookups that missed the cache',
+    buckets=(.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1)
+)
+
+db_replica_fallback_counter = Counter(
+    'getshort_db_replica_fallback_total',
+    'Reads meant for the read replica that were served by the primary',
+    ['reason']
+)
+
+db_query_counter = Counter(
+    'getshort_db_queries_total',
+    'SQL statements sent to each database, by statement type',
+    ['bind', 'statement']
+)
+
+# Bind name -> engine whose connection pool is exported
+db_pool_engines = {}
+
+class PoolCollector:
+    """Exports connection pool usage for each database bind in this process"""
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            'getshort_db_pool_connections',
+            'Connections in the SQLAlchemy pool of each database bind',
+            labels=['bind', 'state']
+        )
+        for bind, engine in list(db_pool_engines.items()):
+            pool = engine.pool
+            # Only queue-based pools track checkouts; SQLite memory pools don't
+            if not hasattr(pool, 'checkedout'):
+                continue
+            gauge.add_metric([bind, 'size'], pool.size())
+            gauge.add_metric([bind, 'checked_out'], pool.checkedout())
+            gauge.add_metric([bind, 'idle'], pool.checkedin())
+            gauge.add_metric([bind, 'overflow'], max(pool.overflow(), 0))
+        yield gauge
+
+REGISTRY.register(PoolCollector())
+
+LIVENESS_STATUS = {"status": "alive"}
+
+def check_database(db):
+    """Run a trivial query, returning None if the database is reachable or the error message"""
+    try:
+        db.session.execute(text('SELECT 1'))
+        db.session.commit()
+        return None
+    except Exception as e:
+        return str(e)
+
+def health_status(db):
+    """Body and status code of the health check endpoint"""
+    db_error = check_database(db)
+    body = {
+        "status": "healthy" if db_error is None else "unhealthy",
+        "checks": {
+            "database": {
+                "status": "ok" if db_error is None else "error",
+                "message": "Database connection OK" if db_error is None else db_error
+            },
+            "app": {
+                "status": "ok",
+                "message": "Application is running"
+            }
+        }
+    }
+    return body, 200 if db_error is None else 500
+
+def readiness_status(db):
+    """Body and status code of the readiness endpoint"""
+    db_error = check_database(db)
+    if db_error is None:
+        return {"status": "ready"}, 200
+    return {"status": "not ready", "reason": db_error}, 503
+
 def create_health_blueprint(db):
     """Create a health check blueprint that can be registered with the app"""
     health_bp = Blueprint('health', __name__, url_prefix='/health')
@@ -33,47 +196,19 @@ def create_health_blueprint(db):
     # Health check endpoint
     @health_bp.route('/')
     def health_check():
-        try:
-            # Execute a simple database query
-            db.session.execute(text('SELECT 1'))
-            db.session.commit()
-            db_status = True
-        except Exception as e:
-            db_status = False
-            db_error = str(e)
-        
-        health_status = {
-            "status": "healthy" if db_status else "unhealthy",
-            "checks": {
-                "database": {
-                    "status": "ok" if db_status else "error",
-                    "message": "Database connection OK" if db_status else db_error
-                },
-                "app": {
-                    "status": "ok",
-                    "message": "Application is running"
-                }
-            }
-        }
-        
-        status_code = 200 if db_status else 500
-        return jsonify(health_status), status_code
+        body, status_code = health_status(db)
+        return jsonify(body), status_code
 
     # Readiness endpoint
     @health_bp.route('/ready')
     def readiness():
-        try:
-            # Check if the database is accessible
-            db.session.execute(text('SELECT 1'))
-            db.session.commit()
-            return jsonify({"status": "ready"}), 200
-        except Exception as e:
-            return jsonify({"status": "not ready", "reason": str(e)}), 503
+        body, status_code = readiness_status(db)
+        return jsonify(body), status_code
 
     # Liveness endpoint
     @health_bp.route('/live')
     def liveness():
-        return jsonify({"status": "alive"})
+        return jsonify(LIVENESS_STATUS)
         
     return health_bp
 
@@ -98,6 +233,10 @@ def create_metrics_blueprint():
 
 def init_health_check(app, db):
     """Initialize the health check endpoints"""
+    global redirect_top_codes_exported
+    redirect_top_codes.reset(capacity=app.config['TOP_CODES_CAPACITY'])
+    redirect_top_codes_exported = app.config['TOP_CODES_EXPORTED']
+    
     # Only register blueprints if they haven't been registered already
     if 'health.health_check' not in app.view_functions:
         health_bp = create_health_blueprint(db)
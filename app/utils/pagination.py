@@ -0,0 +1,62 @@
+import base64
+import json
+from datetime import datetime
+from app import db
+
+def encode_cursor(values):
+    """Encode the sort key of the last item on a page as an opaque continuation token"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, count):
+    """Decode a continuation token back into count sort key values. Raises ValueError if invalid."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, UnicodeError, json.JSONDecodeError, base64.binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != count:
+        raise ValueError('Invalid cursor')
+    return values
+
+def keyset_paginate(statement, timestamp_column, id_column, cursor=None, limit=50, scalars=True):
+    """
+    Fetch one page of statement, newest first, using keyset pagination on
+    (timestamp_column, id_column).
+    
+    Instead of an OFFSET, each page continues from the sort key of the last
+    item on the previous page, so every page costs the same index range scan
+    however deep it is. Returns (items, next_cursor), where next_cursor is
+    None on the last page.
+    """
+    if cursor:
+        timestamp, item_id = decode_cursor(cursor, 2)
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+            item_id = int(item_id)
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        statement = statement.where(db.or_(
+            timestamp_column < timestamp,
+            db.and_(timestamp_column == timestamp, id_column < item_id)
+        ))
+    
+    statement = statement.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1)
+    result = db.session.execute(statement)
+    items = result.scalars().all() if scalars else result.all()
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([
+            getattr(last, timestamp_column.key), getattr(last, id_column.key)
+        ])
+    
+    return items, next_cursor
+
+def page_size(requested, default, maximum):
+    """Clamp a requested page size to 1..maximum, falling back to default"""
+    if not requested or requested < 1:
+        return default
+    return min(requested, maximum)
@@ -0,0 +1,348 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+# Key-value backends for caches shared by every worker process. Besides get
+# and set, each keeps a generation number that every invalidation bumps and a
+# bounded log of the keys each generation invalidated. Workers poll the log to
+# drop their own copies of invalidated keys, and a set is skipped if its key
+# was invalidated after the generation the caller read before loading the
+# value, so a slow loader can't put back a value invalidated in the meantime.
+
+# Invalidations remembered for workers catching up and for stale-set checks
+DEFAULT_LOG_SIZE = 1024
+
+def _redis():
+    """Import redis-py on first use so the app doesn't depend on it"""
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('The Redis link cache requires redis-py; install it with "pip install redis"')
+    return redis
+
+class MemoryBackend:
+    """
+    Backend kept in this process's memory.
+
+    It isn't shared between processes, but behaves like the other backends,
+    so tests can stand in several workers with one instance.
+    """
+
+    def __init__(self, log_size=DEFAULT_LOG_SIZE):
+        self.log_size = log_size
+        self._entries = {}
+        self._log = {}
+        self._generation = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, generation, ttl=None):
+        """Store value, unless key was invalidated after generation, in which case return False"""
+        with self._lock:
+            if generation < self._floor or self._log.get(key, 0) > generation:
+                return False
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def invalidate(self, keys):
+        """Drop keys and record them under a new generation, which is returned"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._log[key] = self._generation
+            if len(self._log) > self.log_size:
+                oldest = sorted(self._log.items(), key=lambda item: item[1])[:len(self._log) - self.log_size]
+                for key, _ in oldest:
+                    del self._log[key]
+                self._floor = max(self._floor, oldest[-1][1])
+            return self._generation
+
+    def generation(self):
+        return self._generation
+
+    def invalidations_since(self, generation):
+        """
+        Return the current generation and the keys invalidated after the given
+        one, or None instead of the keys if the log no longer goes back that far.
+        """
+        with self._lock:
+            if generation < self._floor:
+                return self._generation, None
+            return self._generation, [key for key, logged in self._log.items() if logged > generation]
+
+class SharedMemoryBackend:
+    """
+    Backend in a memory-mapped file shared by the workers on one host.
+
+    The file (best placed on a tmpfs such as /dev/shm) holds a header, a ring
+    of invalidation log entries and a fixed table of slots, each key living
+    in the slot its hash selects; a colliding key simply replaces it. Values
+    too large for a slot aren't shared. Access is serialized with flock
+    between processes and a lock between threads.
+    """
+
+    MAGIC = b'GSCACHE1'
+    # magic, slots, slot size, log size, generation, log entries written
+    HEADER = struct.Struct('<8sIIIxxxxQQ')
+    # generation, key length
+    LOG_ENTRY = struct.Struct('<QH')
+    LOG_KEY_SIZE = 246
+    # expiry time (0 for none), key length, value length
+    SLOT = struct.Struct('<dHI')
+    # Key length recorded for keys too long for the log, which makes readers start over
+    UNLOGGED = 0xFFFF
+
+    def __init__(self, path, slots=16384, slot_size=1024, log_size=DEFAULT_LOG_SIZE):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.log_size = log_size
+        self._log_offset = self.HEADER.size
+        self._slot_offset = self._log_offset + log_size * (self.LOG_ENTRY.size + self.LOG_KEY_SIZE)
+        self._file_size = self._slot_offset + slots * slot_size
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+        self._pid = None
+
+    def _open(self):
+        """Map the file in this process, creating or resizing it if its layout doesn't match"""
+        # Locks on a descriptor inherited through fork would be shared with the parent
+        if self._pid == os.getpid():
+            return
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = self.HEADER.pack(self.MAGIC, self.slots, self.slot_size, self.log_size, 0, 0)
+            current = os.pread(self._fd, self.HEADER.size, 0)
+            if os.fstat(self._fd).st_size != self._file_size or current[:20] != header[:20]:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._file_size)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, self._file_size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _counters(self, buffer):
+        _, _, _, _, generation, written = self.HEADER.unpack_from(buffer, 0)
+        return generation, written
+
+    def _slot(self, key):
+        return self._slot_offset + zlib.crc32(key) % self.slots * self.slot_size
+
+    def _logged_after(self, buffer, generation):
+        """Keys logged after generation, newest first, or None if the ring has lost some"""
+        _, written = self._counters(buffer)
+        entry_size = self.LOG_ENTRY.size + self.LOG_KEY_SIZE
+        keys = []
+        for index in range(written - 1, max(written - self.log_size, 0) - 1, -1):
+            offset = self._log_offset + index % self.log_size * entry_size
+            logged, length = self.LOG_ENTRY.unpack_from(buffer, offset)
+            if logged <= generation:
+                return keys
+            if length == self.UNLOGGED:
+                return None
+            start = offset + self.LOG_ENTRY.size
+            keys.append(bytes(buffer[start:start + length]))
+        return keys if written <= self.log_size else None
+
+    def get(self, key):
+        key = key.encode('utf-8')
+        offset = self._slot(key)
+        with self._locked() as buffer:
+            expires_at, key_length, value_length = self.SLOT.unpack_from(buffer, offset)
+            start = offset + self.SLOT.size
+            if key_length != len(key) or buffer[start:start + key_length] != key:
+                return None
+            if expires_at and expires_at <= time.time():
+                return None
+            start += key_length
+            return bytes(buffer[start:start + value_length]).decode('utf-8')
+
+    def set(self, key, value, generation, ttl=None):
+        """Store value, unless key was invalidated after generation, in which case return False"""
+        key = key.encode('utf-8')
+        value = value.encode('utf-8')
+        offset = self._slot(key)
+        with self._locked(exclusive=True) as buffer:
+            logged = self._logged_after(buffer, generation)
+            if logged is None or key in logged:
+                return False
+            if self.SLOT.size + len(key) + len(value) > self.slot_size:
+                # Too large to share, but still current
+                return True
+            self.SLOT.pack_into(buffer, offset, time.time() + ttl if ttl else 0.0, len(key), len(value))
+            start = offset + self.SLOT.size
+            buffer[start:start + len(key) + len(value)] = key + value
+            return True
+
+    def invalidate(self, keys):
+        """Drop keys and record them under a new generation, which is returned"""
+        entry_size = self.LOG_ENTRY.size + self.LOG_KEY_SIZE
+        with self._locked(exclusive=True) as buffer:
+            generation, written = self._counters(buffer)
+            generation += 1
+            for key in keys:
+                key = key.encode('utf-8')
+                offset = self._slot(key)
+                _, key_length, _ = self.SLOT.unpack_from(buffer, offset)
+                start = offset + self.SLOT.size
+                if key_length == len(key) and buffer[start:start + key_length] == key:
+                    self.SLOT.pack_into(buffer, offset, 0.0, 0, 0)
+
+                offset = self._log_offset + written % self.log_size * entry_size
+                if len(key) > self.LOG_KEY_SIZE:
+                    self.LOG_ENTRY.pack_into(buffer, offset, generation, self.UNLOGGED)
+                else:
+                    self.LOG_ENTRY.pack_into(buffer, offset, generation, len(key))
+                    start = offset + self.LOG_ENTRY.size
+                    buffer[start:start + len(key)] = key
+                written += 1
+            self.HEADER.pack_into(buffer, 0, self.MAGIC, self.slots, self.slot_size, self.log_size, generation, written)
+            return generation
+
+    def generation(self):
+        with self._locked() as buffer:
+            return self._counters(buffer)[0]
+
+    def invalidations_since(self, generation):
+        """
+        Return the current generation and the keys invalidated after the given
+        one, or None instead of the keys if the log no longer goes back that far.
+        """
+        with self._locked() as buffer:
+            current, _ = self._counters(buffer)
+            if current < generation:
+                # The file was recreated
+                return current, None
+            keys = self._logged_after(buffer, generation)
+            return current, None if keys is None else [key.decode('utf-8') for key in keys]
+
+class RedisBackend:
+    """
+    Backend on a Redis server, or anything speaking its protocol, shared by
+    every worker of every pod. Invalidations and stale-set checks run as Lua
+    scripts so each is atomic on the server.
+    """
+
+    SET_SCRIPT = """
+    local logged = redis.call('ZSCORE', KEYS[2], ARGV[1])
+    local floor = tonumber(redis.call('GET', KEYS[3]) or '0')
+    local generation = tonumber(ARGV[3])
+    if generation < floor or (logged and tonumber(logged) > generation) then
+        return 0
+    end
+    if tonumber(ARGV[4]) > 0 then
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[4])
+    else
+        redis.call('SET', KEYS[1], ARGV[2])
+    end
+    return 1
+    """
+
+    INVALIDATE_SCRIPT = """
+    local generation = redis.call('INCR', KEYS[1])
+    for i = 1, #ARGV - 2 do
+        redis.call('DEL', ARGV[1] .. ARGV[i + 2])
+        redis.call('ZADD', KEYS[2], generation, ARGV[i + 2])
+    end
+    local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[2])
+    if excess > 0 then
+        local oldest = redis.call('ZRANGE', KEYS[2], excess - 1, excess - 1, 'WITHSCORES')
+        redis.call('SET', KEYS[3], oldest[2])
+        redis.call('ZREMRANGEBYRANK', KEYS[2], 0, excess - 1)
+    end
+    return generation
+    """
+
+    def __init__(self, url, prefix='getshort:link:', log_size=DEFAULT_LOG_SIZE):
+        self.prefix = prefix
+        self.log_size = log_size
+        self._client = _redis().Redis.from_url(url, decode_responses=True)
+        self._generation_key = f'{prefix}generation'
+        self._log_key = f'{prefix}invalidations'
+        self._floor_key = f'{prefix}floor'
+        self._entry_prefix = f'{prefix}entry:'
+        self._set_script = self._client.register_script(self.SET_SCRIPT)
+        self._invalidate_script = self._client.register_script(self.INVALIDATE_SCRIPT)
+
+    def get(self, key):
+        return self._client.get(self._entry_prefix + key)
+
+    def set(self, key, value, generation, ttl=None):
+        """Store value, unless key was invalidated after generation, in which case return False"""
+        return bool(self._set_script(
+            keys=[self._entry_prefix + key, self._log_key, self._floor_key],
+            args=[key, value, generation, int(ttl or 0)]
+        ))
+
+    def invalidate(self, keys):
+        """Drop keys and record them under a new generation, which is returned"""
+        return int(self._invalidate_script(
+            keys=[self._generation_key, self._log_key, self._floor_key],
+            args=[self._entry_prefix, self.log_size, *keys]
+        ))
+
+    def generation(self):
+        return int(self._client.get(self._generation_key) or 0)
+
+    def invalidations_since(self, generation):
+        """
+        Return the current generation and the keys invalidated after the given
+        one, or None instead of the keys if the log no longer goes back that far.
+        """
+        pipeline = self._client.pipeline()
+        pipeline.get(self._generation_key)
+        pipeline.get(self._floor_key)
+        pipeline.zrangebyscore(self._log_key, f'({generation}', '+inf')
+        current, floor, keys = pipeline.execute()
+        current = int(current or 0)
+        if generation < int(floor or 0) or current < generation:
+            return current, None
+        return current, keys
+
+def create_backend(url):
+    """
+    Create a backend from a URL: redis://host:port/db (or rediss://),
+    shm:///path/to/file?slots=16384&slot_size=1024, or memory://
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        # redis.from_url understands its own query options, such as ?password=
+        return RedisBackend(url)
+    if parsed.scheme not in ('shm', 'memory'):
+        raise ValueError(f'Unsupported shared cache URL: {url}')
+    
+    options = {name: int(values[-1]) for name, values in parse_qs(parsed.query).items()}
+    if parsed.scheme == 'shm':
+        return SharedMemoryBackend(parsed.path, **options)
+    return MemoryBackend(**options)
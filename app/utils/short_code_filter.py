@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from app.models import ShortURL
+from app.utils.monitoring import (
+    short_code_filter_counter, short_code_filter_fpr, short_code_filter_bytes, short_code_filter_items
+)
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self.bits_set = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Add a key to the filter"""
+        positions = self._positions(key)
+        with self._lock:
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not self._bits[pos >> 3] & mask:
+                    self._bits[pos >> 3] |= mask
+                    self.bits_set += 1
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def false_positive_rate(self):
+        """Estimated false positive rate from the fraction of bits set"""
+        return (self.bits_set / self.num_bits) ** self.num_hashes
+
+    @property
+    def memory_bytes(self):
+        return len(self._bits)
+
+class ShortCodeFilter:
+    """
+    Negative-lookup filter over every existing short code.
+
+    A "no" from the filter lets the redirect path answer 404 for unknown
+    codes without touching the database. The filter is built by the first
+    lookup rather than at startup, so CLI commands never scan the table.
+    Codes inserted in this process are added immediately; codes created by
+    other workers are picked up by an incremental sync by id that runs in the
+    background at most once per sync interval. Until then they are rejected
+    here, so a new link can 404 on other workers for about one sync interval.
+    Deletions can't be removed from a Bloom filter, so the filter is rebuilt
+    periodically in the background to shed them.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._filter = None
+        self._watermark = 0
+        self._previous_watermark = 0
+        self._last_sync = 0.0
+        self._last_rebuild = 0.0
+        self._sync_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = False
+        self._syncing = False
+        self.enabled = False
+
+    def init_app(self, app):
+        """Configure the filter, leaving the build for the first lookup"""
+        self._app = app
+        self.enabled = app.config['SHORT_CODE_FILTER_ENABLED']
+        self.capacity = app.config['SHORT_CODE_FILTER_CAPACITY']
+        self.error_rate = app.config['SHORT_CODE_FILTER_ERROR_RATE']
+        self.sync_interval = app.config['SHORT_CODE_FILTER_SYNC_INTERVAL']
+        self.rebuild_interval = app.config['SHORT_CODE_FILTER_REBUILD_INTERVAL']
+        self._filter = None
+
+    def rebuild(self):
+        """Build a fresh filter from every short code in the database"""
+        app = current_app._get_current_object()
+        count = db.session.scalar(db.select(db.func.count()).select_from(ShortURL)) or 0
+        bloom = BloomFilter(max(self.capacity, count * 2), self.error_rate)
+
+        watermark = 0
+        rows = db.session.execute(
+            db.select(ShortURL.id, ShortURL.short_code).execution_options(yield_per=10000)
+        )
+        for url_id, short_code in rows:
+            bloom.add(short_code)
+            watermark = max(watermark, url_id)
+
+        with self._sync_lock:
+            if self._app is not app:
+                # Reconfigured for another app while this one was building
+                return
+            # Swap in the new filter; lookups in flight keep using the old one
+            self._filter = bloom
+            self._watermark = self._previous_watermark = watermark
+            self._last_sync = self._last_rebuild = time.monotonic()
+            self._report()
+
+    def might_exist(self, short_code):
+        """Return False only if the short code definitely doesn't exist"""
+        bloom = self._filter
+        if bloom is None:
+            bloom = self._build()
+            if bloom is None:
+                return True
+
+        # Catch up on codes created by other workers without holding up the lookup
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self._start_background_sync()
+
+        if short_code in bloom:
+            short_code_filter_counter.labels(result='passed').inc()
+            return True
+
+        short_code_filter_counter.labels(result='rejected').inc()
+        return False
+
+    def _build(self):
+        """Build the filter on first use; lookups made meanwhile go to the database"""
+        if not self.enabled or not self._rebuild_lock.acquire(blocking=False):
+            return None
+        try:
+            if self._filter is None:
+                self.rebuild()
+        except Exception:
+            logger.exception('Failed to build the short code filter')
+        finally:
+            self._rebuild_lock.release()
+        return self._filter
+
+    def sync(self):
+        """Add short codes inserted since the last sync, at most once per sync interval"""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            if self._filter is None or self._app is not current_app._get_current_object():
+                return
+            if time.monotonic() - self._last_sync < self.sync_interval:
+                return
+            # Scan from the previous watermark so rows from transactions that
+            # committed out of id order are still picked up
+            rows = db.session.execute(
+                db.select(ShortURL.id, ShortURL.short_code)
+                .where(ShortURL.id > self._previous_watermark)
+            ).all()
+            bloom = self._filter
+            watermark = self._watermark
+            for url_id, short_code in rows:
+                if short_code not in bloom:
+                    bloom.add(short_code)
+                watermark = max(watermark, url_id)
+            self._previous_watermark, self._watermark = self._watermark, watermark
+            self._last_sync = time.monotonic()
+            self._report()
+
+            if time.monotonic() - self._last_rebuild >= self.rebuild_interval or bloom.count > bloom.capacity:
+                self._start_background_rebuild()
+        finally:
+            self._sync_lock.release()
+
+    def add(self, short_code):
+        """Record a newly created short code"""
+        if self._filter is not None:
+            self._filter.add(short_code)
+
+    def record_false_positive(self):
+        """Record a code that passed the filter but wasn't in the database"""
+        short_code_filter_counter.labels(result='false_positive').inc()
+
+    def _start_background_sync(self):
+        if self._syncing:
+            return
+        self._syncing = True
+        threading.Thread(
+            target=self._background_sync, args=(self._app,), name='short-code-filter-sync', daemon=True
+        ).start()
+
+    def _background_sync(self, app):
+        try:
+            with app.app_context():
+                self.sync()
+        except Exception:
+            logger.exception('Failed to sync the short code filter')
+        finally:
+            self._syncing = False
+
+    def _start_background_rebuild(self):
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        self._last_rebuild = time.monotonic()
+        threading.Thread(target=self._background_rebuild, name='short-code-filter', daemon=True).start()
+
+    def _background_rebuild(self):
+        try:
+            with self._app.app_context():
+                self.rebuild()
+        except Exception:
+            logger.exception('Failed to rebuild the short code filter')
+        finally:
+            self._rebuilding = False
+
+    def _report(self):
+        bloom = self._filter
+        short_code_filter_fpr.set(bloom.false_positive_rate)
+        short_code_filter_bytes.set(bloom.memory_bytes)
+        short_code_filter_items.set(bloom.count)
+
+short_code_filter = ShortCodeFilter()
+
+@event.listens_for(ShortURL, 'after_insert')
+def _add_inserted_short_code(mapper, connection, target):
+    short_code_filter.add(target.short_code)
@@ -0,0 +1,41 @@
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.utils.caching import LRUCache
+
+# Process-wide cache of user id -> detached User for the Flask-Login user loader
+user_cache = LRUCache('user')
+
+def init_user_cache(app):
+    """Configure the user cache from the app config"""
+    # Other workers' entries can't be invalidated from here, so the TTL
+    # bounds how long they may show a stale profile
+    user_cache.configure(
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL'] or None
+    )
+
+def load_cached_user(user_id):
+    """
+    Return the User with the given id, attached to the current session.
+
+    Cached users are detached snapshots shared by every request thread, so
+    they are never handed out directly: merge(load=False) copies one into the
+    session without querying the database.
+    """
+    from app.models.user import User
+
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        # Cache a detached copy of the columns, leaving the session's instance alone
+        snapshot = User(**{attr.key: getattr(user, attr.key) for attr in db.inspect(User).column_attrs})
+        make_transient_to_detached(snapshot)
+        user_cache.set(user_id, snapshot)
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user from the cache after their profile has changed"""
+    user_cache.delete(user_id)
@@ -0,0 +1,204 @@
+from collections import Counter
+from datetime import datetime, UTC
+from sqlalchemy import bindparam
+from app import db
+from app.models import ShortURL, VisitRollup, ClickBucket, VisitorSketch
+from app.models.visit_rollup import ROLLUP_DIMENSIONS, rollup_hour
+from app.models.click_bucket import BUCKET_RESOLUTIONS, bucket_start
+from app.models.visitor_sketch import SKETCH_PRECISION, visitor_key
+from app.utils.hyperloglog import HyperLogLog
+
+def apply_visit_aggregates(rows):
+    """
+    Update the aggregates derived from a batch of newly inserted visit rows.
+    
+    Runs in the same transaction as the visit INSERT, so the aggregates
+    commit or roll back together with the visits themselves.
+    """
+    increment_visit_counts(rows)
+    apply_visit_rollups(rows)
+
+def apply_visit_rollups(rows):
+    """Add a batch of visits to the time-partitioned rollups, click buckets and visitor sketches"""
+    increment_visit_rollups(rows)
+    increment_click_buckets(rows)
+    add_unique_visitors(rows)
+
+def rollups_match(short_url_id, start, end, visit_total):
+    """Check that a link's rollups and click buckets account for visit_total visits in [start, end)"""
+    rolled_up = db.session.scalar(
+        db.select(db.func.sum(VisitRollup.count))
+        .filter_by(short_url_id=short_url_id, dimension='browser')
+        .where(VisitRollup.hour >= start, VisitRollup.hour < end)
+    ) or 0
+    bucketed = db.session.scalar(
+        db.select(db.func.sum(ClickBucket.count))
+        .filter_by(short_url_id=short_url_id, resolution='hour')
+        .where(ClickBucket.bucket >= start, ClickBucket.bucket < end)
+    ) or 0
+    return rolled_up == visit_total and bucketed == visit_total
+
+def rebuild_rollups(short_url_id, start, end, rows):
+    """
+    Replace a link's rollups, click buckets and visitor sketches for [start, end)
+    with ones computed from rows. The range must align to whole days.
+    """
+    db.session.execute(db.delete(VisitRollup).where(
+        VisitRollup.short_url_id == short_url_id, VisitRollup.hour >= start, VisitRollup.hour < end
+    ))
+    db.session.execute(db.delete(ClickBucket).where(
+        ClickBucket.short_url_id == short_url_id, ClickBucket.bucket >= start, ClickBucket.bucket < end
+    ))
+    db.session.execute(db.delete(VisitorSketch).where(
+        VisitorSketch.short_url_id == short_url_id, VisitorSketch.day >= start.date(), VisitorSketch.day < end.date()
+    ))
+    apply_visit_rollups(rows)
+
+def increment_visit_counts(rows):
+    """Add a batch of visits to the per-link visit counters"""
+    counts = Counter(row['short_url_id'] for row in rows)
+    table = ShortURL.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('link_id'))
+        .values(visit_count=table.c.visit_count + bindparam('increment')),
+        [{'link_id': link_id, 'increment': count} for link_id, count in sorted(counts.items())]
+    )
+
+def increment_visit_rollups(rows):
+    """Add a batch of visits to the hourly per-dimension rollups"""
+    counts = Counter()
+    for row in rows:
+        hour = rollup_hour(row.get('timestamp') or datetime.now(UTC))
+        for dimension, column in ROLLUP_DIMENSIONS.items():
+            value = (row.get(column) or '')[:50]
+            counts[(row['short_url_id'], hour, dimension, value)] += 1
+    
+    upsert_counts(VisitRollup, [
+        {'short_url_id': link_id, 'hour': hour, 'dimension': dimension, 'value': value, 'count': count}
+        for (link_id, hour, dimension, value), count in counts.items()
+    ])
+
+def increment_click_buckets(rows):
+    """Add a batch of visits to the per-link minute, hour and day click buckets"""
+    counts = Counter()
+    for row in rows:
+        timestamp = row.get('timestamp') or datetime.now(UTC)
+        for resolution in BUCKET_RESOLUTIONS:
+            counts[(row['short_url_id'], resolution, bucket_start(timestamp, resolution))] += 1
+    
+    upsert_counts(ClickBucket, [
+        {'short_url_id': link_id, 'resolution': resolution, 'bucket': bucket, 'count': count}
+        for (link_id, resolution, bucket), count in counts.items()
+    ])
+
+def add_unique_visitors(rows):
+    """Fold a batch of visits into the per-link, per-day visitor sketches"""
+    sketches = {}
+    for row in rows:
+        day = bucket_start(row.get('timestamp') or datetime.now(UTC), 'day').date()
+        key = (row['short_url_id'], day)
+        if key not in sketches:
+            sketches[key] = HyperLogLog(SKETCH_PRECISION)
+        sketches[key].add(visitor_key(row.get('ip_address'), row.get('user_agent')))
+    if not sketches:
+        return
+    
+    # Make sure every sketch row exists, then lock and merge into them so
+    # concurrent writers can't overwrite each other's registers
+    empty = HyperLogLog(SKETCH_PRECISION).to_bytes()
+    insert_missing(VisitorSketch, [
+        {'short_url_id': link_id, 'day': day, 'registers': empty} for link_id, day in sketches
+    ])
+    table = VisitorSketch.__table__
+    stored = db.session.execute(
+        db.select(table.c.short_url_id, table.c.day, table.c.registers)
+        .where(db.tuple_(table.c.short_url_id, table.c.day).in_(list(sketches)))
+        .order_by(table.c.short_url_id, table.c.day)
+        .with_for_update()
+    ).all()
+    db.session.execute(
+        table.update()
+        .where(table.c.short_url_id == bindparam('link_id'), table.c.day == bindparam('sketch_day'))
+        .values(registers=bindparam('merged')),
+        [
+            {
+                'link_id': link_id,
+                'sketch_day': day,
+                'merged': HyperLogLog.from_bytes(registers, SKETCH_PRECISION).merge(sketches[(link_id, day)]).to_bytes()
+            }
+            for link_id, day, registers in stored
+        ]
+    )
+
+def insert_missing(model, params):
+    """Insert rows whose primary key doesn't exist yet, leaving existing rows untouched"""
+    table = model.__table__
+    params = in_key_order(table, params)
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.session.execute(insert(table).on_conflict_do_nothing(), params)
+    elif dialect in ('mysql', 'mariadb'):
+        db.session.execute(table.insert().prefix_with('IGNORE'), params)
+    else:
+        key = list(table.primary_key.columns)
+        existing = set(db.session.execute(
+            db.select(*key).where(db.tuple_(*key).in_([tuple(row[column.name] for column in key) for row in params]))
+        ).all())
+        missing = [row for row in params if tuple(row[column.name] for column in key) not in existing]
+        if missing:
+            db.session.execute(table.insert(), missing)
+
+def upsert_counts(model, params):
+    """Add to the count column of rows keyed by the model's primary key, creating missing rows"""
+    if not params:
+        return
+    table = model.__table__
+    key = list(table.primary_key.columns)
+    params = in_key_order(table, params)
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=key,
+                set_={'count': table.c.count + statement.excluded['count']}
+            ),
+            params
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        db.session.execute(
+            statement.on_duplicate_key_update(count=table.c.count + statement.inserted['count']),
+            params
+        )
+    else:
+        # No native upsert: update what exists, insert the rest
+        for row in params:
+            result = db.session.execute(
+                table.update()
+                .where(*(column == row[column.name] for column in key))
+                .values(count=table.c.count + row['count'])
+            )
+            if not result.rowcount:
+                db.session.execute(table.insert(), row)
+
+def in_key_order(table, params):
+    """
+    Sort rows by the table's primary key. Concurrent batches then lock the
+    rows they share in the same order, so they wait on each other instead
+    of deadlocking.
+    """
+    key = [column.name for column in table.primary_key.columns]
+    return sorted(params, key=lambda row: tuple(row[name] for name in key))
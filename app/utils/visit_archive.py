@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+# Visit columns stored in archive files, in order
+ARCHIVE_COLUMNS = [
+    'id', 'short_url_id', 'timestamp', 'ip_address', 'user_agent', 'browser', 'browser_version',
+    'device_type', 'operating_system', 'country_code', 'country_name', 'city', 'referrer'
+]
+
+# Repetitive string columns stored as indexes into a per-file list of distinct values
+DICTIONARY_COLUMNS = [
+    'user_agent', 'browser', 'browser_version', 'device_type', 'operating_system',
+    'country_code', 'country_name', 'city', 'referrer'
+]
+
+def month_start(timestamp):
+    """First instant of the month a timestamp falls in"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(month):
+    """First instant of the month after the given month start"""
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+def archive_path(archive_dir, short_url_id, month):
+    """Path of the archive file holding a link's visits for one month"""
+    return os.path.join(archive_dir, str(short_url_id), f'{month:%Y-%m}.json.gz')
+
+def encode_columns(rows):
+    """Turn visit row dicts into column lists, dictionary-encoding repetitive strings"""
+    columns = {name: [] for name in ARCHIVE_COLUMNS}
+    dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+    for row in rows:
+        for name in ARCHIVE_COLUMNS:
+            value = row.get(name)
+            if name == 'timestamp' and value is not None:
+                value = value.isoformat()
+            elif name in dictionaries and value is not None:
+                value = dictionaries[name].setdefault(value, len(dictionaries[name]))
+            columns[name].append(value)
+    return {
+        'version': 1,
+        'count': len(columns['id']),
+        'columns': columns,
+        'dictionaries': {name: list(values) for name, values in dictionaries.items()}
+    }
+
+def decode_columns(document):
+    """Turn an archive document back into visit row dicts"""
+    columns = document['columns']
+    dictionaries = document['dictionaries']
+    decoded = {}
+    for name in ARCHIVE_COLUMNS:
+        values = columns[name]
+        if name == 'timestamp':
+            values = [datetime.fromisoformat(value) if value is not None else None for value in values]
+        elif name in dictionaries:
+            lookup = dictionaries[name]
+            values = [lookup[value] if value is not None else None for value in values]
+        decoded[name] = values
+    for i in range(document['count']):
+        yield {name: decoded[name][i] for name in ARCHIVE_COLUMNS}
+
+def read_archive(path):
+    """Yield the visit rows stored in one archive file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        document = json.load(f)
+    yield from decode_columns(document)
+
+def write_archive(path, rows):
+    """
+    Write visit rows to an archive file, keeping any rows already archived there.
+
+    The file is written under a temporary name, synced and renamed into place,
+    so a crash never leaves a partial archive behind.
+    """
+    if os.path.exists(path):
+        archived_ids = set()
+        existing = []
+        for row in read_archive(path):
+            archived_ids.add(row['id'])
+            existing.append(row)
+        rows = existing + [row for row in rows if row['id'] not in archived_ids]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        json.dump(encode_columns(rows), f, separators=(',', ':'))
+    with open(temp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return len(rows)
+
+def iter_archived_visits(archive_dir, short_url_id=None, start=None, end=None):
+    """
+    Replay archived visits, optionally for one link and a [start, end) time range.
+
+    Only the monthly files that can overlap the range are opened.
+    """
+    if not os.path.isdir(archive_dir):
+        return
+    link_dirs = [str(short_url_id)] if short_url_id is not None else sorted(os.listdir(archive_dir), key=lambda name: (len(name), name))
+    for link_dir in link_dirs:
+        directory = os.path.join(archive_dir, link_dir)
+        if not link_dir.isdigit() or not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json.gz'):
+                continue
+            month = datetime.strptime(filename[:-len('.json.gz')], '%Y-%m')
+            if (start is not None and next_month(month) <= start) or (end is not None and month >= end):
+                continue
+            for row in read_archive(os.path.join(directory, filename)):
+                if (start is None or row['timestamp'] >= start) and (end is None or row['timestamp'] < end):
+                    yield row
@@ -0,0 +1,182 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import db
+from app.models import Visit, ShortURL
+from app.utils.visit_aggregates import apply_visit_aggregates
+from app.utils.monitoring import visit_buffer_counter, visit_buffer_depth, visit_buffer_flush_latency
+
+logger = logging.getLogger(__name__)
+
+# Attempts at a batch that hits a deadlock or lock timeout before it is dropped
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.05
+
+# Request values of a visit whose user agent and location the flusher parses
+RawVisit = namedtuple('RawVisit', ['link', 'ip_address', 'user_agent', 'referrer', 'timestamp'])
+
+class VisitBuffer:
+    """
+    Write-behind buffer for Visit rows.
+
+    Redirects enqueue plain row dicts and return immediately; a background
+    thread writes them with bulk INSERTs once a batch fills up or the flush
+    interval elapses. The queue is bounded, and visits that don't fit are
+    dropped and counted rather than slowing down the redirect. A RawVisit
+    can be queued instead of a row, leaving its parsing to the flusher.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.enabled = True
+        self.batch_size = 500
+        self.flush_interval = 1.0
+
+    def init_app(self, app):
+        """Bind the buffer to an app, draining anything queued for a previous one"""
+        self.shutdown()
+        self._app = app
+        self.enabled = app.config['VISIT_BUFFER_ENABLED']
+        self.batch_size = app.config['VISIT_BUFFER_BATCH_SIZE']
+        self.flush_interval = app.config['VISIT_BUFFER_FLUSH_INTERVAL']
+        self._queue = queue.Queue(maxsize=app.config['VISIT_BUFFER_SIZE'])
+        visit_buffer_depth.set(0)
+
+    def enqueue(self, row):
+        """Queue a visit row or RawVisit for writing. Returns False if the visit was dropped."""
+        if not self.enabled:
+            self._write(self._prepare([row]))
+            return True
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            visit_buffer_counter.labels(outcome='dropped_full').inc()
+            return False
+
+        visit_buffer_counter.labels(outcome='enqueued').inc()
+        depth = self._queue.qsize()
+        visit_buffer_depth.set(depth)
+        if depth >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """Write every queued visit to the database"""
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                self._write(self._prepare(batch))
+            visit_buffer_depth.set(self._queue.qsize())
+
+    def shutdown(self, timeout=10):
+        """Stop the flusher thread and drain the queue"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._stop.set()
+            self._wake.set()
+            thread.join(timeout)
+        self._thread = None
+        if self._app is not None:
+            self.flush()
+
+    def _ensure_started(self):
+        """Start the flusher thread in this process if it isn't running"""
+        # Threads don't survive a fork, so a pre-forking server needs one per worker
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='visit-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _prepare(self, batch):
+        """Turn queued RawVisits into rows"""
+        from app.utils.visitor_tracking import build_visit
+        return [build_visit(*item) if isinstance(item, RawVisit) else item for item in batch]
+
+    def _write(self, rows):
+        """Insert a batch of visit rows in a single transaction"""
+        start = time.time()
+        with self._app.app_context():
+            for attempt in range(1, WRITE_ATTEMPTS + 1):
+                try:
+                    rows = self._write_batch(rows)
+                    break
+                except OperationalError:
+                    # Deadlocks and lock timeouts roll back the whole batch,
+                    # which can simply be written again
+                    db.session.rollback()
+                    if attempt == WRITE_ATTEMPTS:
+                        logger.exception('Failed to write %d buffered visits after %d attempts', len(rows), attempt)
+                        visit_buffer_counter.labels(outcome='dropped_error').inc(len(rows))
+                        return
+                    logger.warning('Retrying %d buffered visits after a database error', len(rows), exc_info=True)
+                    visit_buffer_counter.labels(outcome='retried').inc(len(rows))
+                    time.sleep(WRITE_RETRY_DELAY * attempt)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Failed to write %d buffered visits', len(rows))
+                    visit_buffer_counter.labels(outcome='dropped_error').inc(len(rows))
+                    return
+        visit_buffer_counter.labels(outcome='written').inc(len(rows))
+        visit_buffer_flush_latency.observe(time.time() - start)
+
+    def _write_batch(self, rows):
+        """Insert a batch, returning the rows that were written"""
+        try:
+            self._insert(rows)
+        except IntegrityError:
+            # A link was deleted while its visits were queued; drop
+            # just those visits and write the rest
+            db.session.rollback()
+            link_ids = {row['short_url_id'] for row in rows}
+            existing = set(db.session.execute(
+                db.select(ShortURL.id).where(ShortURL.id.in_(link_ids))
+            ).scalars())
+            kept = [row for row in rows if row['short_url_id'] in existing]
+            visit_buffer_counter.labels(outcome='dropped_deleted').inc(len(rows) - len(kept))
+            rows = kept
+            if rows:
+                self._insert(rows)
+        return rows
+
+    def _insert(self, rows):
+        db.session.execute(insert(Visit), rows)
+        apply_visit_aggregates(rows)
+        db.session.commit()
+
+visit_buffer = VisitBuffer()
+
+# Drain pending visits when the worker exits so deploys don't lose clicks
+atexit.register(visit_buffer.shutdown)
@@ -1,31 +1,116 @@
-import os
+import ipaddress
+import threading
+import time
+from datetime import datetime, UTC
 import geoip2.database
+import maxminddb
 from user_agents import parse
 from flask import request
-from app import db
-from app.models import Visit
+from app.utils.caching import LRUCache
+from app.utils.monitoring import geoip_lookup_latency
+from app.utils.visit_buffer import visit_buffer
 
-# Initialize the GeoIP reader
-geoip_db_path = os.environ.get('GEOIP_DB_PATH', 'GeoLite2-City.mmdb')
-try:
-    geoip_reader = geoip2.database.Reader(geoip_db_path)
-except FileNotFoundError:
-    geoip_reader = None
+# The GeoIP reader is opened lazily, once per process, and shared by all threads
+geoip_db_path = 'GeoLite2-City.mmdb'
+geoip_reader = None
+_geoip_opened = False
+_geoip_lock = threading.Lock()
 
-def track_visit(short_url):
+# GeoIP results, keyed by network prefix of the visitor's IP
+geoip_cache = LRUCache('geoip', maxsize=10000)
+geoip_prefix_lengths = {4: 24, 6: 48}
+
+# Parsed user agents, keyed by the raw user agent string
+user_agent_cache = LRUCache('user_agent', maxsize=5000)
+
+# Longer strings are parsed but not cached, so junk user agents can't bloat the cache
+MAX_CACHED_USER_AGENT_LENGTH = 1024
+
+def init_visitor_tracking(app):
+    """Configure the GeoIP reader and visitor tracking caches from the app config"""
+    global geoip_db_path, geoip_reader, _geoip_opened
+    
+    with _geoip_lock:
+        if app.config['GEOIP_DB_PATH'] != geoip_db_path:
+            geoip_db_path = app.config['GEOIP_DB_PATH']
+            geoip_reader = None
+            _geoip_opened = False
+    
+    geoip_prefix_lengths[4] = app.config['GEOIP_CACHE_IPV4_PREFIX']
+    geoip_prefix_lengths[6] = app.config['GEOIP_CACHE_IPV6_PREFIX']
+    geoip_cache.configure(maxsize=app.config['GEOIP_CACHE_SIZE'])
+    user_agent_cache.configure(maxsize=app.config['USER_AGENT_CACHE_SIZE'])
+
+def get_geoip_reader():
+    """Get the shared GeoIP reader, opening the database memory-mapped on first use"""
+    global geoip_reader, _geoip_opened
+    
+    if _geoip_opened:
+        return geoip_reader
+    
+    with _geoip_lock:
+        if not _geoip_opened:
+            try:
+                # Prefer the C extension's mmap reader, falling back to the pure Python one
+                try:
+                    geoip_reader = geoip2.database.Reader(geoip_db_path, mode=maxminddb.MODE_MMAP_EXT)
+                except ValueError:
+                    geoip_reader = geoip2.database.Reader(geoip_db_path, mode=maxminddb.MODE_MMAP)
+            except FileNotFoundError:
+                geoip_reader = None
+            _geoip_opened = True
+    
+    return geoip_reader
+
+def lookup_location(ip_address):
     """
-    Track a visit to a short URL by collecting information from the request
-    and storing it in the database.
+    Look up the (country_code, country_name, city) of an IP address.
+    
+    Results are cached per network prefix, so visitors from the same /24
+    (IPv4) or /48 (IPv6) share a lookup.
     """
-    # Extract IP address
-    ip_address = request.remote_addr
+    reader = get_geoip_reader()
+    if not reader or not ip_address:
+        return None, None, None
     
-    # Extract user agent information
-    user_agent_string = request.user_agent.string
-    user_agent = parse(user_agent_string)
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None, None, None
+    
+    host_bits = address.max_prefixlen - geoip_prefix_lengths[address.version]
+    cache_key = (address.version, int(address) >> host_bits)
     
-    browser = user_agent.browser.family
-    browser_version = user_agent.browser.version_string
+    location = geoip_cache.get(cache_key)
+    if location is not None:
+        return location
+    
+    start = time.time()
+    try:
+        geo_response = reader.city(ip_address)
+        location = (
+            geo_response.country.iso_code,
+            geo_response.country.name,
+            geo_response.city.name
+        )
+    except Exception:
+        # If IP lookup fails, just continue without location info
+        location = (None, None, None)
+    geoip_lookup_latency.observe(time.time() - start)
+    
+    geoip_cache.set(cache_key, location)
+    return location
+
+def parse_user_agent(user_agent_string):
+    """
+    Parse a user agent string into a (browser, browser_version, device_type,
+    operating_system) tuple, memoizing the result.
+    """
+    parsed = user_agent_cache.get(user_agent_string)
+    if parsed is not None:
+        return parsed
+    
+    user_agent = parse(user_agent_string)
     
     # Determine device type
     if user_agent.is_mobile:
@@ -35,43 +120,49 @@ def track_visit(short_url):
     else:
         device_type = 'desktop'
     
-    # Get operating system
-    operating_system = user_agent.os.family
+    parsed = (
+        user_agent.browser.family,
+        user_agent.browser.version_string,
+        device_type,
+        user_agent.os.family
+    )
+    
+    if len(user_agent_string) <= MAX_CACHED_USER_AGENT_LENGTH:
+        user_agent_cache.set(user_agent_string, parsed)
+    
+    return parsed
+
+def build_visit(short_url, ip_address, user_agent_string, referrer, timestamp=None):
+    """Build the visit row for a redirect from the raw request values"""
+    # Extract user agent information
+    browser, browser_version, device_type, operating_system = parse_user_agent(user_agent_string)
     
     # Get location information from IP
-    country_code = None
-    country_name = None
-    city = None
-    
-    if geoip_reader:
-        try:
-            geo_response = geoip_reader.city(ip_address)
-            country_code = geo_response.country.iso_code
-            country_name = geo_response.country.name
-            city = geo_response.city.name
-        except:
-            # If IP lookup fails, just continue without location info
-            pass
-    
-    # Get referrer if available
-    referrer = request.referrer
-    
-    # Create and save visit record
-    visit = Visit(
-        short_url_id=short_url.id,
-        ip_address=ip_address,
-        user_agent=user_agent_string,
-        browser=browser,
-        browser_version=browser_version,
-        device_type=device_type,
-        operating_system=operating_system,
-        country_code=country_code,
-        country_name=country_name,
-        city=city,
-        referrer=referrer
-    )
+    country_code, country_name, city = lookup_location(ip_address)
+    
+    return {
+        'short_url_id': short_url.id,
+        'ip_address': ip_address,
+        'user_agent': user_agent_string,
+        'browser': browser,
+        'browser_version': browser_version,
+        'device_type': device_type,
+        'operating_system': operating_system,
+        'country_code': country_code,
+        'country_name': country_name,
+        'city': city,
+        'referrer': referrer,
+        'timestamp': timestamp or datetime.now(UTC)
+    }
+
+def track_visit(short_url):
+    """
+    Track a visit to a short URL by collecting information from the request
+    and queueing it for the write-behind visit buffer.
+    """
+    visit = build_visit(short_url, request.remote_addr, request.user_agent.string, request.referrer)
     
-    db.session.add(visit)
-    db.session.commit()
+    # Queue the visit record; it is written in bulk by the visit buffer
+    visit_buffer.enqueue(visit)
     
-    return visit
\ No newline at end of file
+    return visit
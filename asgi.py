@@ -0,0 +1,6 @@
+from run import app
+from app.utils.async_redirect import AsyncRedirectServer
+
+# Redirects and health checks are served on the event loop; the admin pages
+# and API are passed to the Flask app from run.py
+application = AsyncRedirectServer(app)
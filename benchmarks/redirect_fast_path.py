@@ -0,0 +1,84 @@
+"""
+Measure redirect latency and throughput with and without the WSGI fast path.
+
+Runs against the database given by --database-url and sends the session
+cookie of a logged-in user with every request, as browsers do.
+
+    python benchmarks/redirect_fast_path.py --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def run(client, short_codes, requests):
+    """Send the redirects, returning per-request latencies in seconds and the total elapsed time"""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        before = time.perf_counter()
+        response = client.get(f'/{short_codes[i % len(short_codes)]}')
+        latencies.append(time.perf_counter() - before)
+        assert response.status_code == 302, response.status_code
+    return latencies, time.perf_counter() - start
+
+def report(label, latencies, elapsed):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{label:<12} {len(latencies) / elapsed:10.1f} req/s  '
+          f'p50 {quantiles[49] * 1000:7.3f} ms  p99 {quantiles[98] * 1000:7.3f} ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--links', type=int, default=100, help='links to redirect between')
+    parser.add_argument('--requests', type=int, default=20000, help='redirects per run')
+    args = parser.parse_args()
+
+    # create_app reads the database location from the environment
+    os.environ['DB_TYPE'] = 'external'
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['REDIRECT_FAST_PATH'] = 'true'
+
+    from app import create_app, db
+    from app.models import User, ShortURL
+
+    app = create_app()
+    with app.app_context():
+        unique_id = uuid.uuid4().hex[:8]
+        user = User(username=f'bench_{unique_id}', email=f'bench_{unique_id}@example.com',
+                    github_id=int(unique_id, 16))
+        db.session.add(user)
+        db.session.flush()
+        links = [
+            ShortURL(short_code=f'b{unique_id}{i}', target_url=f'https://example.com/{i}', user_id=user.id)
+            for i in range(args.links)
+        ]
+        db.session.add_all(links)
+        db.session.commit()
+        user_id = user.id
+        short_codes = [link.short_code for link in links]
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+
+    # Warm the link cache so both runs measure request handling, not lookups
+    run(client, short_codes, len(short_codes))
+    fast = run(client, short_codes, args.requests)
+
+    # The middleware keeps the Flask app it wraps
+    fast_path = app.wsgi_app
+    app.wsgi_app = fast_path.wsgi_app
+    flask = run(client, short_codes, args.requests)
+    app.wsgi_app = fast_path
+
+    print(f'database:    {args.database_url.split("@")[-1]}')
+    report('flask', *flask)
+    report('fast path', *fast)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Load test redirects under gunicorn (WSGI) and uvicorn (ASGI) at high concurrency.
+
+Creates links in the database given by --database-url, starts both servers
+on local ports against it, and reports requests/second and p50/p99 latency
+for each. Pass --no-link-cache to make every redirect wait on the database.
+Requires aiohttp and uvicorn.
+
+    python benchmarks/redirect_load.py --database-url sqlite:////tmp/bench.db --concurrency 256
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def create_links(count):
+    """Create a user with count links, returning their short codes"""
+    from app import create_app, db
+    from app.models import User, ShortURL
+
+    app = create_app()
+    with app.app_context():
+        unique_id = uuid.uuid4().hex[:8]
+        user = User(username=f'bench_{unique_id}', email=f'bench_{unique_id}@example.com',
+                    github_id=int(unique_id, 16))
+        db.session.add(user)
+        db.session.flush()
+        links = [
+            ShortURL(short_code=f'l{unique_id}{i}', target_url=f'https://example.com/{i}',
+                     redirect_url=f'https://example.com/{i}', user_id=user.id)
+            for i in range(count)
+        ]
+        db.session.add_all(links)
+        db.session.commit()
+        return [link.short_code for link in links]
+
+async def wait_until_live(session, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f'{base_url}/health/live') as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'{base_url} did not start')
+        await asyncio.sleep(0.2)
+
+async def load(base_url, short_codes, requests, concurrency):
+    """Send redirects from concurrency clients, returning latencies, errors and elapsed time"""
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_live(session, base_url)
+        # Warm the workers' link caches
+        for short_code in short_codes:
+            async with session.get(f'{base_url}/{short_code}', allow_redirects=False) as response:
+                await response.read()
+
+        latencies = []
+        errors = 0
+        sent = 0
+
+        async def client():
+            nonlocal errors, sent
+            while sent < requests:
+                short_code = short_codes[sent % len(short_codes)]
+                sent += 1
+                before = time.perf_counter()
+                try:
+                    async with session.get(f'{base_url}/{short_code}', allow_redirects=False) as response:
+                        await response.read()
+                        if response.status != 302:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - before)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+def run_server(label, command, base_url, env, args, short_codes):
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        latencies, errors, elapsed = asyncio.run(load(base_url, short_codes, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{label:<10} {len(latencies) / elapsed:10.1f} req/s  '
+          f'p50 {quantiles[49] * 1000:8.2f} ms  p99 {quantiles[98] * 1000:8.2f} ms  errors {errors}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--links', type=int, default=1000, help='links to redirect between')
+    parser.add_argument('--requests', type=int, default=20000, help='redirects per server')
+    parser.add_argument('--concurrency', type=int, default=256, help='requests in flight at once')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--threads', type=int, default=2, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--no-link-cache', action='store_true', help='look up every redirect in the database')
+    args = parser.parse_args()
+
+    # create_app reads the database location from the environment
+    env = dict(os.environ, DB_TYPE='external', DATABASE_URL=args.database_url,
+               GUNICORN_WORKERS=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    if args.no_link_cache:
+        env['LINK_CACHE_SIZE'] = '0'
+    os.environ.update(env)
+    short_codes = create_links(args.links)
+
+    print(f'database:  {args.database_url.split("@")[-1]}, {args.concurrency} concurrent requests')
+    bind = f'127.0.0.1:{args.port}'
+    run_server('gunicorn', [
+        sys.executable, '-m', 'gunicorn', '--bind', bind, '--workers', str(args.workers),
+        '--threads', str(args.threads), 'run:app'
+    ], f'http://{bind}', env, args, short_codes)
+    run_server('uvicorn', [
+        sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(args.port),
+        '--workers', str(args.workers), '--no-access-log', 'asgi:application'
+    ], f'http://{bind}', env, args, short_codes)
+
+if __name__ == '__main__':
+    main()
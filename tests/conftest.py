@@ -5,6 +5,7 @@ import uuid
 import datetime
 from app import create_app, db
 from app.models import User, ShortURL
+from app.utils.visit_buffer import visit_buffer
 
 # Create different data for each test to avoid conflicts
 @pytest.fixture(scope="function")
@@ -34,7 +35,8 @@ def app():
     # Return the app for testing
     yield test_app
     
-    # Clean up after the test
+    # Clean up after the test, writing any buffered visits first
+    visit_buffer.shutdown()
     with test_app.app_context():
         db.session.remove()
         db.drop_all()
@@ -91,4 +93,12 @@ def test_url(app, test_user):
         url_id = url.id
         
         # Return fresh URL object from the database using Session.get (avoiding Query.get deprecation)
-        return db.session.get(ShortURL, url_id)
\ No newline at end of file
+        return db.session.get(ShortURL, url_id)
+
+@pytest.fixture
+def auth_client(client, test_user):
+    """A test client logged in as the test user."""
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(test_user.id)
+        sess['_fresh'] = True
+    return client
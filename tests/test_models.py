@@ -66,4 +66,254 @@ def test_create_with_unique_code(app, test_user, test_url):
         )
         assert error is None
         assert url is not None
-        assert len(url.short_code) == 6
\ No newline at end of file
+        assert len(url.short_code) == 6
+
+def test_refresh_redirect_urls(app, test_user):
+    """Test that modifier changes only recompute links on the affected domain."""
+    import json
+    from app.models import DomainModifier
+    
+    with app.app_context():
+        matching, _ = ShortURL.create_with_unique_code('https://shop.example.com/item', test_user.id)
+        other, _ = ShortURL.create_with_unique_code('https://other.org/', test_user.id)
+        assert matching.redirect_url == 'https://shop.example.com/item'
+        
+        db.session.add(DomainModifier(
+            domain='example.com',
+            include_subdomains=True,
+            query_params=json.dumps({'tag': 'x'}),
+            user_id=test_user.id
+        ))
+        changed = ShortURL.refresh_redirect_urls(test_user.id, ['example.com'])
+        db.session.commit()
+        
+        assert changed == [matching.short_code]
+        assert db.session.get(ShortURL, matching.id).redirect_url == 'https://shop.example.com/item?tag=x'
+        assert db.session.get(ShortURL, other.id).redirect_url == 'https://other.org/'
+
+def test_refresh_redirect_urls_command(app, runner, test_user):
+    """Test that the refresh command recomputes stored redirect URLs in batches."""
+    from app.models import DomainModifier
+    
+    with app.app_context():
+        db.session.add(DomainModifier(domain='example.com', query_params='{"ref": "a"}', user_id=test_user.id))
+        db.session.commit()
+        ShortURL.create_with_unique_code('https://example.com/a', test_user.id, custom_code='legacy1')
+        ShortURL.create_with_unique_code('https://other.org/b', test_user.id, custom_code='legacy2')
+        # Links saved before redirect URLs were materialized
+        db.session.execute(db.update(ShortURL).values(redirect_url=None, target_host=None))
+        db.session.commit()
+    
+    result = runner.invoke(args=['refresh-redirect-urls', '--batch-size', '1'])
+    assert 'Refreshed redirect URLs for 2 links, 2 changed' in result.output
+    
+    with app.app_context():
+        links = {link.short_code: link for link in db.session.execute(db.select(ShortURL)).scalars()}
+        assert links['legacy1'].redirect_url == 'https://example.com/a?ref=a'
+        assert links['legacy2'].redirect_url == 'https://other.org/b'
+        assert links['legacy2'].target_host == 'other.org'
+
+def test_encode_sequence_number_is_unique():
+    """Test that sequence numbers map to distinct codes that grow when a length fills up."""
+    from app.utils.code_allocator import encode_sequence_number, scramble_rounds
+    
+    rounds = scramble_rounds('test-secret')
+    codes = {encode_sequence_number(n, rounds, min_length=2) for n in range(36 ** 2)}
+    assert len(codes) == 36 ** 2
+    assert all(len(code) == 2 for code in codes)
+    assert len(encode_sequence_number(36 ** 2, rounds, min_length=2)) == 3
+    assert encode_sequence_number(0, rounds) != encode_sequence_number(1, rounds)
+    # Codes depend on the secret
+    assert encode_sequence_number(0, rounds) != encode_sequence_number(0, scramble_rounds('other-secret'))
+
+def test_create_with_unique_code_skips_taken_codes(app, test_user):
+    """Test that generated codes colliding with custom codes are skipped."""
+    from app.utils.code_allocator import code_allocator, encode_sequence_number
+    
+    with app.app_context():
+        taken = encode_sequence_number(0, code_allocator.rounds)
+        url, error = ShortURL.create_with_unique_code('https://a.com', test_user.id, custom_code=taken)
+        assert error is None
+        
+        url, error = ShortURL.create_with_unique_code('https://b.com', test_user.id)
+        assert error is None
+        assert url.short_code == encode_sequence_number(1, code_allocator.rounds)
+
+def test_reconcile_visit_counts(app, runner, test_url):
+    """Test that the reconciliation command repairs drifted visit counters."""
+    with app.app_context():
+        other = ShortURL(short_code='other1', target_url='https://example.org', user_id=test_url.user_id)
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Visit(short_url_id=test_url.id))
+        db.session.add(Visit(short_url_id=test_url.id))
+        db.session.add(Visit(short_url_id=other.id))
+        db.session.commit()
+        other_id = other.id
+        assert db.session.get(ShortURL, test_url.id).visit_count == 0
+    
+    # One link per batch, so each batch only counts its own link's visits
+    result = runner.invoke(args=['reconcile-visit-counts', '--batch-size', '1'])
+    assert 'Checked 2 links, repaired 2 visit counters' in result.output
+    
+    with app.app_context():
+        assert db.session.get(ShortURL, test_url.id).visit_count == 2
+        assert db.session.get(ShortURL, other_id).visit_count == 1
+
+def test_visit_rollups_match_raw_visits(app, runner, test_url):
+    """Test that live rollups and the backfill command agree with the visit table."""
+    from datetime import datetime
+    from app.models import VisitRollup
+    from app.utils.visit_aggregates import increment_visit_rollups
+    
+    rows = [
+        {'short_url_id': test_url.id, 'browser': 'Firefox', 'country_name': 'France', 'timestamp': datetime(2024, 1, 1, 10, 5)},
+        {'short_url_id': test_url.id, 'browser': 'Firefox', 'country_name': None, 'timestamp': datetime(2024, 1, 1, 10, 55)},
+        {'short_url_id': test_url.id, 'browser': 'Chrome', 'country_name': 'France', 'timestamp': datetime(2024, 1, 1, 11, 0)}
+    ]
+    with app.app_context():
+        for row in rows:
+            db.session.add(Visit(**row))
+        increment_visit_rollups(rows)
+        increment_visit_rollups(rows[:1])
+        db.session.commit()
+        assert VisitRollup.breakdown('browser', short_url_id=test_url.id) == [('Firefox', 3), ('Chrome', 1)]
+    
+    result = runner.invoke(args=['backfill-visit-rollups'])
+    assert 'Rolled up 3 visits' in result.output
+    
+    with app.app_context():
+        assert VisitRollup.breakdown('browser', short_url_id=test_url.id) == [('Firefox', 2), ('Chrome', 1)]
+        assert VisitRollup.breakdown('country', user_id=test_url.user_id) == [('France', 2), (None, 1)]
+        assert db.session.scalar(
+            db.select(db.func.count()).select_from(VisitRollup).filter_by(dimension='browser')
+        ) == 2
+
+def test_unique_visitors_merge_across_days(app, test_url):
+    """Test that visitor sketches are merged across days and links."""
+    from datetime import datetime
+    from app.models import VisitorSketch
+    from app.utils.visit_aggregates import add_unique_visitors
+    
+    with app.app_context():
+        add_unique_visitors([
+            {'short_url_id': test_url.id, 'ip_address': '1.1.1.1', 'user_agent': 'A', 'timestamp': datetime(2024, 1, 1, 9)},
+            {'short_url_id': test_url.id, 'ip_address': '1.1.1.1', 'user_agent': 'A', 'timestamp': datetime(2024, 1, 1, 18)},
+            {'short_url_id': test_url.id, 'ip_address': '2.2.2.2', 'user_agent': 'A', 'timestamp': datetime(2024, 1, 1, 18)}
+        ])
+        add_unique_visitors([
+            {'short_url_id': test_url.id, 'ip_address': '1.1.1.1', 'user_agent': 'A', 'timestamp': datetime(2024, 1, 2, 9)},
+            {'short_url_id': test_url.id, 'ip_address': '3.3.3.3', 'user_agent': 'B', 'timestamp': datetime(2024, 1, 2, 9)}
+        ])
+        db.session.commit()
+        
+        assert db.session.scalar(db.select(db.func.count()).select_from(VisitorSketch)) == 2
+        assert VisitorSketch.unique_visitors(short_url_id=test_url.id) == 3
+        assert VisitorSketch.unique_visitors(user_id=test_url.user_id, start=datetime(2024, 1, 2).date()) == 2
+        
+        # Recent estimates only merge the sketches in their window
+        add_unique_visitors([{'short_url_id': test_url.id, 'ip_address': '4.4.4.4', 'user_agent': 'C'}])
+        db.session.commit()
+        assert VisitorSketch.recent_unique_visitors(30, short_url_id=test_url.id) == 1
+        assert VisitorSketch.recent_unique_visitors(30, user_id=test_url.user_id) == 1
+
+def test_archive_visits(app, runner, test_url, tmp_path):
+    """Test that old visits move to archive files without losing their aggregates."""
+    import json
+    from datetime import datetime
+    from app.models import VisitRollup
+    from app.utils.visit_aggregates import apply_visit_aggregates
+    
+    app.config['VISIT_ARCHIVE_DIR'] = str(tmp_path)
+    rows = [
+        {'short_url_id': test_url.id, 'browser': 'Firefox', 'user_agent': 'UA', 'timestamp': datetime(2020, 1, 5)},
+        {'short_url_id': test_url.id, 'browser': 'Chrome', 'user_agent': 'UA', 'timestamp': datetime(2020, 2, 5)},
+        {'short_url_id': test_url.id, 'browser': 'Chrome', 'user_agent': 'UA', 'timestamp': datetime(2020, 2, 6)}
+    ]
+    with app.app_context():
+        for row in rows:
+            db.session.add(Visit(**row))
+        # Only the January visit made it into the aggregates
+        apply_visit_aggregates(rows[:1])
+        db.session.add(Visit(short_url_id=test_url.id, browser='Safari', timestamp=datetime.now()))
+        db.session.commit()
+    
+    result = runner.invoke(args=['archive-visits', '--older-than-days', '30'])
+    assert 'Archived 3 visits into 2 files, rebuilt aggregates for 1 link-months' in result.output
+    assert (tmp_path / str(test_url.id) / '2020-02.json.gz').exists()
+    
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Visit)) == 1
+        assert db.session.get(ShortURL, test_url.id).archived_visit_count == 3
+        assert VisitRollup.breakdown('browser', short_url_id=test_url.id) == [('Chrome', 2), ('Firefox', 1)]
+    
+    result = runner.invoke(args=['read-visit-archive', '--since', '2020-02-01'])
+    replayed = [json.loads(line) for line in result.output.splitlines()]
+    assert [row['timestamp'] for row in replayed] == ['2020-02-05T00:00:00', '2020-02-06T00:00:00']
+    assert replayed[0]['user_agent'] == 'UA'
+    
+    # Rebuilding from scratch replays the archives, and reconciliation keeps archived visits
+    runner.invoke(args=['backfill-visit-rollups'])
+    result = runner.invoke(args=['reconcile-visit-counts'])
+    with app.app_context():
+        assert VisitRollup.breakdown('browser', short_url_id=test_url.id) == [('Chrome', 2), ('Firefox', 1), ('Safari', 1)]
+        assert db.session.get(ShortURL, test_url.id).visit_count == 4
+
+def test_crosstab_command(app, runner, test_url):
+    """Test the cross-tab command over visits in the database."""
+    import json
+    import pytest
+    pytest.importorskip('numpy')
+    
+    with app.app_context():
+        for device, browser in [('mobile', 'Safari'), ('mobile', 'Safari'), ('desktop', 'Safari')]:
+            db.session.add(Visit(short_url_id=test_url.id, device_type=device, browser=browser))
+        db.session.commit()
+    
+    result = runner.invoke(args=['crosstab', '--by', 'device', '--by', 'browser', '--format', 'json', '--chunk-size', '2'])
+    data = json.loads(result.output)
+    assert data['total_visits'] == 3
+    assert data['rows'] == [
+        {'device': 'mobile', 'browser': 'Safari', 'visits': 2},
+        {'device': 'desktop', 'browser': 'Safari', 'visits': 1}
+    ]
+
+def test_modifier_index_tracks_changes(app, test_user):
+    """Test that the per-owner modifier index picks up modifier changes."""
+    from app.models import DomainModifier
+    from app.utils.modifier_index import modifier_index
+    
+    with app.app_context():
+        db.session.add(DomainModifier(domain='example.com', query_params='{"ref": "a"}', user_id=test_user.id))
+        db.session.commit()
+        assert DomainModifier.apply_modifiers('https://example.com/', user_id=test_user.id) == 'https://example.com/?ref=a'
+        
+        modifier = db.session.execute(db.select(DomainModifier)).scalar_one()
+        modifier.query_params = '{"ref": "b"}'
+        db.session.commit()
+        
+        # Within the check interval the cached matcher is served until invalidated
+        modifier_index.invalidate(test_user.id)
+        assert DomainModifier.apply_modifiers('https://example.com/', user_id=test_user.id) == 'https://example.com/?ref=b'
+        
+        # Changes from other workers are noticed through the version check
+        modifier_index.check_interval = 0
+        modifier.active = False
+        db.session.commit()
+        assert DomainModifier.apply_modifiers('https://example.com/', user_id=test_user.id) == 'https://example.com/'
+
+def test_new_links_use_current_modifiers(app, test_user):
+    """Test that stored redirect URLs aren't built from a stale modifier index."""
+    from app.models import DomainModifier
+    from app.utils.modifier_index import modifier_index
+    
+    with app.app_context():
+        # Warm this worker's index, then add a modifier as another worker would
+        assert DomainModifier.apply_modifiers('https://example.com/', user_id=test_user.id) == 'https://example.com/'
+        db.session.add(DomainModifier(domain='example.com', query_params='{"ref": "a"}', user_id=test_user.id))
+        db.session.commit()
+        modifier_index.check_interval = 3600
+        
+        short_url, error = ShortURL.create_with_unique_code('https://example.com/new', test_user.id)
+        assert error is None
+        assert short_url.redirect_url == 'https://example.com/new?ref=a'
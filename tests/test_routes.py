@@ -35,4 +35,588 @@ def test_api_create_url_route_unauthenticated(client, app):
             content_type='application/json'
         )
         # Should redirect to login page since we're not authenticated
-        assert response.status_code == 302
\ No newline at end of file
+        assert response.status_code == 302
+
+def test_redirect_cache_invalidated_on_edit(auth_client, app, test_url):
+    """Test that editing a URL invalidates the cached redirect target."""
+    with app.test_request_context():
+        response = auth_client.get(f'/{test_url.short_code}')
+        assert response.location == 'https://example.com'
+        
+        response = auth_client.post(
+            url_for('admin.edit_url', url_id=test_url.id),
+            data={'target_url': 'https://example.org'}
+        )
+        assert response.status_code == 302
+        
+        response = auth_client.get(f'/{test_url.short_code}')
+        assert response.location == 'https://example.org'
+
+def test_redirect_cache_invalidated_on_delete(auth_client, app, test_url):
+    """Test that deleting a URL through the API stops it redirecting."""
+    with app.test_request_context():
+        response = auth_client.get(f'/{test_url.short_code}')
+        assert response.status_code == 302
+        
+        response = auth_client.delete(url_for('api.delete_url', url_id=test_url.id))
+        assert response.status_code == 200
+        
+        response = auth_client.get(f'/{test_url.short_code}')
+        assert response.status_code == 404
+
+def test_redirect_buffers_visit(client, app, test_url):
+    """Test that redirects queue visits and the buffer writes them in bulk."""
+    from app import db
+    from app.models import Visit
+    from app.utils.visit_buffer import visit_buffer
+    
+    with app.test_request_context():
+        for _ in range(3):
+            response = client.get(f'/{test_url.short_code}', headers={'User-Agent': 'Mozilla/5.0'})
+            assert response.status_code == 302
+    
+    visit_buffer.flush()
+    
+    with app.app_context():
+        visits = db.session.execute(
+            db.select(Visit).filter_by(short_url_id=test_url.id)
+        ).scalars().all()
+        assert len(visits) == 3
+        assert visits[0].timestamp is not None
+
+def test_redirect_applies_owner_modifiers(auth_client, client, app, test_url):
+    """Test that modifier changes are materialized into the redirect target."""
+    with app.test_request_context():
+        response = auth_client.post(
+            url_for('api.create_domain_modifier'),
+            data=json.dumps({'domain': 'example.com', 'query_params': {'ref': 'abc'}}),
+            content_type='application/json'
+        )
+        assert response.status_code == 201
+        modifier_id = response.get_json()['id']
+        
+        # Anonymous visitors get the owner's modifiers
+        with app.test_client() as anonymous:
+            response = anonymous.get(f'/{test_url.short_code}')
+            assert response.location == 'https://example.com?ref=abc'
+        
+        response = auth_client.patch(
+            url_for('api.update_domain_modifier', modifier_id=modifier_id),
+            data=json.dumps({'active': False}),
+            content_type='application/json'
+        )
+        assert response.status_code == 200
+        
+        with app.test_client() as anonymous:
+            response = anonymous.get(f'/{test_url.short_code}')
+            assert response.location == 'https://example.com'
+
+def test_top_links_route(auth_client, app, test_url):
+    """Test that the top links endpoint reports the user's redirected links."""
+    with app.test_request_context():
+        for _ in range(2):
+            auth_client.get(f'/{test_url.short_code}')
+        auth_client.get('/nonexistent')
+        
+        response = auth_client.get(url_for('api.top_links'))
+        assert response.status_code == 200
+        links = response.get_json()['links']
+        assert links[0]['short_code'] == test_url.short_code
+        assert links[0]['estimated_visits'] == 2
+
+def test_create_urls_batch(auth_client, app, test_url):
+    """Test bulk creation with per-item results."""
+    with app.test_request_context():
+        response = auth_client.post(
+            url_for('api.create_urls_batch'),
+            data=json.dumps([
+                {'target_url': 'https://one.example.com'},
+                {'target_url': 'https://two.example.com', 'custom_code': 'batch2'},
+                {'target_url': 'not a url'},
+                {'target_url': 'https://three.example.com', 'custom_code': test_url.short_code},
+            ]),
+            content_type='application/json'
+        )
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['created'] == 2
+        assert data['failed'] == 2
+        statuses = [result['status'] for result in data['results']]
+        assert statuses == ['created', 'created', 'error', 'error']
+        assert data['results'][1]['short_code'] == 'batch2'
+        
+        response = auth_client.get('/batch2')
+        assert response.location == 'https://two.example.com'
+
+def test_create_urls_batch_ndjson(auth_client, app):
+    """Test bulk creation from an NDJSON body."""
+    with app.test_request_context():
+        body = '\n'.join(json.dumps({'target_url': f'https://example.com/{i}'}) for i in range(25))
+        response = auth_client.post(
+            url_for('api.create_urls_batch'),
+            data=body,
+            content_type='application/x-ndjson'
+        )
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['created'] == 25
+        assert len({result['short_code'] for result in data['results']}) == 25
+
+def test_export_and_import_urls(auth_client, app, test_url):
+    """Test that exported links can be imported back as updates and new links."""
+    with app.test_request_context():
+        response = auth_client.get(url_for('api.export_urls', format='ndjson'))
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert rows == [{
+            'short_code': test_url.short_code,
+            'target_url': 'https://example.com',
+            'apply_modifiers': True,
+            'created_at': rows[0]['created_at'],
+            'visit_count': 0
+        }]
+        
+        response = auth_client.get(url_for('api.export_urls', format='csv'))
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines[0] == 'short_code,target_url,apply_modifiers,created_at,visit_count'
+        assert lines[1].startswith(f'{test_url.short_code},https://example.com,True,')
+        
+        body = (
+            f'short_code,target_url,apply_modifiers\n'
+            f'{test_url.short_code},https://example.net,false\n'
+            f'imported1,https://example.org,true\n'
+            f',not-a-url,true\n'
+        )
+        response = auth_client.post(url_for('api.import_urls'), data=body, content_type='text/csv')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert (data['created'], data['updated'], data['failed']) == (1, 1, 1)
+        assert data['errors'][0]['record'] == 3
+        
+        assert auth_client.get(f'/{test_url.short_code}').location == 'https://example.net'
+        assert auth_client.get('/imported1').location == 'https://example.org'
+
+def test_visit_counts_maintained_on_ingest(auth_client, app, test_url):
+    """Test that listings read the visit counter maintained by the visit buffer."""
+    from app.utils.visit_buffer import visit_buffer
+    
+    with app.test_request_context():
+        for _ in range(3):
+            auth_client.get(f'/{test_url.short_code}')
+        visit_buffer.flush()
+        
+        response = auth_client.get(url_for('api.get_urls'))
+        assert response.get_json()['urls'][0]['visit_count'] == 3
+        
+        response = auth_client.get(url_for('admin.dashboard'))
+        assert response.status_code == 200
+        
+        response = auth_client.get(url_for('admin.user_analytics'))
+        assert response.status_code == 200
+        assert b'<p class="h3 mb-0">3</p>' in response.data
+
+def test_get_urls_keyset_pagination(auth_client, app, test_user):
+    """Test that URL listings page through every link exactly once."""
+    from app.models import ShortURL
+    
+    with app.app_context():
+        for i in range(7):
+            ShortURL.create_with_unique_code(f'https://example.com/{i}', test_user.id)
+    
+    with app.test_request_context():
+        seen = []
+        cursor = None
+        while True:
+            response = auth_client.get(url_for('api.get_urls', limit=3, cursor=cursor))
+            assert response.status_code == 200
+            data = response.get_json()
+            seen.extend(url['id'] for url in data['urls'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        
+        assert len(seen) == 7
+        assert seen == sorted(seen, reverse=True)
+        
+        response = auth_client.get(url_for('api.get_urls', cursor='garbage'))
+        assert response.status_code == 400
+        
+        response = auth_client.get(url_for('admin.dashboard', limit=3))
+        assert response.status_code == 200
+        assert b'Older' in response.data
+
+def test_url_analytics_pages_visits(auth_client, app, test_url):
+    """Test that the URL analytics page pages through raw visits."""
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models import Visit
+    
+    with app.app_context():
+        start = datetime(2024, 1, 1)
+        for i in range(5):
+            db.session.add(Visit(short_url_id=test_url.id, referrer=f'https://ref{i}.example.com/', timestamp=start + timedelta(minutes=i)))
+        db.session.commit()
+    
+    with app.test_request_context():
+        response = auth_client.get(url_for('admin.url_analytics', url_id=test_url.id, limit=3))
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        assert 'ref4.example.com' in page and 'ref2.example.com' in page and 'ref1.example.com' not in page
+        assert 'Older' in page
+        
+        cursor = page.split('cursor=')[1].split('&')[0].split('"')[0]
+        response = auth_client.get(url_for('admin.url_analytics', url_id=test_url.id, limit=3, cursor=cursor))
+        page = response.get_data(as_text=True)
+        assert 'ref1.example.com' in page and 'ref0.example.com' in page and 'ref2.example.com' not in page
+
+def test_url_timeseries(auth_client, app, test_url):
+    """Test the click time series endpoints."""
+    from datetime import datetime, timedelta, UTC
+    from app import db
+    from app.utils.visit_aggregates import increment_click_buckets
+    
+    with app.app_context():
+        increment_click_buckets([
+            {'short_url_id': test_url.id, 'timestamp': datetime(2024, 1, 1, 10, 5)},
+            {'short_url_id': test_url.id, 'timestamp': datetime(2024, 1, 1, 10, 50)},
+            {'short_url_id': test_url.id, 'timestamp': datetime(2024, 1, 1, 12, 0)}
+        ])
+        db.session.commit()
+    
+    with app.test_request_context():
+        response = auth_client.get(url_for(
+            'api.url_timeseries', url_id=test_url.id, interval='hour',
+            start='2024-01-01T09:30:00', end='2024-01-01T12:00:00'
+        ))
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 3
+        assert [point['count'] for point in data['points']] == [0, 2, 0, 1]
+        assert data['points'][1]['timestamp'] == '2024-01-01T10:00:00'
+        
+        response = auth_client.get(url_for('api.user_timeseries', interval='day', start='2024-01-01', end='2024-01-02'))
+        assert [point['count'] for point in response.get_json()['points']] == [3, 0]
+        
+        response = auth_client.get(url_for('api.user_timeseries', interval='minute', start='2020-01-01', end='2024-01-01'))
+        assert response.status_code == 400
+        
+        # Offsets are converted to UTC, and a start without an offset works with the default end
+        response = auth_client.get(url_for(
+            'api.url_timeseries', url_id=test_url.id, interval='hour',
+            start='2024-01-01T11:30:00+01:00', end='2024-01-01T12:00:00Z'
+        ))
+        assert [point['count'] for point in response.get_json()['points']] == [2, 0, 1]
+        start = (datetime.now(UTC) - timedelta(hours=2)).replace(tzinfo=None).isoformat()
+        response = auth_client.get(url_for('api.user_timeseries', interval='hour', start=start))
+        assert response.status_code == 200
+        assert len(response.get_json()['points']) == 3
+
+def test_dry_run_domain_modifiers(auth_client, app, test_user):
+    """Test the streaming domain modifier dry run over links and uploaded URLs."""
+    import json
+    from app import db
+    from app.models import ShortURL, DomainModifier
+    
+    with app.app_context():
+        db.session.add(DomainModifier(domain='example.com', query_params='{"ref": "a"}', user_id=test_user.id))
+        db.session.commit()
+        ShortURL.create_with_unique_code('https://example.com/x', test_user.id, custom_code='ex')
+        ShortURL.create_with_unique_code('https://shop.other.com/y', test_user.id, custom_code='other')
+    
+    with app.test_request_context():
+        response = auth_client.post(url_for('api.dry_run_domain_modifiers'), json={
+            'modifiers': [{'domain': 'other.com', 'include_subdomains': True, 'query_params': {'tag': 'b'}}]
+        })
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0] == {
+            'short_code': 'other',
+            'url': 'https://shop.other.com/y',
+            'current': 'https://shop.other.com/y',
+            'proposed': 'https://shop.other.com/y?tag=b',
+            'changed': True
+        }
+        assert lines[-1]['summary']['checked'] == 2
+        assert lines[-1]['summary']['changed_by_host'] == {'shop.other.com': 1}
+        
+        # Only the proposed set, against an uploaded list
+        response = auth_client.post(url_for('api.dry_run_domain_modifiers'), json={
+            'modifiers': [{'domain': 'other.com', 'query_params': {'tag': 'b'}}],
+            'include_existing': False,
+            'urls': ['https://example.com/', 'https://other.com/', 42]
+        })
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0]['proposed'] == 'https://other.com/?tag=b'
+        assert lines[1] == {'url': 42, 'error': 'Invalid URL'}
+        assert lines[-1]['summary'] == {
+            'checked': 2, 'changed': 1, 'unchanged': 1, 'invalid': 1, 'changed_by_host': {'other.com': 1}
+        }
+        
+        response = auth_client.post(url_for('api.dry_run_domain_modifiers'), json={'modifiers': [{'domain': 'x'}]})
+        assert response.status_code == 400
+    
+    # Links saved before redirect URLs were materialized resolve through the live modifiers
+    with app.app_context():
+        db.session.execute(db.update(ShortURL).filter_by(short_code='ex').values(redirect_url=None))
+        db.session.commit()
+    with app.test_request_context():
+        response = auth_client.post(url_for('api.dry_run_domain_modifiers'), json={'include_unchanged': True})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0]['current'] == 'https://example.com/x?ref=a'
+        assert lines[-1]['summary']['changed'] == 0
+
+def test_replica_routing(app, test_user, test_url, tmp_path, monkeypatch):
+    """Test that analytics and redirect lookups read from the replica, falling back to the primary."""
+    from app import create_app, db
+    from app.models import ShortURL
+    from app.utils.visit_buffer import visit_buffer
+    from app.utils.db_routing import replica_router
+    
+    def logged_in_client(replica_app):
+        client = replica_app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(test_user.id)
+            sess['_fresh'] = True
+        return client
+    
+    monkeypatch.setenv('DATABASE_REPLICA_URL', f'sqlite:///{tmp_path}/replica.db')
+    replica_app = create_app()
+    with replica_app.app_context():
+        # Stand-in for replication: the replica holds a copy of the link with more visits
+        db.metadata.create_all(replica_router.engine)
+        with replica_router.engine.begin() as connection:
+            connection.execute(ShortURL.__table__.insert(), {
+                'id': test_url.id, 'short_code': test_url.short_code, 'target_url': test_url.target_url,
+                'user_id': test_user.id, 'redirect_url': test_url.target_url, 'visit_count': 42
+            })
+        ShortURL.create_with_unique_code('https://example.org', test_user.id, custom_code='fresh')
+    
+    client = logged_in_client(replica_app)
+    assert client.get(f'/api/urls/{test_url.id}/analytics').get_json()['total_visits'] == 42
+    # Links that haven't reached the replica are found on the primary
+    assert client.get('/fresh').status_code == 302
+    visit_buffer.shutdown()
+    
+    monkeypatch.setenv('DATABASE_REPLICA_URL', f'sqlite:///{tmp_path}/missing/replica.db')
+    client = logged_in_client(create_app())
+    assert client.get(f'/api/urls/{test_url.id}/analytics').get_json()['total_visits'] == 0
+    visit_buffer.shutdown()
+
+def test_replica_rows_not_shared(app, test_user, test_url, tmp_path, monkeypatch):
+    """Test that links read from a lagging replica after an edit aren't written to the shared cache."""
+    from app import create_app, db
+    from app.models import ShortURL
+    from app.utils.db_routing import replica_router
+    from app.utils.link_cache import get_link, invalidate_link, shared_link_cache
+    from app.utils.shared_cache import MemoryBackend
+    from app.utils.visit_buffer import visit_buffer
+    
+    monkeypatch.setenv('DATABASE_REPLICA_URL', f'sqlite:///{tmp_path}/replica.db')
+    replica_app = create_app()
+    backend = MemoryBackend()
+    shared_link_cache.configure(backend, sync_interval=0)
+    try:
+        with replica_app.app_context():
+            # The replica still holds the link as it was before the edit
+            db.metadata.create_all(replica_router.engine)
+            with replica_router.engine.begin() as connection:
+                connection.execute(ShortURL.__table__.insert(), {
+                    'id': test_url.id, 'short_code': test_url.short_code, 'target_url': 'https://example.com',
+                    'user_id': test_user.id, 'redirect_url': 'https://example.com'
+                })
+            db.session.execute(
+                db.update(ShortURL).filter_by(id=test_url.id)
+                .values(target_url='https://example.org', redirect_url='https://example.org')
+            )
+            db.session.commit()
+            invalidate_link(test_url.short_code)
+            
+            assert get_link(test_url.short_code).target_url == 'https://example.com'
+            assert backend.get(test_url.short_code) is None
+            
+            # Rows found on the primary are still shared
+            ShortURL.create_with_unique_code('https://example.net', test_user.id, custom_code='fresh')
+            assert get_link('fresh').target_url == 'https://example.net'
+            assert backend.get('fresh') is not None
+    finally:
+        shared_link_cache.configure(None)
+        visit_buffer.shutdown()
+
+def test_redirect_fast_path_skips_session(auth_client, app, test_url, monkeypatch):
+    """Test that redirects are served without opening the session."""
+    opened = []
+    open_session = app.session_interface.open_session
+    def counting_open_session(flask_app, request):
+        opened.append(request.path)
+        return open_session(flask_app, request)
+    monkeypatch.setattr(app.session_interface, 'open_session', counting_open_session)
+    
+    response = auth_client.get(f'/{test_url.short_code}')
+    assert response.status_code == 302
+    assert response.location == 'https://example.com'
+    assert opened == []
+    
+    response = auth_client.head(f'/{test_url.short_code}')
+    assert response.status_code == 302
+    assert response.data == b''
+    
+    # Unknown codes and other routes still go through Flask, which reuses the middleware's miss
+    from app.routes import main
+    looked_up = []
+    monkeypatch.setattr(main, 'get_link', lambda short_code: looked_up.append(short_code))
+    assert auth_client.get('/nonexistent').status_code == 404
+    assert auth_client.get('/api/urls').status_code == 200
+    assert opened == ['/nonexistent', '/api/urls']
+    assert looked_up == []
+
+def _asgi_request(server, method, path, headers=(), body=b''):
+    """Send one HTTP request to an ASGI app, returning (status, headers, body)"""
+    import asyncio
+    
+    # A list body is sent as one message per chunk
+    chunks = list(body) if isinstance(body, list) else [body]
+    messages = []
+    async def receive():
+        return {'type': 'http.request', 'body': chunks.pop(0), 'more_body': bool(chunks)}
+    async def send(message):
+        messages.append(message)
+    
+    path, _, query = path.partition('?')
+    asyncio.run(server({
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [(b'host', b'localhost.localdomain'), *headers],
+        'client': ('203.0.113.5', 50000),
+        'server': ('localhost.localdomain', 80)
+    }, receive, send))
+    
+    start = messages[0]
+    return (
+        start['status'],
+        dict(start['headers']),
+        b''.join(message.get('body', b'') for message in messages[1:])
+    )
+
+def test_asgi_redirect_server(app, test_url, monkeypatch):
+    """Test that the ASGI server redirects on the event loop and hands everything else to Flask."""
+    from app import db
+    from app.models import Visit
+    import asyncio
+    from app.utils import visitor_tracking
+    from app.utils.async_redirect import AsyncRedirectServer
+    from app.utils.visit_buffer import visit_buffer
+    
+    # Visits are parsed by the visit buffer, off the event loop
+    on_loop = []
+    def build_visit(*args):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return real_build_visit(*args)
+    real_build_visit = visitor_tracking.build_visit
+    monkeypatch.setattr(visitor_tracking, 'build_visit', build_visit)
+    
+    server = AsyncRedirectServer(app)
+    try:
+        # The first lookup goes to the database thread pool, the second is served from the cache
+        for _ in range(2):
+            status, headers, body = _asgi_request(
+                server, 'GET', f'/{test_url.short_code}', [(b'user-agent', b'Mozilla/5.0')]
+            )
+            assert status == 302
+            assert headers[b'location'] == b'https://example.com'
+        
+        status, headers, body = _asgi_request(server, 'HEAD', f'/{test_url.short_code}')
+        assert status == 302
+        assert body == b''
+        
+        status, _, body = _asgi_request(server, 'GET', '/health/ready')
+        assert status == 200
+        assert json.loads(body) == {'status': 'ready'}
+        
+        # Unknown codes and other routes are served by Flask, without a second lookup
+        from app.routes import main
+        looked_up = []
+        monkeypatch.setattr(main, 'get_link', lambda short_code: looked_up.append(short_code))
+        status, _, _ = _asgi_request(server, 'GET', '/nonexistent')
+        assert status == 404
+        assert looked_up == []
+        status, headers, _ = _asgi_request(server, 'GET', '/api/urls?page=1')
+        assert status == 302
+        assert b'/auth/' in headers[b'location']
+    finally:
+        server.close()
+    
+    visit_buffer.flush()
+    with app.app_context():
+        visits = db.session.execute(
+            db.select(Visit).filter_by(short_url_id=test_url.id)
+        ).scalars().all()
+        assert len(visits) == 3
+        assert {visit.ip_address for visit in visits} == {'203.0.113.5'}
+    assert on_loop == [False] * 3
+
+def test_asgi_streams_request_bodies(auth_client, app, test_user):
+    """Test that the ASGI server feeds request bodies to Flask as they arrive."""
+    from app.utils.async_redirect import AsyncRedirectServer
+    
+    records = [json.dumps({'short_code': f'streamed{i}', 'target_url': f'https://example.com/{i}'}) for i in range(3)]
+    body = ('\n'.join(records) + '\n').encode()
+    # Split lines across messages, as a client uploading in chunks would
+    chunks = [body[i:i + 16] for i in range(0, len(body), 16)]
+    cookie = f"session={auth_client.get_cookie('session', domain='localhost.localdomain').value}"
+    
+    server = AsyncRedirectServer(app)
+    try:
+        status, _, response = _asgi_request(
+            server, 'POST', '/api/urls/import',
+            [(b'content-type', b'application/x-ndjson'), (b'cookie', cookie.encode())], chunks
+        )
+    finally:
+        server.close()
+    
+    assert status == 200
+    assert json.loads(response)['created'] == 3
+
+def test_user_loader_cached(auth_client, app, test_user, monkeypatch):
+    """Test that logged-in requests reuse the cached user and GitHub logins drop it."""
+    from app.routes import auth
+    from app.utils.monitoring import db_query_counter
+    from app.utils.user_cache import user_cache
+    
+    def user_selects():
+        return db_query_counter.labels(bind='primary', statement='select')._value.get()
+    
+    # Only the first request loads the user from the database
+    selects = []
+    for _ in range(2):
+        before = user_selects()
+        response = auth_client.get('/api/urls')
+        assert response.status_code == 200
+        selects.append(user_selects() - before)
+    assert selects[0] == selects[1] + 1
+    
+    class FakeResponse:
+        def __init__(self, data):
+            self.status_code = 200
+            self.data = data
+        def json(self):
+            return self.data
+    
+    def fake_get(url, headers):
+        if url.endswith('/emails'):
+            return FakeResponse([{'email': test_user.email, 'primary': True}])
+        return FakeResponse({'id': test_user.github_id, 'login': test_user.username, 'avatar_url': None})
+    monkeypatch.setattr(auth.requests, 'post', lambda *args, **kwargs: FakeResponse({'access_token': 'token'}))
+    monkeypatch.setattr(auth.requests, 'get', fake_get)
+    
+    # Logging in again drops the cached copy
+    assert user_cache.get(test_user.id) is not None
+    with app.test_request_context():
+        response = auth_client.get(url_for('auth.github_callback', code='abc'))
+        assert response.status_code == 302
+    assert user_cache.get(test_user.id) is None
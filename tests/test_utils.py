@@ -0,0 +1,347 @@
+import time
+import pytest
+from app.utils.caching import LRUCache
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the LRU cache stays within its size limit."""
+    cache = LRUCache('test', maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now least recently used
+    cache.set('c', 3)
+    
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+def test_lru_cache_expires_entries():
+    """Test that entries older than the TTL are not returned."""
+    cache = LRUCache('test', maxsize=10, ttl=0.01)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert 'a' not in cache
+
+def test_visit_buffer_drops_when_full(app, test_url):
+    """Test that the visit buffer drops visits instead of blocking when full."""
+    from app.utils.visit_buffer import VisitBuffer
+    
+    app.config['VISIT_BUFFER_SIZE'] = 2
+    buffer = VisitBuffer()
+    buffer.init_app(app)
+    buffer._ensure_started = lambda: None  # Keep the flusher thread out of the way
+    
+    row = {'short_url_id': test_url.id}
+    assert buffer.enqueue(row)
+    assert buffer.enqueue(row)
+    assert not buffer.enqueue(row)
+
+def test_visit_buffer_retries_deadlocks(app, test_url, monkeypatch):
+    """Test that a batch rolled back by a deadlock is written again instead of dropped."""
+    from sqlalchemy.exc import OperationalError
+    from app import db
+    from app.models import Visit
+    from app.utils import visit_buffer as visit_buffer_module
+    from app.utils.visit_buffer import VisitBuffer
+    
+    buffer = VisitBuffer()
+    buffer.init_app(app)
+    insert = buffer._insert
+    attempts = []
+    
+    def deadlock_once(rows):
+        attempts.append(len(rows))
+        if len(attempts) == 1:
+            raise OperationalError('INSERT', {}, Exception('deadlock detected'))
+        insert(rows)
+    
+    buffer._insert = deadlock_once
+    monkeypatch.setattr(visit_buffer_module, 'WRITE_RETRY_DELAY', 0)
+    buffer._write([{'short_url_id': test_url.id}, {'short_url_id': test_url.id}])
+    
+    assert attempts == [2, 2]
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Visit.id))) == 2
+
+def test_bloom_filter_membership():
+    """Test that the Bloom filter never forgets added keys."""
+    from app.utils.short_code_filter import BloomFilter
+    
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    codes = [f'CODE{i}' for i in range(1000)]
+    for code in codes:
+        bloom.add(code)
+    
+    assert all(code in bloom for code in codes)
+    false_positives = sum(f'MISSING{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert 0 < bloom.false_positive_rate < 0.05
+    assert bloom.memory_bytes < 2000
+
+def test_short_code_filter_tracks_new_codes(app, test_user):
+    """Test that newly created short codes pass the filter and unknown ones don't."""
+    from app.models import ShortURL
+    from app.utils.short_code_filter import short_code_filter
+    
+    with app.app_context():
+        short_url, error = ShortURL.create_with_unique_code(
+            target_url='https://example.com',
+            user_id=test_user.id,
+            custom_code='filtered'
+        )
+        assert error is None
+        assert short_code_filter.might_exist('filtered')
+        assert not short_code_filter.might_exist('definitely-not-a-code')
+
+def test_short_code_filter_rejects_without_queries(app, client, test_user):
+    """Test that the filter is built on first use, rejects unknown codes without a query and syncs other workers' codes."""
+    from app import db
+    from app.models import ShortURL
+    from app.utils.monitoring import db_query_counter
+    from app.utils.short_code_filter import short_code_filter
+    
+    def selects():
+        return db_query_counter.labels(bind='primary', statement='select')._value.get()
+    
+    # Creating the app doesn't scan the table
+    assert short_code_filter._filter is None
+    with app.app_context():
+        assert not short_code_filter.might_exist('elsewhere')
+    assert short_code_filter._filter is not None
+    
+    # Unknown codes are answered from memory
+    before = selects()
+    assert client.get('/not-a-code').status_code == 404
+    assert selects() == before
+    
+    with app.app_context():
+        # A core INSERT skips the ORM hook, like a link created by another worker
+        db.session.execute(db.insert(ShortURL).values(
+            short_code='elsewhere', target_url='https://example.com', user_id=test_user.id
+        ))
+        db.session.commit()
+        
+        # It is picked up by the next sync
+        short_code_filter.sync_interval = 0
+        short_code_filter.sync()
+        assert short_code_filter.might_exist('elsewhere')
+
+def test_parse_user_agent_is_memoized(app):
+    """Test that parsed user agents are served from the cache on repeat lookups."""
+    from app.utils.visitor_tracking import parse_user_agent, user_agent_cache
+    
+    ua = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
+    parsed = parse_user_agent(ua)
+    assert parsed[0] == 'Mobile Safari'
+    assert parsed[2] == 'mobile'
+    assert parsed[3] == 'iOS'
+    
+    assert ua in user_agent_cache
+    assert parse_user_agent(ua) is parsed
+
+def test_lookup_location_caches_by_prefix(app, monkeypatch):
+    """Test that GeoIP lookups are shared by addresses in the same network prefix."""
+    from types import SimpleNamespace
+    from app.utils import visitor_tracking
+    
+    calls = []
+    
+    class FakeReader:
+        def city(self, ip):
+            calls.append(ip)
+            return SimpleNamespace(
+                country=SimpleNamespace(iso_code='NZ', name='New Zealand'),
+                city=SimpleNamespace(name='Wellington')
+            )
+    
+    monkeypatch.setattr(visitor_tracking, 'get_geoip_reader', lambda: FakeReader())
+    
+    assert visitor_tracking.lookup_location('203.0.113.7') == ('NZ', 'New Zealand', 'Wellington')
+    assert visitor_tracking.lookup_location('203.0.113.200') == ('NZ', 'New Zealand', 'Wellington')
+    assert visitor_tracking.lookup_location('198.51.100.1') == ('NZ', 'New Zealand', 'Wellington')
+    assert calls == ['203.0.113.7', '198.51.100.1']
+    assert visitor_tracking.lookup_location('not an ip') == (None, None, None)
+
+def test_space_saving_tracks_heavy_hitters():
+    """Test that the heavy-hitters sketch keeps frequent keys within a fixed size."""
+    from app.utils.heavy_hitters import SpaceSaving
+    
+    sketch = SpaceSaving(capacity=10)
+    for i in range(1000):
+        sketch.add('hot')
+        if i % 2 == 0:
+            sketch.add('warm')
+        sketch.add(f'noise{i}')
+    
+    top = sketch.top(2)
+    assert [key for key, _, _ in top] == ['hot', 'warm']
+    hot_count, hot_error = top[0][1], top[0][2]
+    assert hot_count - hot_error <= 1000 <= hot_count
+    assert len(sketch.top()) == 10
+    assert sketch.total == 2500
+
+def test_hyperloglog_estimates_and_merges():
+    """Test HyperLogLog estimates, merging and serialization."""
+    from app.utils.hyperloglog import HyperLogLog
+    
+    first = HyperLogLog(12)
+    second = HyperLogLog(12)
+    for i in range(20000):
+        first.add(f'visitor-{i}')
+        first.add(f'visitor-{i}')
+    for i in range(10000, 30000):
+        second.add(f'visitor-{i}')
+    
+    assert abs(first.count() - 20000) < 20000 * 0.05
+    merged = HyperLogLog.from_bytes(first.to_bytes(), 12).merge(second)
+    assert abs(merged.count() - 30000) < 30000 * 0.05
+    
+    small = HyperLogLog(12)
+    for i in range(10):
+        small.add(str(i))
+    assert small.count() == 10
+    assert len(small.to_bytes()) < 100
+
+def test_crosstab_groups_across_chunks():
+    """Test that cross-tab counts are combined across chunks."""
+    import pytest
+    pytest.importorskip('numpy')
+    from datetime import datetime
+    from app.utils.crosstab import CrossTab
+    
+    table = CrossTab(['country', 'referrer_host', 'day'])
+    assert table.columns == ['country_name', 'referrer', 'timestamp']
+    table.add_chunk({
+        'country_name': ['France', 'France', None],
+        'referrer': ['https://a.com/x', 'https://a.com/y', None],
+        'timestamp': [datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 18), datetime(2024, 1, 2)]
+    })
+    table.add_chunk({
+        'country_name': ['Japan', 'France'],
+        'referrer': ['https://b.com/', 'http://a.com'],
+        'timestamp': [datetime(2024, 1, 2), datetime(2024, 1, 1)]
+    })
+    
+    assert table.total == 5
+    assert table.results() == [
+        (('France', 'a.com', '2024-01-01'), 3),
+        (('', '', '2024-01-02'), 1),
+        (('Japan', 'b.com', '2024-01-02'), 1)
+    ]
+
+def test_modifier_matcher_matches_by_suffix():
+    """Test that the compiled matcher follows the domain modifier matching rules."""
+    from types import SimpleNamespace
+    from app.utils.modifier_index import ModifierMatcher
+    
+    matcher = ModifierMatcher([
+        SimpleNamespace(id=1, domain='Amazon.com', include_subdomains=True, query_params='{"tag": "a"}'),
+        SimpleNamespace(id=2, domain='smile.amazon.com', include_subdomains=False, query_params='{"tag": "b", "x": "1"}'),
+        SimpleNamespace(id=3, domain='example.com', include_subdomains=False, query_params='{"ref": "c"}')
+    ])
+    
+    assert [m.id for m in matcher.match('smile.amazon.com')] == [1, 2]
+    assert [m.id for m in matcher.match('www.amazon.com')] == [1]
+    assert matcher.match('www.example.com') == []
+    assert matcher.match('notamazon.com') == []
+    assert matcher.apply('https://smile.amazon.com/p?q=1') == 'https://smile.amazon.com/p?q=1&tag=b&x=1'
+    assert matcher.apply('https://example.com/') == 'https://example.com/?ref=c'
+    assert matcher.apply('https://other.org/') == 'https://other.org/'
+
+def test_pool_options_fit_connection_budget():
+    """Test that pool sizes follow worker threads and the connection budget."""
+    from app.utils.db_routing import pool_options
+    
+    assert pool_options('sqlite:///getshort.db', workers=4, threads=8) == {}
+    options = pool_options('mysql+pymysql://u:p@db/getshort', workers=4, threads=8)
+    assert (options['pool_size'], options['max_overflow']) == (9, 8)
+    options = pool_options('mysql+pymysql://u:p@db/getshort', workers=4, threads=8, max_connections=40)
+    assert (options['pool_size'], options['max_overflow']) == (9, 1)
+    assert options['pool_pre_ping'] is True
+
+@pytest.mark.parametrize('backend_url', ['memory://?log_size=4', 'shm://{tmp_path}/links?slots=64&log_size=4'])
+def test_shared_cache_backends(backend_url, tmp_path):
+    """Test that each shared cache backend stores values and refuses ones loaded before an invalidation."""
+    from app.utils.shared_cache import create_backend
+    
+    backend = create_backend(backend_url.format(tmp_path=tmp_path))
+    assert backend.get('abc') is None
+    assert backend.set('abc', 'one', backend.generation())
+    assert backend.get('abc') == 'one'
+    
+    # A value loaded before an invalidation can't be stored after it
+    loaded_at = backend.generation()
+    generation = backend.invalidate(['abc'])
+    assert backend.get('abc') is None
+    assert not backend.set('abc', 'stale', loaded_at)
+    assert backend.set('abc', 'two', generation)
+    assert backend.invalidations_since(loaded_at) == (generation, ['abc'])
+    assert backend.invalidations_since(generation) == (generation, [])
+    
+    # Readers further behind than the log have to start over
+    for i in range(5):
+        backend.invalidate([f'code{i}'])
+    assert backend.invalidations_since(loaded_at)[1] is None
+    
+    assert backend.set('xyz', 'expiring', backend.generation(), ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get('xyz') is None
+
+def test_shared_cache_redis_url_options(monkeypatch):
+    """Test that Redis URLs reach redis-py with their query options untouched."""
+    from types import SimpleNamespace
+    from app.utils import shared_cache
+    
+    urls = []
+    class FakeRedis:
+        @classmethod
+        def from_url(cls, url, **kwargs):
+            urls.append(url)
+            return cls()
+        def register_script(self, script):
+            return None
+    monkeypatch.setattr(shared_cache, '_redis', lambda: SimpleNamespace(Redis=FakeRedis))
+    
+    url = 'redis://cache:6379/0?password=secret&ssl_cert_reqs=none'
+    assert isinstance(shared_cache.create_backend(url), shared_cache.RedisBackend)
+    assert urls == [url]
+    with pytest.raises(ValueError):
+        shared_cache.create_backend('ftp://cache/')
+
+def test_shared_link_cache_broadcasts_invalidations(app, test_url):
+    """Test that workers share loaded links and drop their copies of invalidated ones."""
+    from app import db
+    from app.models import ShortURL
+    from app.utils.link_cache import get_link, link_cache, shared_link_cache, invalidate_link
+    from app.utils.shared_cache import MemoryBackend
+    
+    backend = MemoryBackend()
+    shared_link_cache.configure(backend, sync_interval=0)
+    try:
+        with app.app_context():
+            assert get_link(test_url.short_code).target_url == 'https://example.com'
+            assert backend.get(test_url.short_code) is not None
+            
+            # A worker with an empty local cache is served from the shared tier
+            link_cache.clear()
+            db.session.execute(
+                db.update(ShortURL).filter_by(id=test_url.id).values(target_url='https://example.org')
+            )
+            db.session.commit()
+            assert get_link(test_url.short_code).target_url == 'https://example.com'
+            
+            # An invalidation from another worker drops this worker's copy too
+            generation = backend.invalidate([test_url.short_code])
+            assert get_link(test_url.short_code).target_url == 'https://example.org'
+            
+            invalidate_link(test_url.short_code)
+            assert backend.invalidations_since(generation) == (generation + 1, [test_url.short_code])
+            assert test_url.short_code not in link_cache
+            
+            # Entries that can't be decoded are treated as misses
+            backend.set(test_url.short_code, '{not json', backend.generation())
+            assert shared_link_cache.get(test_url.short_code) is None
+    finally:
+        shared_link_cache.configure(None)